@@ -0,0 +1,105 @@
+"""Compares the IVF index with exact search on synthetic clustered embeddings.
+
+Reports build time, recall@10 against exact search and per query p50/p99
+latency for a few n_probe settings.
+
+    python -m benchmarks.ann --sizes 10000 100000 1000000 --dimensions 256
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from codr.storage.ann import IvfFlatIndex, IvfParams, normalize, top_k
+
+K = 10
+
+
+def make_embeddings(
+    rows: int, dimensions: int, clusters: int, rng: np.random.Generator
+) -> np.ndarray:
+    """Unit vectors around random cluster centres, chunks of code embed like that."""
+    centres = normalize(rng.standard_normal((clusters, dimensions)))
+    embeddings = np.empty((rows, dimensions), dtype=np.float32)
+    for start in range(0, rows, 100_000):
+        end = min(start + 100_000, rows)
+        noise = (
+            rng.standard_normal((end - start, dimensions)) * 0.6 / np.sqrt(dimensions)
+        )
+        embeddings[start:end] = normalize(
+            centres[rng.integers(clusters, size=end - start)] + noise
+        )
+    return embeddings
+
+
+def exact_search(
+    embeddings: np.ndarray, queries: np.ndarray
+) -> tuple[np.ndarray, list[float]]:
+    ids = np.empty((len(queries), K), dtype=np.int64)
+    latencies = []
+    for q, query in enumerate(queries):
+        start = time.perf_counter()
+        ids[q] = top_k((embeddings @ query)[None, :], K)[0]
+        latencies.append(time.perf_counter() - start)
+    return ids, latencies
+
+
+def recall(expected: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(len(set(e) & set(f)) for e, f in zip(expected, found))
+    return hits / expected.size
+
+
+def report(name: str, latencies: list[float], value: float | None = None) -> None:
+    p50, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 99])
+    line = f"  {name:<14} p50 {p50:7.3f}ms  p99 {p99:7.3f}ms"
+    if value is not None:
+        line += f"  recall@{K} {value:.3f}"
+    print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    for rows in args.sizes:
+        embeddings = make_embeddings(
+            rows, args.dimensions, clusters=max(10, rows // 500), rng=rng
+        )
+        queries = normalize(
+            embeddings[rng.integers(rows, size=args.queries)]
+            + rng.standard_normal((args.queries, args.dimensions)).astype(np.float32)
+            * 0.3
+            / np.sqrt(args.dimensions)
+        ).astype(np.float32)
+
+        start = time.perf_counter()
+        index = IvfFlatIndex(IvfParams())
+        index.train(embeddings)
+        trained = time.perf_counter() - start
+        index.add(embeddings)
+        built = time.perf_counter() - start
+        print(
+            f"{rows} vectors x {args.dimensions}: {len(index.centroids)} lists, "
+            f"trained in {trained:.2f}s, built in {built:.2f}s"
+        )
+
+        expected, latencies = exact_search(embeddings, queries)
+        report("exact", latencies)
+        for n_probe in args.n_probe:
+            found = np.empty_like(expected)
+            latencies = []
+            for q, query in enumerate(queries):
+                start = time.perf_counter()
+                found[q] = index.search(query[None, :], K, n_probe=n_probe)[1][0]
+                latencies.append(time.perf_counter() - start)
+            report(f"n_probe={n_probe}", latencies, recall(expected, found))
+
+
+if __name__ == "__main__":
+    main()
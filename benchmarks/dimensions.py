@@ -0,0 +1,120 @@
+"""Shows the memory, latency and recall trade-off of shortened embeddings.
+
+The synthetic embeddings mimic Matryoshka training: the variance of a
+component falls with its position, so leading dimensions carry most of the
+signal. Recall@10 is measured against exact search on the full vectors.
+"Two-stage" searches the truncated vectors and reranks a shortlist of four
+times the results with the full vectors.
+
+    python -m benchmarks.dimensions --rows 20000
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.ann import K, recall
+from benchmarks.quantization import StaticEmbeddings
+from codr.application.entities import Document
+from codr.storage.ann import normalize, top_k
+from codr.storage.numpy_vector_db import NumpyVectorDb
+
+FULL_DIMENSIONS = 3072
+SHA = "benchmark"
+
+
+def make_matryoshka_embeddings(
+    rows: int, clusters: int, rng: np.random.Generator
+) -> np.ndarray:
+    scale = 1 / np.sqrt(np.arange(1, FULL_DIMENSIONS + 1))
+    centres = rng.standard_normal((clusters, FULL_DIMENSIONS))
+    embeddings = np.empty((rows, FULL_DIMENSIONS), dtype=np.float32)
+    for start in range(0, rows, 10_000):
+        end = min(start + 10_000, rows)
+        noise = rng.standard_normal((end - start, FULL_DIMENSIONS)) * 0.6
+        embeddings[start:end] = normalize(
+            (centres[rng.integers(clusters, size=end - start)] + noise) * scale
+        )
+    return embeddings
+
+
+def percentiles(latencies: list[float]) -> str:
+    p50, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 99])
+    return f"p50 {p50:7.2f}ms  p99 {p99:7.2f}ms"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument(
+        "--dimensions", type=int, nargs="+", default=[256, 512, 1024, 3072]
+    )
+    args = parser.parse_args()
+    logging.getLogger("codr.logger").setLevel(logging.WARNING)
+    rng = np.random.default_rng(0)
+
+    embeddings = make_matryoshka_embeddings(
+        args.rows, clusters=max(10, args.rows // 500), rng=rng
+    )
+    queries = embeddings[rng.integers(args.rows, size=args.queries)]
+    queries = normalize(
+        queries + rng.standard_normal(queries.shape).astype(np.float32) * 0.005
+    ).astype(np.float32)
+    expected = top_k(queries @ embeddings.T, K)
+
+    root = tempfile.mkdtemp()
+    embed = StaticEmbeddings(
+        {f"query {q}": query.tolist() for q, query in enumerate(queries)}
+    )
+    documents = [
+        Document(id=str(i), content=str(i), source=f"file_{i}.py", sha=SHA)
+        for i in range(args.rows)
+    ]
+    NumpyVectorDb(root, embedding_function=embed).create(
+        documents, embeddings=embeddings
+    )
+    row_of_id = {}
+
+    print(f"{args.rows} vectors, recall@{K} against {FULL_DIMENSIONS} dimensions")
+    for dimensions in args.dimensions:
+        truncated = normalize(embeddings[:, :dimensions]).astype(np.float32)
+        found = np.empty_like(expected)
+        latencies = []
+        for q, query in enumerate(queries):
+            start = time.perf_counter()
+            query = normalize(query[None, :dimensions])
+            found[q] = top_k(query @ truncated.T, K)[0]
+            latencies.append(time.perf_counter() - start)
+        print(
+            f"  {dimensions:>4} single-stage  {truncated.nbytes / 2**20:7.1f} MiB  "
+            f"{percentiles(latencies)}  recall@{K} {recall(expected, found):.3f}"
+        )
+        if dimensions == FULL_DIMENSIONS:
+            continue
+
+        db = NumpyVectorDb(root, embedding_function=embed, coarse_dimensions=dimensions)
+        if not row_of_id:
+            # Ids are generated on insert, map them back to rows once
+            results = db.get_by_metadata("sha", SHA, sha=SHA)
+            row_of_id = {
+                id: int(document)
+                for id, document in zip(results["ids"], results["documents"])
+            }
+        latencies = []
+        for q in range(args.queries):
+            start = time.perf_counter()
+            ids = db.query(f"query {q}", sha=SHA)["ids"][0]
+            latencies.append(time.perf_counter() - start)
+            found[q] = [row_of_id[id] for id in ids]
+        print(
+            f"  {dimensions:>4} two-stage     {truncated.nbytes / 2**20:7.1f} MiB  "
+            f"{percentiles(latencies)}  recall@{K} {recall(expected, found):.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
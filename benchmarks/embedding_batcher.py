@@ -0,0 +1,58 @@
+"""Measures embedding throughput against the local fake embeddings server.
+
+    python -m benchmarks.embedding_batcher --chunks 5000 --failure-rate 0.05
+"""
+
+import argparse
+import logging
+
+from openai import OpenAI
+
+from benchmarks.fake_embeddings_server import FakeEmbeddingsServer
+from codr.storage.embedding_batcher import EmbeddingBatcher, TokenEstimator
+
+
+def make_chunks(count: int) -> list[str]:
+    return [
+        f"def function_{i}(value):\n    return value * {i}\n" * (1 + i % 20)
+        for i in range(count)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--batch-tokens", type=int, default=20_000)
+    args = parser.parse_args()
+    logging.getLogger("codr.logger").setLevel(logging.ERROR)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    server = FakeEmbeddingsServer(
+        latency=args.latency, failure_rate=args.failure_rate
+    ).start()
+    client = OpenAI(base_url=server.url, api_key="fake", max_retries=0)
+    model = "text-embedding-3-large"
+
+    def embed(texts: list[str]) -> list[list[float]]:
+        response = client.embeddings.create(input=texts, model=model)
+        return [d.embedding for d in response.data]
+
+    chunks = make_chunks(args.chunks)
+    for workers in (1, 4, 8):
+        batcher = EmbeddingBatcher(
+            embed,
+            estimate_tokens=TokenEstimator(model),
+            max_batch_tokens=args.batch_tokens,
+            max_workers=workers,
+            backoff=0.05,
+        )
+        embeddings = batcher(chunks)
+        assert len(embeddings) == len(chunks)
+        print(f"{workers} workers: {batcher.throughput}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""A local stand-in for the OpenAI embeddings endpoint.
+
+Returns deterministic vectors after a fixed latency and fails a share of the
+requests with 429 or 500, so batching, concurrency and retries can be
+exercised without API calls. Point codr at it with
+
+    python -m benchmarks.fake_embeddings_server --port 8765
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake ...
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_embedding(text: str, dimensions: int) -> list[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    return [rng.gauss(0.0, 1.0) for _ in range(dimensions)]
+
+
+class FakeEmbeddingsHandler(BaseHTTPRequestHandler):
+    server: "FakeEmbeddingsServer"
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.inputs += len(inputs)
+
+        failure = self.server.rng.random()
+        if failure < self.server.failure_rate:
+            status = 429 if failure < self.server.failure_rate / 2 else 500
+            self._respond(status, {"error": {"message": "Fake failure"}})
+            return
+
+        time.sleep(self.server.latency)
+        dimensions = body.get("dimensions") or self.server.dimensions
+        data = []
+        for index, text in enumerate(inputs):
+            embedding: list[float] | str = fake_embedding(str(text), dimensions)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(
+                    struct.pack(f"<{dimensions}f", *embedding)
+                ).decode("ascii")
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        tokens = sum(len(str(text)) // 4 + 1 for text in inputs)
+        self._respond(
+            200,
+            {
+                "object": "list",
+                "data": data,
+                "model": body.get("model"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            },
+        )
+
+    def _respond(self, status: int, payload: dict) -> None:
+        content = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        if status == 429:
+            self.send_header("Retry-After", "0.05")
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+class FakeEmbeddingsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        port: int = 0,
+        dimensions: int = 256,
+        latency: float = 0.05,
+        failure_rate: float = 0.0,
+    ) -> None:
+        super().__init__(("127.0.0.1", port), FakeEmbeddingsHandler)
+        self.dimensions = dimensions
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.inputs = 0
+        self.lock = threading.Lock()
+        self.rng = random.Random(0)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self) -> "FakeEmbeddingsServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dimensions", type=int, default=3072)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeEmbeddingsServer(
+        port=args.port,
+        dimensions=args.dimensions,
+        latency=args.latency,
+        failure_rate=args.failure_rate,
+    )
+    print(f"Serving fake embeddings on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Compares the contents API walker with tarball streaming on a synthetic repo.
+
+The GitHub API is simulated with a fixed latency per request, so the numbers
+show how ingestion time scales with the number of round trips.
+
+    python -m benchmarks.ingestion --files 2000 --latency 0.005
+"""
+
+import argparse
+import io
+import tarfile
+import time
+from dataclasses import dataclass
+
+from codr.indexing.chunking import default_chunkers
+from codr.indexing.sources import GitHubApiSource, SourceProvider, TarballSource
+
+
+def make_synthetic_repo(files: int, files_per_dir: int = 20) -> dict[str, str]:
+    repo = {}
+    for i in range(files):
+        path = f"pkg_{i // files_per_dir}/module_{i}.py"
+        body = "\n".join(
+            f"def function_{i}_{j}(value):\n    return value * {j}\n" for j in range(40)
+        )
+        repo[path] = f'"""Module {i}."""\n\n{body}'
+    repo["README.md"] = "Synthetic repository"
+    return repo
+
+
+@dataclass
+class FakeContentFile:
+    type: str
+    path: str
+    name: str
+    content: bytes
+    api: "FakeRepository"
+
+    @property
+    def decoded_content(self) -> bytes:
+        self.api.request()
+        return self.content
+
+
+class FakeRepository:
+    def __init__(self, files: dict[str, str], latency: float) -> None:
+        self.files = files
+        self.latency = latency
+        self.requests = 0
+
+    def request(self) -> None:
+        self.requests += 1
+        time.sleep(self.latency)
+
+    def get_contents(self, path: str, ref: str) -> list[FakeContentFile]:
+        self.request()
+        prefix = f"{path}/" if path else ""
+        entries = {}
+        for file_path, content in self.files.items():
+            if not file_path.startswith(prefix):
+                continue
+            name, _, rest = file_path[len(prefix) :].partition("/")
+            entry_type = "dir" if rest else "file"
+            entries[name] = FakeContentFile(
+                type=entry_type,
+                path=f"{prefix}{name}",
+                name=name,
+                content=content.encode("utf-8"),
+                api=self,
+            )
+        return list(entries.values())
+
+
+def make_tarball(files: dict[str, str], root: str = "owner-repo-sha") -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for path, content in files.items():
+            data = content.encode("utf-8")
+            info = tarfile.TarInfo(name=f"{root}/{path}")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def ingest(source: SourceProvider) -> tuple[float, int]:
+    chunkers = default_chunkers()
+    start = time.perf_counter()
+    chunks = 0
+    for source_file in source.files():
+        chunks += len(chunkers.chunk(source_file.path, source_file.content))
+    return time.perf_counter() - start, chunks
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.005)
+    args = parser.parse_args()
+
+    files = make_synthetic_repo(args.files)
+
+    api = FakeRepository(files, latency=args.latency)
+    api_source = GitHubApiSource(api, sha="sha")  # type: ignore[arg-type]
+    api_seconds, api_chunks = ingest(api_source)
+
+    tarball = make_tarball(files)
+    download_start = time.perf_counter()
+    time.sleep(args.latency)
+    tarball_source = TarballSource(io.BytesIO(tarball))
+    _, tarball_chunks = ingest(tarball_source)
+    tarball_seconds = time.perf_counter() - download_start
+
+    print(
+        f"{'mode':<10}{'requests':>10}{'files':>8}{'bytes':>12}{'chunks':>8}{'seconds':>10}"
+    )
+    for name, requests, source, chunks, seconds in (
+        ("api", api.requests, api_source, api_chunks, api_seconds),
+        ("tarball", 1, tarball_source, tarball_chunks, tarball_seconds),
+    ):
+        print(
+            f"{name:<10}{requests:>10}{source.progress.files:>8}"
+            f"{source.progress.bytes:>12}{chunks:>8}{seconds:>10.3f}"
+        )
+    print(f"speedup: {api_seconds / tarball_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
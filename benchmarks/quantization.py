@@ -0,0 +1,109 @@
+"""Measures resident memory, recall and latency of the quantized vector store modes.
+
+All modes search the same on-disk index, recall@10 is measured against the
+unquantized float32 search.
+
+    python -m benchmarks.quantization --rows 100000 --dimensions 3072
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.ann import K, make_embeddings, recall
+from codr.application.entities import Document
+from codr.storage.ann import normalize
+from codr.storage.numpy_vector_db import NumpyVectorDb
+from codr.storage.quantization import Quantization, Quantizer, get_quantizer
+
+SHA = "benchmark"
+
+
+class StaticEmbeddings:
+    """Embedding function returning precomputed query vectors."""
+
+    model = "synthetic"
+    dimensions = None
+
+    def __init__(self, embeddings: dict[str, list[float]]) -> None:
+        self.embeddings = embeddings
+
+    def __call__(self, input: list[str]) -> list[list[float]]:
+        return [self.embeddings[text] for text in input]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--dimensions", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--rescore-factor", type=int, nargs="+", default=[1, 4, 10])
+    args = parser.parse_args()
+    logging.getLogger("codr.logger").setLevel(logging.WARNING)
+    rng = np.random.default_rng(0)
+
+    embeddings = make_embeddings(
+        args.rows, args.dimensions, clusters=max(10, args.rows // 500), rng=rng
+    )
+    queries = normalize(
+        embeddings[rng.integers(args.rows, size=args.queries)]
+        + rng.standard_normal((args.queries, args.dimensions)).astype(np.float32)
+        * 0.3
+        / np.sqrt(args.dimensions)
+    ).astype(np.float32)
+    embed = StaticEmbeddings(
+        {f"query {q}": query.tolist() for q, query in enumerate(queries)}
+    )
+
+    root = tempfile.mkdtemp()
+    NumpyVectorDb(root, embedding_function=embed).create(
+        [
+            Document(content=str(i), source=f"file_{i}.py", sha=SHA)
+            for i in range(args.rows)
+        ],
+        embeddings=embeddings,
+    )
+
+    def search(db: NumpyVectorDb) -> tuple[np.ndarray, list[float]]:
+        found = np.empty((args.queries, K), dtype=object)
+        latencies = []
+        for q in range(args.queries):
+            start = time.perf_counter()
+            ids = db.query(f"query {q}", sha=SHA)["ids"][0]
+            latencies.append(time.perf_counter() - start)
+            found[q] = ids
+        return found, latencies
+
+    float_bytes = args.rows * args.dimensions * 4
+    expected, latencies = search(NumpyVectorDb(root, embedding_function=embed))
+    p50, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 99])
+    print(f"{args.rows} vectors x {args.dimensions}")
+    print(
+        f"  float32    {float_bytes / 2**20:8.1f} MiB  p50 {p50:7.2f}ms  p99 {p99:7.2f}ms"
+    )
+
+    for quantization in (Quantization.INT8, Quantization.BINARY):
+        quantizer = get_quantizer(quantization)
+        codes = quantizer.encode(embeddings[:1000])  # type: ignore[union-attr]
+        resident = Quantizer.nbytes(codes) * args.rows / 1000
+        for rescore_factor in args.rescore_factor:
+            db = NumpyVectorDb(
+                root,
+                embedding_function=embed,
+                quantization=quantization,
+                rescore_factor=rescore_factor,
+            )
+            found, latencies = search(db)
+            p50, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 99])
+            print(
+                f"  {quantization.value.lower():<6} x{rescore_factor:<3}"
+                f"{resident / 2**20:8.1f} MiB  p50 {p50:7.2f}ms  p99 {p99:7.2f}ms  "
+                f"{float_bytes / resident:4.0f}x smaller  recall@{K} {recall(expected, found):.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
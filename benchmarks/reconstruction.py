@@ -0,0 +1,62 @@
+"""Compares offset based file reconstruction with the overlap matching merge.
+
+Both rebuild the same 20k line file from 1000 character chunks with a 100
+character overlap, shuffled the way a vector store may return them.
+
+    python -m benchmarks.reconstruction --lines 20000
+"""
+
+import argparse
+import logging
+import random
+import time
+from typing import Callable
+
+from codr.indexing.chunking import FixedSizeChunker
+from codr.indexing.reconstruction import merge_documents_with_overlap, reconstruct_file
+
+
+def make_file(lines: int) -> str:
+    body = []
+    for i in range(lines // 4):
+        body.append(f"def function_{i}(value):\n")
+        body.append(f"    result = value * {i} + {i % 7}\n")
+        body.append("    return result\n")
+        body.append("\n")
+    return "".join(body)
+
+
+def measure(name: str, reconstruct: Callable[[], str], expected: str) -> float:
+    start = time.perf_counter()
+    result = reconstruct()
+    seconds = time.perf_counter() - start
+    print(f"{name:<10}{seconds:>10.4f}s  correct={result == expected}")
+    return seconds
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=20000)
+    args = parser.parse_args()
+    logging.getLogger("codr.logger").setLevel(logging.WARNING)
+
+    content = make_file(args.lines)
+    chunks = FixedSizeChunker().chunk("file.py", content)
+    random.Random(0).shuffle(chunks)
+    documents = [chunk.content for chunk in chunks]
+    metadatas = [
+        {"offset": chunk.offset, "start_line": chunk.start_line} for chunk in chunks
+    ]
+    print(f"{len(content.splitlines())} lines, {len(chunks)} chunks")
+
+    merge_seconds = measure(
+        "merge", lambda: merge_documents_with_overlap(documents), content
+    )
+    offset_seconds = measure(
+        "offsets", lambda: reconstruct_file(documents, metadatas), content
+    )
+    print(f"speedup: {merge_seconds / offset_seconds:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
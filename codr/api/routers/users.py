@@ -1,15 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 
 from codr.api.schemas.github import RepoAdd
-from codr.api.schemas.users import CodebaseIndex, User, UserCreate, UserPatch
+from codr.api.schemas.users import CodebaseIndexJob, User, UserCreate, UserPatch
 from codr.application.exceptions import (
-    CodebaseIndexAlreadyExistsError,
     NoGitHubAccessTokenError,
     RepoAlreadyExistsError,
+    RepoNotFoundError,
 )
-from codr.application.interactors.codebase.create_index import (
-    CreateCodebaseIndex,
-    CreateCodebaseIndexRequest,
+from codr.application.interactors.codebase.enqueue_index import (
+    EnqueueCodebaseIndex,
+    EnqueueCodebaseIndexRequest,
+)
+from codr.application.interactors.codebase.get_index_job import (
+    GetCodebaseIndexJob,
+    GetCodebaseIndexJobRequest,
 )
 from codr.application.interactors.github.add_repo import AddRepo, AddRepoRequest
 from codr.application.interactors.users.create_user import CreateUser, CreateUserRequest
@@ -84,24 +88,62 @@ def add_repository(
     return response.name
 
 
-@router.post("/{user_id}/codebases/{repo_id}", response_model=CodebaseIndex)
+@router.post(
+    "/{user_id}/codebases/{repo_id}",
+    response_model=CodebaseIndexJob,
+    status_code=status.HTTP_202_ACCEPTED,
+)
 def create_codebase_index(
     user_id: str,
     repo_id: str,
-    create_codebase_index_interactor: CreateCodebaseIndex = Depends(
-        Dependencies.create_codebase_index
+    ref: str | None = None,
+    enqueue_codebase_index_interactor: EnqueueCodebaseIndex = Depends(
+        Dependencies.enqueue_codebase_index
     ),
 ):
     try:
-        response = create_codebase_index_interactor.execute(
-            CreateCodebaseIndexRequest(user_id=user_id, repo_id=repo_id)
+        response = enqueue_codebase_index_interactor.execute(
+            EnqueueCodebaseIndexRequest(user_id=user_id, repo_id=repo_id, ref=ref)
         )
-    except CodebaseIndexAlreadyExistsError as e:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
-    return CodebaseIndex(repo_id=repo_id)
+    except RepoNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    return response.job
+
 
+@router.get("/{user_id}/codebases/{repo_id}", response_model=CodebaseIndexJob)
+def get_codebase_index(
+    user_id: str,
+    repo_id: str,
+    get_codebase_index_job_interactor: GetCodebaseIndexJob = Depends(
+        Dependencies.get_codebase_index_job
+    ),
+):
+    response = get_codebase_index_job_interactor.execute(
+        GetCodebaseIndexJobRequest(repo_id=repo_id)
+    )
+    if response.job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="No index job found"
+        )
+    return response.job
 
-@router.get("/{user_id}/codebases/{repo_id}", response_model=CodebaseIndex)
-def get_codebase_index():
-    # TODO: Implement this
-    raise NotImplementedError
+
+@router.get(
+    "/{user_id}/codebases/{repo_id}/jobs/{job_id}", response_model=CodebaseIndexJob
+)
+def get_codebase_index_job(
+    user_id: str,
+    repo_id: str,
+    job_id: str,
+    get_codebase_index_job_interactor: GetCodebaseIndexJob = Depends(
+        Dependencies.get_codebase_index_job
+    ),
+):
+    response = get_codebase_index_job_interactor.execute(
+        GetCodebaseIndexJobRequest(repo_id=repo_id, job_id=job_id)
+    )
+    if response.job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Index job not found"
+        )
+    return response.job
@@ -1,10 +1,25 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from codr.api.routers.github import router as github_router
 from codr.api.routers.users import router as users_router
+from codr.dependencies import Dependencies
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    worker = Dependencies.index_worker()
+    compaction_worker = Dependencies.compaction_worker()
+    worker.start()
+    compaction_worker.start()
+    yield
+    compaction_worker.stop(timeout=5)
+    worker.stop(timeout=5)
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -2,7 +2,7 @@ from datetime import datetime
 
 from pydantic import BaseModel
 
-from codr.application.entities import VersionControlType
+from codr.application.entities import IndexJobStatus, VersionControlType
 
 
 class UserBase(BaseModel):
@@ -42,5 +42,17 @@ class UserPatch(UserBase):
     github_access_token: str | None = None
 
 
-class CodebaseIndex(BaseModel):
+class CodebaseIndexJob(BaseModel):
+    id: str
     repo_id: str
+    ref: str | None = None
+    status: IndexJobStatus
+    files: int
+    chunks: int
+    embeddings: int
+    error: str | None = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
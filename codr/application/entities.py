@@ -3,7 +3,7 @@ from datetime import datetime, timedelta
 from enum import Enum, auto
 from uuid import uuid4
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from codr.common.utils import BaseEnum
 from codr.utils import IdType
@@ -31,6 +31,59 @@ class Document(Entity):
     content: str
     source: str
     sha: str
+    # Slug of the repository, None for chunks indexed before it was recorded
+    repo: str | None = None
+    start_line: int | None = None
+    end_line: int | None = None
+    ordinal: int | None = None
+    offset: int | None = None
+
+    @property
+    def metadata(self) -> dict[str, str | int]:
+        metadata: dict[str, str | int] = {"source": self.source, "sha": self.sha}
+        for key in ("repo", "start_line", "end_line", "ordinal", "offset"):
+            value = getattr(self, key)
+            if value is not None:
+                metadata[key] = value
+        return metadata
+
+
+class IndexedCommit(Entity):
+    owner: str
+    name: str
+    sha: str
+    # None when read back, see IndexedCommitRepository.get_manifest
+    manifest: dict[str, str] | None = None
+    created_at: datetime = Field(default_factory=datetime.now)
+
+    @property
+    def identifier(self) -> str:
+        return f"{self.owner}/{self.name}"
+
+
+class IndexJobStatus(BaseEnum):
+    PENDING = auto()
+    RUNNING = auto()
+    SUCCEEDED = auto()
+    FAILED = auto()
+
+
+class IndexJob(Entity):
+    user_id: IdType
+    repo_id: IdType
+    # Branch, tag or sha indexed as an overlay on the default branch
+    ref: str | None = None
+    status: IndexJobStatus = IndexJobStatus.PENDING
+    files: int = 0
+    chunks: int = 0
+    embeddings: int = 0
+    error: str | None = None
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (IndexJobStatus.SUCCEEDED, IndexJobStatus.FAILED)
 
 
 @dataclass
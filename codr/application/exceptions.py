@@ -8,3 +8,19 @@ class NoGitHubAccessTokenError(Exception):
 
 class CodebaseIndexAlreadyExistsError(Exception):
     pass
+
+
+class RepoNotFoundError(Exception):
+    pass
+
+
+class EmbeddingMismatchError(Exception):
+    pass
+
+
+class BaseIndexNotFoundError(Exception):
+    pass
+
+
+class LlmCacheMissError(Exception):
+    pass
@@ -0,0 +1,159 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from codr.application.entities import IndexedCommit, RepoInfo
+from codr.logger import logger
+from codr.storage.blob_store import BlobStore
+from codr.storage.graph_store import CodeGraphStore
+from codr.storage.indexed_commit_repository import IndexedCommitRepository
+from codr.storage.lexical_store import LexicalIndexStore
+from codr.storage.overlay_store import OverlayStore
+from codr.storage.repo_repository import RepoRepository
+from codr.storage.symbol_store import SymbolIndexStore
+from codr.storage.vector_db import VectorDb
+
+
+@dataclass
+class CompactIndexesRequest:
+    # The latest commit of a repo is always kept
+    keep_last: int = 5
+    # Commits indexed within this long are kept as well, whatever their position
+    max_age: timedelta | None = None
+    pinned_shas: set[str] = field(default_factory=set)
+
+
+@dataclass
+class CompactIndexesResponse:
+    expired: list[IndexedCommit]
+    reclaimed_bytes: int
+    # Shas of the expired branch overlays
+    expired_overlays: list[str] = field(default_factory=list)
+
+
+@dataclass
+class CompactIndexesPorts:
+    indexed_commit_repository: IndexedCommitRepository
+    repo_repository: RepoRepository
+    vector_db: VectorDb
+    blob_store: BlobStore
+    lexical_store: LexicalIndexStore
+    symbol_store: SymbolIndexStore
+    graph_store: CodeGraphStore
+    overlay_store: OverlayStore
+
+
+def expired_commits(
+    commits: list[IndexedCommit], request: CompactIndexesRequest, now: datetime
+) -> list[IndexedCommit]:
+    """Picks the commits of one repo that fall outside the retention policy."""
+    ordered = sorted(commits, key=lambda commit: commit.created_at, reverse=True)
+    return [
+        commit
+        for position, commit in enumerate(ordered)
+        if position >= max(request.keep_last, 1)
+        and commit.sha not in request.pinned_shas
+        and (request.max_age is None or commit.created_at < now - request.max_age)
+    ]
+
+
+class CompactIndexes:
+    """Deletes the indexes of the commits a retention policy no longer keeps.
+
+    Forks share shas, so indexes are stored per repo and sha and only the
+    expired repo's indexes of a sha are dropped. Blob manifests are shared
+    by every repo, a sha's manifest is dropped once no repo keeps a commit
+    or an overlay with it. Branch overlays expire with their base commit,
+    or once they are older than the maximum age.
+    """
+
+    def __init__(self, ports: CompactIndexesPorts) -> None:
+        self.__indexed_commit_repository = ports.indexed_commit_repository
+        self.__repo_repository = ports.repo_repository
+        self.__vector_db = ports.vector_db
+        self.__blob_store = ports.blob_store
+        self.__lexical_store = ports.lexical_store
+        self.__symbol_store = ports.symbol_store
+        self.__graph_store = ports.graph_store
+        self.__overlay_store = ports.overlay_store
+
+    def execute(self, request: CompactIndexesRequest) -> CompactIndexesResponse:
+        now = datetime.now()
+        by_repo: dict[str, list[IndexedCommit]] = {}
+        for commit in self.__indexed_commit_repository.list_all():
+            by_repo.setdefault(commit.identifier, []).append(commit)
+
+        expired = [
+            commit
+            for commits in by_repo.values()
+            for commit in expired_commits(commits, request, now)
+        ]
+        expired_ids = {commit.id for commit in expired}
+        kept = [
+            commit
+            for commits in by_repo.values()
+            for commit in commits
+            if commit.id not in expired_ids
+        ]
+        dropped = {(commit.identifier, commit.sha) for commit in expired} - {
+            (commit.identifier, commit.sha) for commit in kept
+        }
+
+        overlays = self.__overlay_store.list_all()
+        expired_overlays = [
+            overlay
+            for overlay in overlays
+            if (overlay.repo, overlay.base_sha) in dropped
+            or (
+                request.max_age is not None
+                and overlay.created_at < now - request.max_age
+            )
+        ]
+        live_shas = {commit.sha for commit in kept} | {
+            overlay.sha for overlay in overlays if overlay not in expired_overlays
+        }
+
+        reclaimed = 0
+        for overlay in expired_overlays:
+            # Dropped first, so no query merges an overlay with a dropped base
+            reclaimed += self.__overlay_store.drop(
+                overlay.sha, overlay.repo
+            ) + self._drop(overlay.sha, overlay.repo)
+        for repo, sha in dropped:
+            reclaimed += self._drop(sha, repo)
+        for sha in {commit.sha for commit in expired} | {
+            overlay.sha for overlay in expired_overlays
+        }:
+            if sha not in live_shas:
+                reclaimed += self.__blob_store.drop_manifest(sha)
+        reclaimed += self.__blob_store.collect_garbage()
+        # Forgotten last, a compaction that fails on the way is retried by the next
+        for commit in expired:
+            self._forget(commit)
+
+        logger.info(
+            f"Compacted {len(expired)} expired commits and {len(expired_overlays)} "
+            f"overlays, reclaimed {reclaimed / 2**20:.1f} MiB"
+        )
+        return CompactIndexesResponse(
+            expired=expired,
+            reclaimed_bytes=reclaimed,
+            expired_overlays=[overlay.sha for overlay in expired_overlays],
+        )
+
+    def _forget(self, commit: IndexedCommit) -> None:
+        self.__indexed_commit_repository.remove(commit.id)
+        repo = self.__repo_repository.get_by_identifier_and_sha(
+            info=RepoInfo(owner=commit.owner, name=commit.name), sha=commit.sha
+        )
+        if repo is not None and repo.embeddings_created:
+            repo.embeddings_created = False
+            self.__repo_repository.update(repo)
+
+    def _drop(self, sha: str, repo: str | None) -> int:
+        logger.info(f"Dropping the indexes of {repo} at {sha}")
+        return (
+            self.__vector_db.drop(sha, repo=repo)
+            + self.__lexical_store.drop(sha, repo=repo)
+            + self.__symbol_store.drop(sha, repo=repo)
+            + self.__graph_store.drop(sha, repo=repo)
+        )
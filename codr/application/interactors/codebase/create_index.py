@@ -4,6 +4,7 @@ from codr.application.entities import Repo
 from codr.application.exceptions import CodebaseIndexAlreadyExistsError
 from codr.codebase_service import AbstractCodebaseService
 from codr.github_client import VersionControlService
+from codr.indexing.progress import IndexProgress
 from codr.storage.repo_repository import RepoRepository
 from codr.storage.user_repository import UserRepository
 from codr.utils import Id
@@ -13,11 +14,14 @@ from codr.utils import Id
 class CreateCodebaseIndexRequest:
     user_id: Id
     repo_id: Id
+    progress: IndexProgress | None = None
+    # A branch, tag or sha other than the default branch
+    ref: str | None = None
 
 
 @dataclass
 class CreateCodebaseIndexResponse:
-    embeddings: list[str]
+    progress: IndexProgress
 
 
 @dataclass
@@ -43,14 +47,24 @@ class CreateCodebaseIndex:
 
         repo = self.__repo_repository.get(request.repo_id)
         sha = self.__version_control_service.set_repository(repo.identifier)
-        if repo.embeddings_created:
+        indexed = repo.embeddings_created and repo.sha == sha
+        if indexed and request.ref is None:
             raise CodebaseIndexAlreadyExistsError(
                 "Embeddings already created, use GET /users/{user_id}/codebases/{repo_id} to get them."
             )
-        if repo.sha != sha:
-            repo.sha = sha
-            self.__repo_repository.update(repo)
 
         codebase = self.__version_control_service.repo
-        embeddings = self.__codebase_service.create_index(codebase)
-        return CreateCodebaseIndexResponse(embeddings=embeddings)
+        progress = request.progress or IndexProgress()
+        if not indexed:
+            if repo.sha != sha:
+                # A new commit is indexed incrementally on top of the last indexed one
+                repo.sha = sha
+                repo.embeddings_created = False
+                self.__repo_repository.update(repo)
+            progress = self.__codebase_service.create_index(codebase, progress=progress)
+        if request.ref is not None:
+            # Other refs are indexed as overlays on the default branch indexed above
+            progress = self.__codebase_service.create_index(
+                codebase, progress=progress, ref=request.ref
+            )
+        return CreateCodebaseIndexResponse(progress=progress)
@@ -0,0 +1,44 @@
+from dataclasses import dataclass
+
+from codr.application.entities import IndexJob
+from codr.application.exceptions import RepoNotFoundError
+from codr.storage.index_job_repository import IndexJobRepository
+from codr.storage.repo_repository import RepoRepository
+from codr.utils import Id
+
+
+@dataclass
+class EnqueueCodebaseIndexRequest:
+    user_id: Id
+    repo_id: Id
+    # A branch, tag or sha other than the default branch
+    ref: str | None = None
+
+
+@dataclass
+class EnqueueCodebaseIndexResponse:
+    job: IndexJob
+
+
+class EnqueueCodebaseIndex:
+    def __init__(
+        self, repo_repository: RepoRepository, index_job_repository: IndexJobRepository
+    ) -> None:
+        self.__repo_repository = repo_repository
+        self.__index_job_repository = index_job_repository
+
+    def execute(
+        self, request: EnqueueCodebaseIndexRequest
+    ) -> EnqueueCodebaseIndexResponse:
+        if self.__repo_repository.get(request.repo_id) is None:
+            raise RepoNotFoundError(f"Repo {request.repo_id} not found")
+
+        # Indexing the same ref twice at once would only duplicate the work
+        latest = self.__index_job_repository.get_latest_for_repo(request.repo_id)
+        if latest is not None and not latest.is_finished and latest.ref == request.ref:
+            return EnqueueCodebaseIndexResponse(job=latest)
+
+        job = self.__index_job_repository.create_and_add(
+            {"user_id": request.user_id, "repo_id": request.repo_id, "ref": request.ref}
+        )
+        return EnqueueCodebaseIndexResponse(job=job)
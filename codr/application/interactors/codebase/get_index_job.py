@@ -0,0 +1,33 @@
+from dataclasses import dataclass
+
+from codr.application.entities import IndexJob
+from codr.storage.index_job_repository import IndexJobRepository
+from codr.utils import Id
+
+
+@dataclass
+class GetCodebaseIndexJobRequest:
+    repo_id: Id
+    # The latest job of the repo is returned if no job id is given
+    job_id: Id | None = None
+
+
+@dataclass
+class GetCodebaseIndexJobResponse:
+    job: IndexJob | None
+
+
+class GetCodebaseIndexJob:
+    def __init__(self, index_job_repository: IndexJobRepository) -> None:
+        self.__index_job_repository = index_job_repository
+
+    def execute(
+        self, request: GetCodebaseIndexJobRequest
+    ) -> GetCodebaseIndexJobResponse:
+        if request.job_id is None:
+            job = self.__index_job_repository.get_latest_for_repo(request.repo_id)
+        else:
+            job = self.__index_job_repository.get(request.job_id)
+            if job is not None and job.repo_id != request.repo_id:
+                job = None
+        return GetCodebaseIndexJobResponse(job=job)
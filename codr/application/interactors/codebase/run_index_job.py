@@ -0,0 +1,108 @@
+import threading
+from dataclasses import dataclass
+from typing import Callable
+
+from codr.application.entities import IndexJob, IndexJobStatus
+from codr.application.exceptions import CodebaseIndexAlreadyExistsError
+from codr.application.interactors.codebase.create_index import (
+    CreateCodebaseIndex,
+    CreateCodebaseIndexRequest,
+)
+from codr.indexing.progress import IndexProgress
+from codr.logger import logger
+from codr.storage.index_job_repository import IndexJobRepository
+from codr.utils import Id
+
+# Progress is written to the job at most this often, in seconds
+PROGRESS_UPDATE_INTERVAL = 1.0
+
+
+@dataclass
+class RunCodebaseIndexJobRequest:
+    job_id: Id
+
+
+@dataclass
+class RunCodebaseIndexJobResponse:
+    job: IndexJob
+
+
+class RunCodebaseIndexJob:
+    def __init__(
+        self,
+        index_job_repository: IndexJobRepository,
+        create_codebase_index: CreateCodebaseIndex,
+        progress_repository: Callable[[], IndexJobRepository],
+    ) -> None:
+        self.__index_job_repository = index_job_repository
+        self.__create_codebase_index = create_codebase_index
+        # Built on the progress thread, which must not share the job thread's session
+        self.__progress_repository = progress_repository
+
+    def execute(
+        self, request: RunCodebaseIndexJobRequest
+    ) -> RunCodebaseIndexJobResponse:
+        job = self.__index_job_repository.get(request.job_id)
+        job.status = IndexJobStatus.RUNNING
+        job.error = None
+        self.__index_job_repository.update(job)
+        logger.info(f"Running index job {job.id} for repo {job.repo_id}")
+
+        progress = IndexProgress()
+        stop = threading.Event()
+        writer = threading.Thread(
+            target=self._write_progress,
+            args=(job.id, progress, stop),
+            name=f"index-job-progress-{job.id}",
+        )
+        writer.start()
+        try:
+            self.__create_codebase_index.execute(
+                CreateCodebaseIndexRequest(
+                    user_id=job.user_id,
+                    repo_id=job.repo_id,
+                    progress=progress,
+                    ref=job.ref,
+                )
+            )
+            job.status = IndexJobStatus.SUCCEEDED
+        except CodebaseIndexAlreadyExistsError:
+            job.status = IndexJobStatus.SUCCEEDED
+        except Exception as e:
+            logger.exception(f"Index job {job.id} failed")
+            job.status = IndexJobStatus.FAILED
+            job.error = str(e)
+        finally:
+            stop.set()
+            writer.join()
+
+        self._record_progress(job, progress)
+        job = self.__index_job_repository.update(job)
+        logger.info(f"Index job {job.id} finished with {job.status.value}: {progress}")
+        return RunCodebaseIndexJobResponse(job=job)
+
+    def _write_progress(
+        self, job_id: Id, progress: IndexProgress, stop: threading.Event
+    ) -> None:
+        """Writes the progress of a running job until `stop` is set.
+
+        The pipeline counts progress on its own threads, so the job is
+        written from this thread every PROGRESS_UPDATE_INTERVAL seconds
+        rather than from the threads making progress.
+        """
+        jobs = self.__progress_repository()
+        written = None
+        while not stop.wait(PROGRESS_UPDATE_INTERVAL):
+            counts = (progress.files, progress.chunks, progress.embeddings)
+            if counts == written:
+                continue
+            job = jobs.get(job_id)
+            self._record_progress(job, progress)
+            jobs.update(job)
+            written = counts
+
+    @staticmethod
+    def _record_progress(job: IndexJob, progress: IndexProgress) -> None:
+        job.files = progress.files
+        job.chunks = progress.chunks
+        job.embeddings = progress.embeddings
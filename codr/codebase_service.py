@@ -1,73 +1,66 @@
 import shutil
 from abc import ABC, abstractmethod
+from typing import Any, Iterator
 
 from github.Repository import Repository
 
-from codr.application.entities import Codebase, Document, Repo
+from codr.application.entities import Codebase, Document, IndexedCommit, Repo
+from codr.application.exceptions import BaseIndexNotFoundError
 from codr.github_client import GitHubClient, RepoInfo
+from codr.indexing.chunking import ChunkerRegistry, default_chunkers
+from codr.indexing.diff import Manifest, TreeDiff, diff_manifests, get_manifest
+from codr.indexing.graph import CodeGraph
+from codr.indexing.lexical import parse_symbol_query
+from codr.indexing.overlay import Overlay
+from codr.indexing.pipeline import Pipeline, Stage, batch_stage
+from codr.indexing.progress import IndexProgress
+from codr.indexing.reconstruction import reconstruct_file
+from codr.indexing.retrieval import HybridRetriever, Span
+from codr.indexing.sources import IngestionMode, SourceFile, get_source_provider
+from codr.indexing.symbols import Reference, Symbol
 from codr.llm.clients import (
+    CodeChange,
     invoke_coding_assistant,
     invoke_query_assistant,
     invoke_verify_agent,
 )
+from codr.llm.context import ContextPacker, PackedFile
+from codr.llm.documents import document_storage
 from codr.logger import logger
 from codr.models import new_uuid
+from codr.storage.blob_store import BlobStore
 from codr.storage.codebase_storage import CodebaseStorage
+from codr.storage.graph_store import CodeGraphStore
+from codr.storage.indexed_commit_repository import IndexedCommitRepository
+from codr.storage.lexical_store import LexicalIndexStore, LexicalIndexWriter
+from codr.storage.overlay_store import OverlayStore
 from codr.storage.repo_repository import RepoRepository
-from codr.storage.vector_db import VectorDb
+from codr.storage.symbol_store import SymbolIndexStore, SymbolIndexWriter
+from codr.storage.vector_db import N_RESULTS, VectorDb
 from codr.utils import Id
 
+# Larger files are usually generated or vendored, they are stored but not embedded
+MAX_INDEXED_FILE_SIZE = 1024 * 1024
+EMBEDDING_BATCH_SIZE = 256
+# Embedding requests run on the embedding batcher's pool, these only feed it
+EMBEDDING_WORKERS = 4
+# Files importing or imported by the retrieved files that are added to them
+RELATED_FILES = 5
 
-def get_unique_file_paths(query_results) -> set[str]:
-    unique_file_paths = set()
-    for result in query_results:
-        for document in result:
-            unique_file_paths.add(document["source"])
-    return unique_file_paths
+EmbeddedBatch = tuple[list[Document], list[list[float]]]
 
 
-def get_first_chunk(chunks, overlap_size=100):
-    # The first chunk is the chunk where no other chunk ends with the overlap
-    for chunk in chunks:
-        overlap = chunk[:overlap_size]
-        for other_chunk in chunks:
-            if chunk == other_chunk:
-                continue
-            if other_chunk.endswith(overlap):
-                break
-        else:
-            return chunk
-    return None
-
-
-def merge_documents_with_overlap(chunks, overlap_size=100):
-    # Find the first chunk
-    logger.info(f"Merging {len(chunks)} chunks")
-    first_chunk = get_first_chunk(chunks, overlap_size=overlap_size)
-    if first_chunk is None:
-        raise ValueError("Unable to find the first chunk")
-
-    # Initialize the merged document with the first chunk
-    merged_document = first_chunk
-    used_chunks = {first_chunk}
-
-    while len(used_chunks) < len(chunks):
-        for chunk in chunks:
-            logger.info(f"Checking chunk")
-            if chunk in used_chunks:
-                continue
-            end_overlap = merged_document[-overlap_size:]
-            if chunk.startswith(end_overlap):
-                # Merge the chunk
-                logger.info(f"Merging chunk")
-                merged_document += chunk[overlap_size:]
-                used_chunks.add(chunk)
-                break
-        else:
-            logger.info(f"Unable to merge chunks. Used chunks: {used_chunks}")
-            break
-
-    return merged_document
+def estimate_size(item: Any) -> int:
+    """Roughly estimates the memory held by an item flowing through the indexing pipeline."""
+    if isinstance(item, (SourceFile, Document)):
+        return len(item.content)
+    if isinstance(item, tuple):
+        documents, embeddings = item
+        # A float in a list takes a pointer and a float object
+        return estimate_size(documents) + sum(32 * len(e) for e in embeddings)
+    if isinstance(item, list):
+        return sum(estimate_size(element) for element in item)
+    return 0
 
 
 def cleanup_dir(tmp_repo_dir):
@@ -77,18 +70,52 @@ def cleanup_dir(tmp_repo_dir):
 
 class AbstractCodebaseService(ABC):
     @abstractmethod
-    def create_index(self, codebase: Repository):
+    def create_index(
+        self,
+        codebase: Repository,
+        progress: IndexProgress | None = None,
+        ref: str | None = None,
+    ) -> IndexProgress:
         raise NotImplementedError
 
 
 class CodebaseService(AbstractCodebaseService):
-    def __init__(self, storage: RepoRepository, vector_db: VectorDb) -> None:
+    def __init__(
+        self,
+        storage: RepoRepository,
+        vector_db: VectorDb,
+        commits: IndexedCommitRepository,
+        blob_store: BlobStore,
+        lexical_store: LexicalIndexStore,
+        symbol_store: SymbolIndexStore,
+        graph_store: CodeGraphStore,
+        overlay_store: OverlayStore,
+        ingestion_mode: IngestionMode = IngestionMode.TARBALL,
+        chunkers: ChunkerRegistry | None = None,
+    ) -> None:
         self.__storage = storage
         self.__vector_db = vector_db
+        self.__commits = commits
+        self.__blob_store = blob_store
+        self.__lexical_store = lexical_store
+        self.__retriever = HybridRetriever(vector_db, lexical_store)
+        self.__symbol_store = symbol_store
+        self.__graph_store = graph_store
+        self.__overlay_store = overlay_store
+        self.__ingestion_mode = ingestion_mode
+        self.__chunkers = chunkers or default_chunkers()
         self.__codebase = None
 
-    def create_index(self, codebase: Repository):
+    def create_index(
+        self,
+        codebase: Repository,
+        progress: IndexProgress | None = None,
+        ref: str | None = None,
+    ) -> IndexProgress:
+        """Indexes the default branch, or `ref` as an overlay on the default branch."""
         self.__codebase = codebase
+        if ref is not None and ref != codebase.default_branch:
+            return self._create_overlay(repo=codebase, ref=ref, progress=progress)
         slug = self.__codebase.full_name
         sha = self.__codebase.get_branch(self.__codebase.default_branch).commit.sha
         repo_info = RepoInfo.from_slug(slug)
@@ -96,10 +123,12 @@ class CodebaseService(AbstractCodebaseService):
         repo = self.__storage.get_by_identifier_and_sha(info=repo_info, sha=sha)
 
         if repo.embeddings_created:
-            return self._get_embeddings(sha=sha)
+            logger.info(f"Embeddings for {slug} at {sha} already exist")
+            return progress or IndexProgress()
 
-        embeddings = self._create_embeddings(repo=self.__codebase, repo_id=repo.id)
-        return embeddings
+        return self._create_embeddings(
+            repo=self.__codebase, repo_id=repo.id, progress=progress
+        )
 
     def create_embeddings(self, slug: str, sha: str):
         # Use GitHub API to get the codebase
@@ -111,55 +140,52 @@ class CodebaseService(AbstractCodebaseService):
         )
 
         if codebase.embeddings_created:
-            return self._get_embeddings(sha=codebase.sha)
+            return self._get_embeddings(sha=codebase.sha, repo=slug)
 
         # Create embeddings
         embeddings = self._create_embeddings(repo=repo, repo_id=codebase.id)
         return embeddings
 
     def _create_embeddings(
-        self, repo: Repository, repo_id: Id, chunk_size=1000, overlap_size=100
-    ) -> list[Document]:
+        self, repo: Repository, repo_id: Id, progress: IndexProgress | None = None
+    ) -> IndexProgress:
+        progress = progress or IndexProgress()
         sha = self.__codebase.get_branch(self.__codebase.default_branch).commit.sha
         logger.info(f"Creating embeddings for {repo.full_name} at {sha}")
-        codebase = repo.get_contents("")
-        documents = []
-
-        while codebase:
-            file_content = codebase.pop(0)
-            if file_content.type == "dir":
-                codebase.extend(repo.get_contents(file_content.path))
-            elif file_content.type == "file" and file_content.name.endswith(".py"):
-                # Split file content in chunks of 1000 chars
-                content = file_content.decoded_content.decode("utf-8")
-                if len(content) < chunk_size:
-                    if len(content) == 0:
-                        continue
-                    documents.append(
-                        Document(
-                            id=new_uuid(),
-                            content=content,
-                            source=file_content.path,
-                            sha=sha,
-                        )
-                    )
-                else:
-                    start = 0
-                    while start < len(content):
-                        end = start + chunk_size
-                        chunk = content[start:end]
-                        documents.append(
-                            Document(
-                                id=new_uuid(),
-                                content=chunk,
-                                source=file_content.path,
-                                sha=sha,
-                            )
-                        )
-                        start += chunk_size - overlap_size
-
-        # Create embeddings
-        embedding_id = new_uuid()
+        if self.__overlay_store.get(sha, repo.full_name) is not None:
+            # The head of a branch became the head of the default branch
+            self._drop_overlay(sha, repo=repo.full_name)
+        else:
+            # A failed earlier attempt may have left part of the index behind
+            self._drop_index(sha, repo=repo.full_name)
+        manifest = get_manifest(repo, sha)
+        with (
+            self.__lexical_store.writer(sha, repo=repo.full_name) as lexical,
+            self.__symbol_store.writer(sha, repo=repo.full_name) as symbols,
+        ):
+            blobs = (
+                self._carry_forward_unchanged(
+                    repo=repo,
+                    sha=sha,
+                    manifest=manifest,
+                    lexical=lexical,
+                    symbols=symbols,
+                )
+                if manifest is not None
+                else None
+            )
+            manifest = self._index_files(
+                repo=repo,
+                sha=sha,
+                manifest=manifest or {},
+                blobs=blobs,
+                lexical=lexical,
+                symbols=symbols,
+                progress=progress,
+            )
+            lexical.commit()
+            symbol_index = symbols.commit()
+        self.__graph_store.put(sha, CodeGraph.build(symbol_index), repo=repo.full_name)
         self.__storage.update(
             # TODO: Fix this and decide on datastructures for handling codebases/repositories
             Repo(
@@ -170,12 +196,224 @@ class CodebaseService(AbstractCodebaseService):
                 embeddings_created=True,
             )
         )
-        self.__vector_db.create(documents=documents)
+        indexed = self.__commits.get_by_identifier_and_sha(
+            owner=repo.owner.login, name=repo.name, sha=sha
+        )
+        if indexed is None:
+            self.__commits.add(
+                IndexedCommit(
+                    id=new_uuid(),
+                    owner=repo.owner.login,
+                    name=repo.name,
+                    sha=sha,
+                    manifest=manifest,
+                )
+            )
         logger.info(f"Created embeddings for {repo.full_name} at {sha}")
-        return documents
+        return progress
+
+    def _create_overlay(
+        self, repo: Repository, ref: str, progress: IndexProgress | None = None
+    ) -> IndexProgress:
+        """Indexes the files `ref` changed since the last indexed default branch commit."""
+        progress = progress or IndexProgress()
+        sha = repo.get_commit(ref).sha
+        indexed = self.__commits.get_by_identifier_and_sha(
+            owner=repo.owner.login, name=repo.name, sha=sha
+        )
+        if (
+            indexed is not None
+            or self.__overlay_store.get(sha, repo.full_name) is not None
+        ):
+            logger.info(
+                f"Embeddings for {ref} of {repo.full_name} at {sha} already exist"
+            )
+            return progress
+        base = self.__commits.get_latest(owner=repo.owner.login, name=repo.name)
+        if base is None:
+            raise BaseIndexNotFoundError(
+                f"Index the default branch of {repo.full_name} before {ref}"
+            )
+
+        manifest = get_manifest(repo, sha)
+        base_manifest = self.__commits.get_manifest(base.id)
+        if manifest is None:
+            # The delta becomes the whole commit and hides every base file
+            diff = TreeDiff(deleted=set(base_manifest))
+        else:
+            diff = diff_manifests(base_manifest, manifest)
+        logger.info(f"Changes between {base.sha} and {ref} at {sha}: {diff}")
+        overlay = Overlay(
+            sha=sha,
+            base_sha=base.sha,
+            ref=ref,
+            tombstones=diff.modified | diff.deleted,
+            repo=repo.full_name,
+        )
+        # A failed earlier attempt may have left part of the delta behind
+        self._drop_index(sha, repo=repo.full_name)
+        with (
+            self.__lexical_store.writer(sha, repo=repo.full_name) as lexical,
+            self.__symbol_store.writer(sha, repo=repo.full_name) as symbols,
+        ):
+            self._index_files(
+                repo=repo,
+                sha=sha,
+                manifest=manifest or {},
+                blobs=(
+                    {path: manifest[path] for path in diff.changed}
+                    if manifest is not None
+                    else None
+                ),
+                lexical=lexical,
+                symbols=symbols,
+                progress=progress,
+            )
+            lexical.commit()
+            symbol_index = symbols.commit()
+        base_symbols = self.__symbol_store.get(base.sha, repo.full_name)
+        self.__graph_store.put(
+            sha,
+            CodeGraph.build(
+                overlay.merge_symbols(base_symbols, symbol_index)
+                if base_symbols is not None
+                else symbol_index
+            ),
+            repo=repo.full_name,
+        )
+        # Written last, queries only see the overlay once its delta is complete
+        self.__overlay_store.put(overlay)
+        logger.info(
+            f"Created overlay embeddings for {ref} of {repo.full_name} at {sha}"
+        )
+        return progress
+
+    def _drop_overlay(self, sha: str, repo: str) -> None:
+        logger.info(f"Dropping the overlay of {repo} at {sha}")
+        self.__overlay_store.drop(sha, repo=repo)
+        self.__blob_store.drop_manifest(sha)
+        self._drop_index(sha, repo=repo)
+
+    def _drop_index(self, sha: str, repo: str) -> None:
+        # Forks share shas, only the indexes of `repo` are its own
+        self.__vector_db.drop(sha, repo=repo)
+        self.__lexical_store.drop(sha, repo=repo)
+        self.__symbol_store.drop(sha, repo=repo)
+        self.__graph_store.drop(sha, repo=repo)
+
+    def _index_files(
+        self,
+        repo: Repository,
+        sha: str,
+        manifest: Manifest,
+        blobs: Manifest | None,
+        lexical: LexicalIndexWriter,
+        symbols: SymbolIndexWriter,
+        progress: IndexProgress,
+    ) -> Manifest:
+        """Chunks and embeds `blobs` of the commit, or all of its files if None.
+
+        Returns `manifest` completed with the blob sha of every file read.
+        """
+        source = get_source_provider(
+            self.__ingestion_mode, repo=repo, sha=sha, blobs=blobs, progress=progress
+        )
+        stored_manifest = dict(manifest)
+
+        def filter_file(source_file: SourceFile) -> Iterator[SourceFile]:
+            stored_manifest[source_file.path] = self.__blob_store.put(
+                source_file.content.encode("utf-8")
+            )
+            if len(source_file.content) > MAX_INDEXED_FILE_SIZE:
+                logger.info(f"Not embedding {source_file.path}, it is too large")
+                return
+            if source_file.content.strip():
+                yield source_file
+
+        def chunk_file(source_file: SourceFile) -> Iterator[Document]:
+            chunks = self.__chunkers.chunk(source_file.path, source_file.content)
+            if source_file.path.endswith(".py"):
+                symbols.add_file(source_file.path, source_file.content)
+            progress.add_chunks(len(chunks))
+            documents = [
+                Document(
+                    id=new_uuid(),
+                    content=chunk.content,
+                    source=source_file.path,
+                    sha=sha,
+                    repo=repo.full_name,
+                    start_line=chunk.start_line,
+                    end_line=chunk.end_line,
+                    ordinal=ordinal,
+                    offset=chunk.offset,
+                )
+                for ordinal, chunk in enumerate(chunks)
+            ]
+            lexical.add_documents(documents)
+            yield from documents
+
+        def embed(documents: list[Document]) -> Iterator[EmbeddedBatch]:
+            yield documents, self.__vector_db.embed([d.content for d in documents])
+
+        def write(batch: EmbeddedBatch) -> tuple:
+            documents, embeddings = batch
+            self.__vector_db.create(documents=documents, embeddings=embeddings)
+            progress.add_embeddings(len(documents))
+            return ()
+
+        Pipeline(
+            source.files(),
+            [
+                Stage("filter", filter_file),
+                Stage("chunk", chunk_file),
+                batch_stage("batch", EMBEDDING_BATCH_SIZE),
+                Stage("embed", embed, workers=EMBEDDING_WORKERS),
+                Stage("write", write),
+            ],
+            sizeof=estimate_size,
+        ).run()
+        logger.info(f"Indexed {progress} from {repo.full_name} at {sha}")
+        self.__blob_store.put_manifest(sha, stored_manifest)
+        return stored_manifest
+
+    def _carry_forward_unchanged(
+        self,
+        repo: Repository,
+        sha: str,
+        manifest: Manifest,
+        lexical: LexicalIndexWriter,
+        symbols: SymbolIndexWriter,
+    ) -> Manifest | None:
+        """Reuses the vectors of the last indexed commit for every unchanged blob.
+
+        Returns the blobs that still need to be embedded, or None if the whole
+        commit has to be indexed.
+        """
+        previous = self.__commits.get_latest(owner=repo.owner.login, name=repo.name)
+        if previous is None or previous.sha == sha:
+            return None
+
+        previous_lexical = self.__lexical_store.get(previous.sha, repo.full_name)
+        previous_symbols = self.__symbol_store.get(previous.sha, repo.full_name)
+        if previous_lexical is None or previous_symbols is None:
+            # Commits indexed before these indexes have nothing to carry over
+            return None
+
+        diff = diff_manifests(self.__commits.get_manifest(previous.id), manifest)
+        logger.info(f"Changes between {previous.sha} and {sha}: {diff}")
+        carried = self.__vector_db.carry_forward(
+            source_sha=previous.sha,
+            target_sha=sha,
+            sources=diff.unchanged,
+            repo=repo.full_name,
+        )
+        lexical.carry_forward(previous_lexical, sources=diff.unchanged)
+        symbols.carry_forward(previous_symbols, sources=diff.unchanged)
+        logger.info(f"Carried forward {carried} chunks from {previous.sha}")
+        return {path: manifest[path] for path in diff.changed}
 
-    def _get_embeddings(self, sha: str) -> list:
-        return self.__vector_db.get(sha=sha)
+    def _get_embeddings(self, sha: str, repo: str | None = None) -> list:
+        return self.__vector_db.get(sha=sha, repo=repo)
 
     def get_embeddings(self) -> list:
         slug = self.__codebase.full_name
@@ -190,37 +428,119 @@ class CodebaseService(AbstractCodebaseService):
             )
             return self.create_embeddings(slug=slug, sha=sha)
         logger.info(f"Embeddings found for {slug} at {sha}. Getting embeddings.")
-        return self.__vector_db.get(sha=sha)
-
-    """
-
-    def get_relevant_files(self, task: str):
+        return self.__vector_db.get(sha=sha, repo=slug)
+
+    def find_symbol(self, name: str, sha: str, repo: str | None = None) -> list[Symbol]:
+        """Finds the definitions of a qualified or plain symbol name."""
+        symbols = self.__symbol_store.get(sha, repo)
+        return symbols.lookup(name) if symbols is not None else []
+
+    def find_callers(
+        self, name: str, sha: str, repo: str | None = None
+    ) -> list[Reference]:
+        symbols = self.__symbol_store.get(sha, repo)
+        return symbols.callers(name) if symbols is not None else []
+
+    def related_files(
+        self,
+        paths: list[str],
+        sha: str,
+        hops: int = 1,
+        calls: bool = False,
+        limit: int | None = None,
+        repo: str | None = None,
+    ) -> list[str]:
+        """Lists the files within `hops` imports of `paths`, see CodeGraph.expand."""
+        graph = self.__graph_store.get(sha, repo)
+        if graph is None:
+            return []
+        return graph.expand(paths, hops=hops, calls=calls, limit=limit)
+
+    def _retrieve(
+        self, task: str, sha: str, repo: str | None = None
+    ) -> dict[str, list[Span]]:
+        """Maps the files relevant to `task` to the spans that matched in them."""
+        symbols = self.__symbol_store.get(sha, repo)
+        document_storage.attach(self.__blob_store, sha=sha, symbols=symbols)
         queries = invoke_query_assistant(task).queries
-        relevant_documents = self.query_multiple(queries)
-        unique_file_paths = get_unique_file_paths(relevant_documents)
 
+        # Queries naming a defined symbol resolve to its file without a search
+        spans: dict[str, list[Span]] = {}
+        searches = []
+        for query in queries:
+            symbol = parse_symbol_query(query)
+            definitions = self.find_symbol(symbol, sha, repo) if symbol else []
+            paths = {definition.path for definition in definitions}
+            # A name defined all over the codebase is better left to the search
+            if paths and len(paths) <= N_RESULTS:
+                for definition in definitions:
+                    # Above any fused search score, a definition is an exact hit
+                    spans.setdefault(definition.path, []).append(
+                        Span(definition.start_line, definition.end_line, 1.0)
+                    )
+            else:
+                searches.append(query)
+        if searches:
+            for file in self.__retriever.search_files(searches, sha=sha, repo=repo):
+                spans.setdefault(file.path, []).extend(file.spans)
+        for path in self.related_files(
+            sorted(spans), sha=sha, limit=RELATED_FILES, repo=repo
+        ):
+            spans.setdefault(path, [])
+        return spans
+
+    def get_relevant_files(
+        self, task: str, sha: str, repo: str | None = None
+    ) -> list[tuple[str, str]]:
         relevant_files = []
-        for file_path in unique_file_paths:
+        for file_path in sorted(self._retrieve(task, sha=sha, repo=repo)):
             logger.info(f"Getting relevant files for {file_path}")
             relevant_files.append(
-                (
+                (file_path, self.get_file(file_path, sha=sha, repo=repo))
+            )
+        return relevant_files
+
+    def get_relevant_context(
+        self,
+        task: str,
+        sha: str,
+        packer: ContextPacker | None = None,
+        repo: str | None = None,
+    ) -> list[PackedFile]:
+        """Like get_relevant_files, with every file packed around its matching spans."""
+        packer = packer or ContextPacker()
+        symbols = self.__symbol_store.get(sha, repo)
+        packed = []
+        for file_path, spans in sorted(self._retrieve(task, sha, repo).items()):
+            file_symbols = symbols.files.get(file_path) if symbols is not None else None
+            packed.append(
+                packer.pack(
                     file_path,
-                    merge_documents_with_overlap(
-                        self.get_by_source(file_path)["documents"]
-                    ),
+                    self.get_file(file_path, sha=sha, repo=repo),
+                    spans=spans,
+                    definitions=file_symbols.definitions if file_symbols else None,
                 )
-            )  # Todo: resolve typing issue
-
-        return relevant_files
-        """
+            )
+        return packed
 
-    """
-    def get_code_changes(self, task: str, relevant_files: list):
+    def get_code_changes(
+        self, task: str, sha: str, repo: str | None = None
+    ) -> list[CodeChange]:
+        relevant_files = self.get_relevant_context(task, sha, repo=repo)
         code_changes = invoke_coding_assistant(task, relevant_files)
         verify_code_changes = invoke_verify_agent(task, code_changes)
         logger.info(f"Code changes: {verify_code_changes.code_changes}")
         return verify_code_changes.code_changes
 
+    def get_file(self, source: str, sha: str, repo: str | None = None) -> str:
+        content = self.__blob_store.read_file(sha, source)
+        if content is not None:
+            return content
+        # Commits indexed before the blob store existed only have their chunks
+        results = self.__vector_db.get_by_metadata("source", source, sha=sha, repo=repo)
+        return reconstruct_file(results["documents"], results["metadatas"])
+
+    """
     def apply_code_changes(self, code_changes: list):
         tmp_dir, tmp_repo_dir = self.__repo_client.download()
         self.__repo_client.initialize_git_repo(tmp_repo_dir)
@@ -1,11 +1,21 @@
+import os
+import threading
+
 from sqlalchemy import create_engine
-from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
 
-from codr.application.entities import Repo, User
+from codr.application.entities import IndexedCommit, IndexJob, Repo, User
+from codr.application.interactors.codebase.compact_indexes import (
+    CompactIndexes,
+    CompactIndexesPorts,
+)
 from codr.application.interactors.codebase.create_index import (
     CreateCodebaseIndex,
     CreateCodebaseIndexPorts,
 )
+from codr.application.interactors.codebase.enqueue_index import EnqueueCodebaseIndex
+from codr.application.interactors.codebase.get_index_job import GetCodebaseIndexJob
+from codr.application.interactors.codebase.run_index_job import RunCodebaseIndexJob
 from codr.application.interactors.github.add_repo import AddRepo
 from codr.application.interactors.github.authenticate_user import AuthenticateUser
 from codr.application.interactors.github.create_access_token import CreateAccessToken
@@ -18,27 +28,127 @@ from codr.application.interactors.users.patch_user import PatchUser
 from codr.application.interactors.users.update_user import UpdateUser
 from codr.codebase_service import AbstractCodebaseService, CodebaseService
 from codr.github_client import GitHubClient, VersionControlService
-from codr.models import Base, RepoModel, UserModel
+from codr.models import Base, IndexedCommitModel, IndexJobModel, RepoModel, UserModel
+from codr.storage.ann import IvfParams
+from codr.storage.blob_store import BlobStore
 from codr.storage.dao.sql_dao import SqlDAO
+from codr.storage.graph_store import CodeGraphStore
+from codr.storage.index_job_repository import IndexJobRepository
+from codr.storage.indexed_commit_repository import IndexedCommitRepository
+from codr.storage.lexical_store import LexicalIndexStore
+from codr.storage.mapper.index_job import MapperIndexJob
+from codr.storage.mapper.indexed_commit import MapperIndexedCommit
 from codr.storage.mapper.repo import MapperRepo
 from codr.storage.mapper.user import MapperUser
+from codr.storage.numpy_vector_db import NumpyVectorDb
+from codr.storage.overlay_store import OverlayStore
+from codr.storage.overlay_vector_db import OverlayVectorDb
+from codr.storage.quantization import Quantization
+from codr.storage.query_cache import CachedVectorDb
 from codr.storage.repo_repository import RepoRepository
 from codr.storage.repository import Factory
+from codr.storage.symbol_store import SymbolIndexStore
 from codr.storage.user_repository import UserRepository
-from codr.storage.vector_db import ChromaDb, VectorDb
+from codr.storage.vector_db import ChromaDb, VectorDb, VectorDbBackend
+from codr.worker import CompactionWorker, IndexWorker, retention_policy
 
 
 class SessionSingleton:
     __session = None
+    __lock = threading.Lock()
 
     @staticmethod
     def get_session() -> Session:
-        if SessionSingleton.__session is None:
-            engine = create_engine("sqlite:///foo.db")
-            Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-            Base.metadata.create_all(bind=engine)
-            SessionSingleton.__session = Session()
-        return SessionSingleton.__session
+        # One session per thread, the index worker runs next to the API
+        with SessionSingleton.__lock:
+            if SessionSingleton.__session is None:
+                engine = create_engine(
+                    "sqlite:///foo.db", connect_args={"check_same_thread": False}
+                )
+                Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+                Base.metadata.create_all(bind=engine)
+                SessionSingleton.__session = scoped_session(Session)
+        return SessionSingleton.__session()
+
+
+class VectorDbSingleton:
+    __vector_db = None
+    __lock = threading.Lock()
+
+    @staticmethod
+    def get_vector_db() -> VectorDb:
+        # Shared so the in-process backend keeps its loaded indexes between requests
+        with VectorDbSingleton.__lock:
+            if VectorDbSingleton.__vector_db is None:
+                backend = VectorDbBackend[os.getenv("CODR_VECTOR_DB", "chroma").upper()]
+                quantization = Quantization[
+                    os.getenv("CODR_QUANTIZATION", "none").upper()
+                ]
+                coarse_dimensions = os.getenv("CODR_COARSE_DIMENSIONS")
+                vector_db: VectorDb
+                if backend == VectorDbBackend.NUMPY:
+                    vector_db = NumpyVectorDb(
+                        quantization=quantization,
+                        coarse_dimensions=(
+                            int(coarse_dimensions) if coarse_dimensions else None
+                        ),
+                    )
+                elif backend == VectorDbBackend.IVF:
+                    if quantization != Quantization.NONE or coarse_dimensions:
+                        raise ValueError(
+                            "CODR_QUANTIZATION and CODR_COARSE_DIMENSIONS only apply "
+                            "to the numpy vector db, the ivf one searches float vectors"
+                        )
+                    vector_db = NumpyVectorDb(ann=IvfParams())
+                else:
+                    vector_db = ChromaDb()
+                # Query results of an indexed sha never change, see CachedVectorDb
+                overlays = IndexStoreSingleton.get_overlay_store()
+                VectorDbSingleton.__vector_db = CachedVectorDb(
+                    OverlayVectorDb(vector_db, overlays=overlays), overlays=overlays
+                )
+        return VectorDbSingleton.__vector_db
+
+
+class IndexStoreSingleton:
+    # One store of each kind, so the indexes they keep loaded outlive a request
+    __overlay_store = None
+    __lexical_store = None
+    __symbol_store = None
+    __graph_store = None
+    __lock = threading.Lock()
+
+    @staticmethod
+    def get_overlay_store() -> OverlayStore:
+        with IndexStoreSingleton.__lock:
+            if IndexStoreSingleton.__overlay_store is None:
+                IndexStoreSingleton.__overlay_store = OverlayStore()
+        return IndexStoreSingleton.__overlay_store
+
+    @staticmethod
+    def get_lexical_store() -> LexicalIndexStore:
+        overlays = IndexStoreSingleton.get_overlay_store()
+        with IndexStoreSingleton.__lock:
+            if IndexStoreSingleton.__lexical_store is None:
+                IndexStoreSingleton.__lexical_store = LexicalIndexStore(
+                    overlays=overlays
+                )
+        return IndexStoreSingleton.__lexical_store
+
+    @staticmethod
+    def get_symbol_store() -> SymbolIndexStore:
+        overlays = IndexStoreSingleton.get_overlay_store()
+        with IndexStoreSingleton.__lock:
+            if IndexStoreSingleton.__symbol_store is None:
+                IndexStoreSingleton.__symbol_store = SymbolIndexStore(overlays=overlays)
+        return IndexStoreSingleton.__symbol_store
+
+    @staticmethod
+    def get_graph_store() -> CodeGraphStore:
+        with IndexStoreSingleton.__lock:
+            if IndexStoreSingleton.__graph_store is None:
+                IndexStoreSingleton.__graph_store = CodeGraphStore()
+        return IndexStoreSingleton.__graph_store
 
 
 class Dependencies:
@@ -50,6 +160,14 @@ class Dependencies:
     def repo_factory() -> Factory:
         return Factory(Repo)
 
+    @staticmethod
+    def index_job_factory() -> Factory:
+        return Factory(IndexJob)
+
+    @staticmethod
+    def indexed_commit_factory() -> Factory:
+        return Factory(IndexedCommit)
+
     @staticmethod
     def user_repository() -> UserRepository:
         return UserRepository(
@@ -128,14 +246,52 @@ class Dependencies:
             factory=Dependencies.repo_factory(),
         )
 
+    @staticmethod
+    def indexed_commit_repository() -> IndexedCommitRepository:
+        return IndexedCommitRepository(
+            dao=SqlDAO(
+                session=SessionSingleton.get_session(),
+                model=IndexedCommitModel,
+                mapper=MapperIndexedCommit(),
+            ),
+            factory=Dependencies.indexed_commit_factory(),
+        )
+
+    @staticmethod
+    def blob_store() -> BlobStore:
+        return BlobStore()
+
+    @staticmethod
+    def overlay_store() -> OverlayStore:
+        return IndexStoreSingleton.get_overlay_store()
+
+    @staticmethod
+    def lexical_index_store() -> LexicalIndexStore:
+        return IndexStoreSingleton.get_lexical_store()
+
+    @staticmethod
+    def symbol_index_store() -> SymbolIndexStore:
+        return IndexStoreSingleton.get_symbol_store()
+
+    @staticmethod
+    def code_graph_store() -> CodeGraphStore:
+        return IndexStoreSingleton.get_graph_store()
+
     @staticmethod
     def vector_db() -> VectorDb:
-        return ChromaDb()
+        return VectorDbSingleton.get_vector_db()
 
     @staticmethod
     def codebase_service() -> AbstractCodebaseService:
         return CodebaseService(
-            storage=Dependencies.repo_repository(), vector_db=Dependencies.vector_db()
+            storage=Dependencies.repo_repository(),
+            vector_db=Dependencies.vector_db(),
+            commits=Dependencies.indexed_commit_repository(),
+            blob_store=Dependencies.blob_store(),
+            lexical_store=Dependencies.lexical_index_store(),
+            symbol_store=Dependencies.symbol_index_store(),
+            graph_store=Dependencies.code_graph_store(),
+            overlay_store=Dependencies.overlay_store(),
         )
 
     @staticmethod
@@ -147,3 +303,62 @@ class Dependencies:
             user_repository=Dependencies.user_repository(),
         )
         return CreateCodebaseIndex(ports=ports)
+
+    @staticmethod
+    def index_job_repository() -> IndexJobRepository:
+        return IndexJobRepository(
+            dao=SqlDAO(
+                session=SessionSingleton.get_session(),
+                model=IndexJobModel,
+                mapper=MapperIndexJob(),
+            ),
+            factory=Dependencies.index_job_factory(),
+        )
+
+    @staticmethod
+    def enqueue_codebase_index() -> EnqueueCodebaseIndex:
+        return EnqueueCodebaseIndex(
+            repo_repository=Dependencies.repo_repository(),
+            index_job_repository=Dependencies.index_job_repository(),
+        )
+
+    @staticmethod
+    def get_codebase_index_job() -> GetCodebaseIndexJob:
+        return GetCodebaseIndexJob(
+            index_job_repository=Dependencies.index_job_repository()
+        )
+
+    @staticmethod
+    def run_codebase_index_job() -> RunCodebaseIndexJob:
+        return RunCodebaseIndexJob(
+            index_job_repository=Dependencies.index_job_repository(),
+            create_codebase_index=Dependencies.create_codebase_index(),
+            progress_repository=Dependencies.index_job_repository,
+        )
+
+    @staticmethod
+    def compact_indexes() -> CompactIndexes:
+        ports = CompactIndexesPorts(
+            indexed_commit_repository=Dependencies.indexed_commit_repository(),
+            repo_repository=Dependencies.repo_repository(),
+            vector_db=Dependencies.vector_db(),
+            blob_store=Dependencies.blob_store(),
+            lexical_store=Dependencies.lexical_index_store(),
+            symbol_store=Dependencies.symbol_index_store(),
+            graph_store=Dependencies.code_graph_store(),
+            overlay_store=Dependencies.overlay_store(),
+        )
+        return CompactIndexes(ports=ports)
+
+    @staticmethod
+    def compaction_worker() -> CompactionWorker:
+        return CompactionWorker(
+            compact_indexes=Dependencies.compact_indexes, policy=retention_policy()
+        )
+
+    @staticmethod
+    def index_worker() -> IndexWorker:
+        return IndexWorker(
+            index_job_repository=Dependencies.index_job_repository,
+            run_index_job=Dependencies.run_codebase_index_job,
+        )
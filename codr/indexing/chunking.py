@@ -0,0 +1,171 @@
+import ast
+import io
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+from codr.logger import logger
+
+
+@dataclass
+class Chunk:
+    content: str
+    # 1-based and inclusive
+    start_line: int
+    end_line: int
+    # Character offset of the chunk in the file
+    offset: int
+
+
+class Chunker(ABC):
+    @abstractmethod
+    def chunk(self, path: str, content: str) -> list[Chunk]:
+        raise NotImplementedError
+
+
+class FixedSizeChunker(Chunker):
+    def __init__(self, chunk_size: int = 1000, overlap_size: int = 100) -> None:
+        self.chunk_size = chunk_size
+        self.overlap_size = overlap_size
+
+    def chunk(self, path: str, content: str) -> list[Chunk]:
+        if len(content) == 0:
+            return []
+
+        chunks = []
+        start = 0
+        while start < len(content):
+            end = min(start + self.chunk_size, len(content))
+            chunks.append(
+                Chunk(
+                    content=content[start:end],
+                    start_line=content.count("\n", 0, start) + 1,
+                    end_line=content.count("\n", 0, max(end - 1, start)) + 1,
+                    offset=start,
+                )
+            )
+            if end == len(content):
+                break
+            start += self.chunk_size - self.overlap_size
+        return chunks
+
+
+def _is_definition(node: ast.stmt) -> bool:
+    return isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+
+
+def _start_line(node: ast.stmt) -> int:
+    if _is_definition(node) and node.decorator_list:  # type: ignore[attr-defined]
+        return min(d.lineno for d in node.decorator_list)  # type: ignore[attr-defined]
+    return node.lineno
+
+
+class PythonAstChunker(Chunker):
+    """Emits one chunk per top-level function, class and method.
+
+    Module and class level statements between definitions are kept together
+    in their own chunk, and comments directly above a definition stay with
+    it. Chunks cover the file without overlap. Definitions longer than
+    `max_chunk_size` characters are split on line boundaries, and files that
+    do not parse fall back to fixed size chunks.
+    """
+
+    def __init__(
+        self, max_chunk_size: int = 2000, fallback: Chunker | None = None
+    ) -> None:
+        self.max_chunk_size = max_chunk_size
+        self.fallback = fallback or FixedSizeChunker()
+
+    def chunk(self, path: str, content: str) -> list[Chunk]:
+        if len(content.strip()) == 0:
+            return []
+        try:
+            tree = ast.parse(content)
+        except SyntaxError:
+            logger.warning(f"Unable to parse {path}, using fixed size chunks")
+            return self.fallback.chunk(path, content)
+
+        # Lines as ast numbers them, str.splitlines also breaks on e.g. form feeds
+        lines = io.StringIO(content).readlines()
+        offsets = [0]
+        for line in lines:
+            offsets.append(offsets[-1] + len(line))
+        boundaries = {1} | self._boundaries(tree.body, lines)
+        starts = sorted(boundary for boundary in boundaries if boundary <= len(lines))
+
+        chunks = []
+        for start, end in zip(starts, starts[1:] + [len(lines) + 1]):
+            chunks.extend(self._split(lines, offsets, start, end - 1))
+        return chunks
+
+    def _boundaries(self, body: list[ast.stmt], lines: list[str]) -> set[int]:
+        boundaries = set()
+        previous_was_definition = False
+        for node in body:
+            if _is_definition(node):
+                boundaries.add(self._attach_comments(_start_line(node), lines))
+                if isinstance(node, ast.ClassDef):
+                    # A bare class statement stays with its first method
+                    boundaries |= self._boundaries(node.body, lines) - {
+                        _start_line(node.body[0])
+                    }
+                previous_was_definition = True
+            elif previous_was_definition:
+                boundaries.add(node.lineno)
+                previous_was_definition = False
+        return boundaries
+
+    @staticmethod
+    def _attach_comments(line: int, lines: list[str]) -> int:
+        while line > 1 and lines[line - 2].lstrip().startswith("#"):
+            line -= 1
+        return line
+
+    def _split(
+        self, lines: list[str], offsets: list[int], start: int, end: int
+    ) -> list[Chunk]:
+        chunks = []
+        chunk_start = start
+        size = 0
+        for line_number in range(start, end + 1):
+            line_size = len(lines[line_number - 1])
+            if size > 0 and size + line_size > self.max_chunk_size:
+                chunks.append(self._chunk(lines, offsets, chunk_start, line_number - 1))
+                chunk_start = line_number
+                size = 0
+            size += line_size
+        if size > 0:
+            chunks.append(self._chunk(lines, offsets, chunk_start, end))
+        return [chunk for chunk in chunks if chunk.content.strip()]
+
+    @staticmethod
+    def _chunk(lines: list[str], offsets: list[int], start: int, end: int) -> Chunk:
+        return Chunk(
+            content="".join(lines[start - 1 : end]),
+            start_line=start,
+            end_line=end,
+            offset=offsets[start - 1],
+        )
+
+
+class ChunkerRegistry:
+    def __init__(self, default: Chunker | None = None) -> None:
+        self.__default = default or FixedSizeChunker()
+        self.__chunkers: dict[str, Chunker] = {}
+
+    def register(self, suffix: str, chunker: Chunker) -> None:
+        self.__chunkers[suffix] = chunker
+
+    def for_path(self, path: str) -> Chunker:
+        for suffix, chunker in self.__chunkers.items():
+            if path.endswith(suffix):
+                return chunker
+        return self.__default
+
+    def chunk(self, path: str, content: str) -> list[Chunk]:
+        return self.for_path(path).chunk(path, content)
+
+
+def default_chunkers() -> ChunkerRegistry:
+    registry = ChunkerRegistry()
+    registry.register(".py", PythonAstChunker())
+    return registry
@@ -0,0 +1,58 @@
+from dataclasses import dataclass, field
+
+from github.Repository import Repository
+
+from codr.logger import logger
+
+Manifest = dict[str, str]
+
+
+@dataclass
+class TreeDiff:
+    added: set[str] = field(default_factory=set)
+    modified: set[str] = field(default_factory=set)
+    deleted: set[str] = field(default_factory=set)
+    unchanged: set[str] = field(default_factory=set)
+
+    @property
+    def changed(self) -> set[str]:
+        return self.added | self.modified
+
+    def __str__(self) -> str:
+        return (
+            f"{len(self.added)} added, {len(self.modified)} modified, "
+            f"{len(self.deleted)} deleted, {len(self.unchanged)} unchanged"
+        )
+
+
+def get_manifest(
+    repo: Repository, sha: str, suffixes: tuple[str, ...] = (".py",)
+) -> Manifest | None:
+    """Maps every matching path of the commit to its git blob sha.
+
+    Returns None if GitHub truncated the tree, the missing paths would
+    otherwise count as deleted.
+    """
+    tree = repo.get_git_tree(sha, recursive=True)
+    if tree.raw_data.get("truncated"):
+        logger.warning(
+            f"Git tree of {repo.full_name} at {sha} is truncated, indexing every file"
+        )
+        return None
+    return {
+        element.path: element.sha
+        for element in tree.tree
+        if element.type == "blob" and element.path.endswith(suffixes)
+    }
+
+
+def diff_manifests(old: Manifest, new: Manifest) -> TreeDiff:
+    diff = TreeDiff(deleted=old.keys() - new.keys())
+    for path, blob_sha in new.items():
+        if path not in old:
+            diff.added.add(path)
+        elif old[path] != blob_sha:
+            diff.modified.add(path)
+        else:
+            diff.unchanged.add(path)
+    return diff
@@ -0,0 +1,141 @@
+from typing import Iterable
+
+import numpy as np
+
+from codr.indexing.symbols import SymbolIndex, SymbolKind, module_name
+
+# Calls to a name defined in more files than this are too ambiguous to link
+MAX_CALL_TARGETS = 3
+
+
+class Adjacency:
+    """Directed graph over file numbers in compressed sparse row form.
+
+    The targets of file `i` are `indices[indptr[i]:indptr[i + 1]]`.
+    """
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray) -> None:
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def from_edges(cls, n_nodes: int, edges: Iterable[tuple[int, int]]) -> "Adjacency":
+        pairs = np.asarray(sorted(set(edges)), dtype=np.int32).reshape(-1, 2)
+        indptr = np.zeros(n_nodes + 1, dtype=np.int32)
+        np.add.at(indptr, pairs[:, 0] + 1, 1)
+        return cls(np.cumsum(indptr, dtype=np.int32), pairs[:, 1].copy())
+
+    def transpose(self) -> "Adjacency":
+        n_nodes = len(self.indptr) - 1
+        sources = np.repeat(
+            np.arange(n_nodes, dtype=np.int32), np.diff(self.indptr).astype(np.int64)
+        )
+        return Adjacency.from_edges(n_nodes, zip(self.indices, sources))
+
+    def neighbours(self, nodes: np.ndarray) -> np.ndarray:
+        if len(nodes) == 0:
+            return np.empty(0, dtype=np.int32)
+        return np.concatenate(
+            [self.indices[self.indptr[n] : self.indptr[n + 1]] for n in nodes]
+        )
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.indices)
+
+
+class CodeGraph:
+    """File level import graph and approximate call graph of one sha.
+
+    An import edge links a file to the file of every module it imports. A
+    call edge links a file to the file defining a function or class it
+    calls, matched by name like the symbol index, and only if the name is
+    defined in at most MAX_CALL_TARGETS files.
+    """
+
+    def __init__(self, paths: list[str], imports: Adjacency, calls: Adjacency) -> None:
+        self.paths = paths
+        self.imports = imports
+        self.calls = calls
+        self.__importers = imports.transpose()
+        self.__callers = calls.transpose()
+        self.__numbers = {path: number for number, path in enumerate(paths)}
+
+    @classmethod
+    def build(cls, symbols: SymbolIndex) -> "CodeGraph":
+        paths = sorted(symbols.files)
+        numbers = {path: number for number, path in enumerate(paths)}
+        modules = {module_name(path): numbers[path] for path in paths}
+        # Repositories with a src/ layout import "package.module" for "src/package/module.py"
+        suffixes: dict[str, int | None] = {}
+        for module, number in modules.items():
+            parts = module.split(".")
+            for start in range(1, len(parts)):
+                suffix = ".".join(parts[start:])
+                suffixes[suffix] = None if suffix in suffixes else number
+
+        def resolve(module: str) -> int | None:
+            if module in modules:
+                return modules[module]
+            return suffixes.get(module)
+
+        definers: dict[str, set[int]] = {}
+        for path in paths:
+            for symbol in symbols.files[path].definitions:
+                if symbol.kind in (SymbolKind.CLASS, SymbolKind.FUNCTION):
+                    definers.setdefault(symbol.name, set()).add(numbers[path])
+
+        import_edges = []
+        call_edges = []
+        for path in paths:
+            source = numbers[path]
+            for module in symbols.files[path].imports:
+                target = resolve(module)
+                if target is not None and target != source:
+                    import_edges.append((source, target))
+            for reference in symbols.files[path].references:
+                targets = definers.get(reference.name, ())
+                if reference.is_call and len(targets) <= MAX_CALL_TARGETS:
+                    call_edges.extend((source, t) for t in targets if t != source)
+        return cls(
+            paths,
+            Adjacency.from_edges(len(paths), import_edges),
+            Adjacency.from_edges(len(paths), call_edges),
+        )
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def expand(
+        self,
+        paths: Iterable[str],
+        hops: int = 1,
+        calls: bool = False,
+        limit: int | None = None,
+    ) -> list[str]:
+        """Returns the files within `hops` import edges of `paths`, in either direction.
+
+        Closer files come first, files of the same hop are ranked by the
+        number of edges linking them to the previous hop. `calls` follows
+        call edges as well.
+        """
+        graphs = [self.imports, self.__importers]
+        if calls:
+            graphs += [self.calls, self.__callers]
+        frontier = np.asarray(
+            [self.__numbers[path] for path in paths if path in self.__numbers],
+            dtype=np.int32,
+        )
+        visited = np.zeros(len(self.paths), dtype=bool)
+        visited[frontier] = True
+        expanded: list[str] = []
+        for _ in range(hops):
+            neighbours = np.concatenate([g.neighbours(frontier) for g in graphs])
+            neighbours = neighbours[~visited[neighbours]]
+            if len(neighbours) == 0:
+                break
+            nodes, counts = np.unique(neighbours, return_counts=True)
+            frontier = nodes[np.argsort(-counts, kind="stable")]
+            visited[frontier] = True
+            expanded.extend(self.paths[n] for n in frontier)
+        return expanded[:limit]
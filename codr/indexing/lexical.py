@@ -0,0 +1,176 @@
+import keyword
+import math
+import re
+from collections import Counter
+from typing import Any, Iterable
+
+import numpy as np
+
+from codr.application.entities import Document
+
+Metadata = dict[str, Any]
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+CAMEL_CASE_PART = re.compile(r"[A-Z]+(?=[A-Z][a-z]|\d|\b)|[A-Z]?[a-z]+|[A-Z]+|\d+")
+DEFINITION = re.compile(r"\b(?:def|class)\s+([A-Za-z_][A-Za-z0-9_]*)")
+# e.g. "def homework_router()", "class Homework:" or a bare "homework_router"
+SYMBOL_QUERY = re.compile(
+    r"^\s*(?:async\s+def|def|class)?\s*([A-Za-z_][A-Za-z0-9_]*)\s*(?:\(\s*\))?\s*:?\s*$"
+)
+STOP_WORDS = set(keyword.kwlist) | {"self", "cls", "none", "true", "false"}
+# Prefix of the term emitted for every definition name
+DEFINITION_PREFIX = "@"
+
+
+def split_identifier(identifier: str) -> list[str]:
+    """Splits snake_case and camelCase identifiers into their lowercase words."""
+    parts = []
+    for word in identifier.split("_"):
+        parts.extend(part.lower() for part in CAMEL_CASE_PART.findall(word))
+    return parts
+
+
+def tokenize(text: str) -> list[str]:
+    """Emits every identifier in lowercase followed by its words, without keywords."""
+    tokens = []
+    for identifier in IDENTIFIER.findall(text):
+        lowered = identifier.lower()
+        if lowered in STOP_WORDS:
+            continue
+        tokens.append(lowered)
+        parts = split_identifier(identifier)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part not in STOP_WORDS)
+    return tokens
+
+
+def tokenize_document(content: str) -> list[str]:
+    definitions = [
+        DEFINITION_PREFIX + name.lower() for name in DEFINITION.findall(content)
+    ]
+    return tokenize(content) + definitions
+
+
+def count_terms(content: str) -> dict[str, int]:
+    return dict(Counter(tokenize_document(content)))
+
+
+def parse_symbol_query(query: str) -> str | None:
+    """Returns the symbol of a query that only names an identifier, else None."""
+    match = SYMBOL_QUERY.match(query)
+    if match is None or match.group(1).lower() in STOP_WORDS:
+        return None
+    return match.group(1)
+
+
+def reciprocal_rank_fusion(
+    rankings: Iterable[list[Metadata]], k: int = 60, n_results: int | None = None
+) -> list[tuple[float, Metadata]]:
+    """Fuses rankings of chunks by summing 1 / (k + rank) over the rankings."""
+    scores: dict[tuple, float] = {}
+    chunks: dict[tuple, Metadata] = {}
+    for ranking in rankings:
+        for rank, metadata in enumerate(ranking):
+            key = (
+                metadata.get("sha"),
+                metadata["source"],
+                metadata.get("offset", metadata.get("start_line")),
+            )
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            chunks.setdefault(key, metadata)
+    ranked = sorted(scores, key=lambda key: -scores[key])
+    return [(scores[key], chunks[key]) for key in ranked[:n_results]]
+
+
+class BM25Index:
+    """Okapi BM25 over the chunks of one sha.
+
+    Chunks keep their term counts so the chunks of unchanged files can be
+    carried over to the next sha. The inverted index is built on the first
+    search after a change.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.metadatas: list[Metadata] = []
+        self.terms: list[dict[str, int]] = []
+        self.__postings: dict[str, tuple[np.ndarray, np.ndarray]] | None = None
+        self.__lengths: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return len(self.metadatas)
+
+    def add(self, metadatas: list[Metadata], terms: list[dict[str, int]]) -> None:
+        self.metadatas.extend(metadatas)
+        self.terms.extend(terms)
+        self.__postings = None
+
+    def add_documents(self, documents: list[Document]) -> None:
+        self.add(
+            [document.metadata for document in documents],
+            [count_terms(document.content) for document in documents],
+        )
+
+    def carry_forward(self, previous: "BM25Index", sha: str, sources: set[str]) -> int:
+        rows = [
+            i
+            for i, metadata in enumerate(previous.metadatas)
+            if metadata["source"] in sources
+        ]
+        self.add(
+            [{**previous.metadatas[i], "sha": sha} for i in rows],
+            [previous.terms[i] for i in rows],
+        )
+        return len(rows)
+
+    def _build(self) -> None:
+        postings: dict[str, tuple[list[int], list[int]]] = {}
+        for row, terms in enumerate(self.terms):
+            for term, count in terms.items():
+                rows, counts = postings.setdefault(term, ([], []))
+                rows.append(row)
+                counts.append(count)
+        self.__postings = {
+            term: (np.asarray(rows, dtype=np.int64), np.asarray(counts, np.float32))
+            for term, (rows, counts) in postings.items()
+        }
+        self.__lengths = np.asarray(
+            [sum(terms.values()) for terms in self.terms], dtype=np.float32
+        )
+
+    def has_term(self, term: str) -> bool:
+        if self.__postings is None:
+            self._build()
+        return term in self.__postings  # type: ignore[operator]
+
+    def search(
+        self, terms: list[str], n_results: int = 10
+    ) -> list[tuple[float, Metadata]]:
+        if not self.metadatas:
+            return []
+        if self.__postings is None:
+            self._build()
+        lengths = self.__lengths
+        average_length = max(float(lengths.mean()), 1.0)  # type: ignore[union-attr]
+        scores = np.zeros(len(self.metadatas), dtype=np.float32)
+        for term, query_count in Counter(terms).items():
+            if term not in self.__postings:  # type: ignore[operator]
+                continue
+            rows, counts = self.__postings[term]  # type: ignore[index]
+            idf = math.log(1 + (len(self) - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths[rows] / average_length)  # type: ignore[index]
+            scores[rows] += query_count * idf * counts * (self.k1 + 1) / (counts + norm)
+        matched = np.flatnonzero(scores)
+        best = matched[np.argsort(-scores[matched], kind="stable")[:n_results]]
+        return [(float(scores[row]), self.metadatas[row]) for row in best]
+
+    def search_text(
+        self, query: str, n_results: int = 10
+    ) -> list[tuple[float, Metadata]]:
+        terms = tokenize(query)
+        symbol = parse_symbol_query(query)
+        if symbol is not None:
+            # The definition of a symbol ranks above its usages
+            terms += [DEFINITION_PREFIX + symbol.lower()] * 2
+        return self.search(terms, n_results=n_results)
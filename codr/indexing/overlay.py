@@ -0,0 +1,87 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any
+
+from codr.indexing.lexical import BM25Index, Metadata
+from codr.indexing.symbols import SymbolIndex
+
+# Base hits are fetched this many times over, as the hidden ones are dropped
+OVERFETCH = 2
+
+
+@dataclass
+class Overlay:
+    """Index of a branch head stored as a delta on top of an indexed base sha.
+
+    The chunks of the files added or modified since the base are indexed
+    under the overlay's own sha. Base chunks of modified and deleted files
+    are hidden by tombstones, every other base chunk shows through.
+    """
+
+    sha: str
+    base_sha: str
+    ref: str
+    tombstones: set[str] = field(default_factory=set)
+    created_at: datetime = field(default_factory=datetime.now)
+    # Forks share shas, an overlay belongs to the repo it was indexed for
+    repo: str | None = None
+
+    def hides(self, metadata: Metadata) -> bool:
+        return metadata["source"] in self.tombstones
+
+    def rebase(self, metadata: Metadata) -> Metadata:
+        """Presents a visible base chunk as a chunk of the overlay."""
+        return {**metadata, "sha": self.sha}
+
+    def merge_rankings(
+        self,
+        base: list[list[tuple[float, Metadata]]],
+        delta: list[list[tuple[float, Metadata]]],
+        n_results: int,
+    ) -> list[list[tuple[float, Metadata]]]:
+        """Merges the (score, metadata) hits of every query against base and delta."""
+        merged = []
+        for base_hits, delta_hits in zip(base, delta):
+            hits = delta_hits + [
+                (score, self.rebase(metadata))
+                for score, metadata in base_hits
+                if not self.hides(metadata)
+            ]
+            hits.sort(key=lambda hit: -hit[0])
+            merged.append(hits[:n_results])
+        return merged
+
+    def merge_lexical(self, base: BM25Index, delta: BM25Index) -> BM25Index:
+        """Builds one BM25 index so base and delta chunks share term statistics."""
+        merged = BM25Index(k1=base.k1, b=base.b)
+        visible = {metadata["source"] for metadata in base.metadatas} - self.tombstones
+        merged.carry_forward(base, sha=self.sha, sources=visible)
+        merged.add(delta.metadatas, delta.terms)
+        return merged
+
+    def merge_symbols(self, base: SymbolIndex, delta: SymbolIndex) -> SymbolIndex:
+        merged = SymbolIndex()
+        merged.carry_forward(base, sources=set(base.files) - self.tombstones)
+        merged.carry_forward(delta, sources=set(delta.files))
+        return merged
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "sha": self.sha,
+            "base_sha": self.base_sha,
+            "ref": self.ref,
+            "tombstones": sorted(self.tombstones),
+            "created_at": self.created_at.isoformat(),
+            "repo": self.repo,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "Overlay":
+        return cls(
+            sha=data["sha"],
+            base_sha=data["base_sha"],
+            ref=data["ref"],
+            tombstones=set(data["tombstones"]),
+            created_at=datetime.fromisoformat(data["created_at"]),
+            repo=data.get("repo"),
+        )
@@ -0,0 +1,249 @@
+import queue
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Iterator
+
+from codr.logger import logger
+
+_DONE = object()
+
+
+@dataclass
+class StageReport:
+    name: str
+    items_in: int = 0
+    items_out: int = 0
+    busy_seconds: float = 0.0
+    # Peak number and estimated size of the items waiting in the output queue
+    peak_queued: int = 0
+    peak_queued_bytes: int = 0
+
+    @property
+    def throughput(self) -> float:
+        return self.items_in / self.busy_seconds if self.busy_seconds else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: {self.items_in} in, {self.items_out} out, "
+            f"busy {self.busy_seconds:.2f}s ({self.throughput:.1f} items/s), "
+            f"peak queue {self.peak_queued} items ({self.peak_queued_bytes} bytes)"
+        )
+
+
+@dataclass
+class PipelineReport:
+    stages: list[StageReport] = field(default_factory=list)
+    seconds: float = 0.0
+    # Only measured when the pipeline runs with trace_memory
+    peak_memory_bytes: int | None = None
+
+    def __str__(self) -> str:
+        lines = [f"Pipeline finished in {self.seconds:.2f}s"]
+        if self.peak_memory_bytes is not None:
+            lines[0] += f", peak memory {self.peak_memory_bytes} bytes"
+        lines.extend(f"  {stage}" for stage in self.stages)
+        return "\n".join(lines)
+
+
+@dataclass
+class Stage:
+    """A pipeline step that turns every input item into zero or more output items."""
+
+    name: str
+    process: Callable[[Any], Iterable[Any]]
+    # Called once the input is exhausted, e.g. to flush a partial batch
+    finish: Callable[[], Iterable[Any]] | None = None
+    # Threads pulling from the input queue, only for stateless stages
+    workers: int = 1
+
+
+def batch_stage(name: str, size: int) -> Stage:
+    batch: list[Any] = []
+
+    def process(item: Any) -> Iterator[list[Any]]:
+        nonlocal batch
+        batch.append(item)
+        if len(batch) >= size:
+            full, batch = batch, []
+            yield full
+
+    def finish() -> Iterator[list[Any]]:
+        if batch:
+            yield batch
+
+    return Stage(name=name, process=process, finish=finish)
+
+
+class _BoundedQueue:
+    def __init__(
+        self, maxsize: int, report: StageReport, sizeof: Callable[[Any], int]
+    ) -> None:
+        self.__queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self.__report = report
+        self.__sizeof = sizeof
+        self.__bytes = 0
+        self.__lock = threading.Lock()
+
+    def put(self, item: Any, stop: threading.Event) -> bool:
+        size = 0 if item is _DONE else self.__sizeof(item)
+        while not stop.is_set():
+            try:
+                self.__queue.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            with self.__lock:
+                self.__bytes += size
+                self.__report.peak_queued = max(
+                    self.__report.peak_queued, self.__queue.qsize()
+                )
+                self.__report.peak_queued_bytes = max(
+                    self.__report.peak_queued_bytes, self.__bytes
+                )
+            return True
+        return False
+
+    def get(self, stop: threading.Event) -> Any:
+        while not stop.is_set():
+            try:
+                item = self.__queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is not _DONE:
+                with self.__lock:
+                    self.__bytes -= self.__sizeof(item)
+            return item
+        return _DONE
+
+
+class Pipeline:
+    """Runs a source and its stages on separate threads connected by bounded queues.
+
+    Every queue holds at most `queue_size` items, so memory use depends on
+    the queue and batch sizes but not on how many items flow through. The
+    first exception raised by any stage stops the pipeline and is re-raised
+    by `run`. A generator source is closed when the pipeline stops.
+    """
+
+    def __init__(
+        self,
+        source: Iterable[Any],
+        stages: list[Stage],
+        queue_size: int = 32,
+        sizeof: Callable[[Any], int] = lambda item: 0,
+    ) -> None:
+        self.__source = source
+        self.__stages = stages
+        self.__queue_size = queue_size
+        self.__sizeof = sizeof
+
+    def run(self, trace_memory: bool = False) -> PipelineReport:
+        report = PipelineReport(
+            stages=[StageReport(name="source")]
+            + [StageReport(name=stage.name) for stage in self.__stages]
+        )
+        queues = [
+            _BoundedQueue(self.__queue_size, stage_report, self.__sizeof)
+            for stage_report in report.stages[:-1]
+        ]
+        stop = threading.Event()
+        errors: list[BaseException] = []
+
+        def fail(error: BaseException) -> None:
+            errors.append(error)
+            stop.set()
+
+        def produce() -> None:
+            stage_report = report.stages[0]
+            iterator: Iterator[Any] | None = None
+            try:
+                iterator = iter(self.__source)
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    item = next(iterator, _DONE)
+                    stage_report.busy_seconds += time.perf_counter() - start
+                    if item is _DONE:
+                        break
+                    stage_report.items_in += 1
+                    stage_report.items_out += 1
+                    queues[0].put(item, stop)
+            except BaseException as e:
+                fail(e)
+            finally:
+                # Closing runs the cleanup of a source that was stopped early
+                try:
+                    close = getattr(iterator, "close", None)
+                    if close is not None:
+                        close()
+                except BaseException as e:
+                    fail(e)
+                queues[0].put(_DONE, stop)
+
+        lock = threading.Lock()
+        running = [stage.workers for stage in self.__stages]
+
+        def consume(index: int, stage: Stage) -> None:
+            stage_report = report.stages[index + 1]
+            output = queues[index + 1] if index + 1 < len(queues) else None
+            last = False
+            try:
+                while not stop.is_set():
+                    item = queues[index].get(stop)
+                    if item is _DONE:
+                        with lock:
+                            running[index] -= 1
+                            last = running[index] == 0
+                        if not last:
+                            # Let the other workers of this stage see the end too
+                            queues[index].put(_DONE, stop)
+                            return
+                        results = stage.finish() if stage.finish else ()
+                    else:
+                        results = stage.process(item)
+                    start = time.perf_counter()
+                    produced = 0
+                    for result in results:
+                        elapsed = time.perf_counter() - start
+                        produced += 1
+                        if output is not None:
+                            output.put(result, stop)
+                        start = time.perf_counter()
+                        with lock:
+                            stage_report.busy_seconds += elapsed
+                            stage_report.items_out += 1
+                    with lock:
+                        stage_report.busy_seconds += time.perf_counter() - start
+                        if item is not _DONE:
+                            stage_report.items_in += 1
+                    if last:
+                        break
+            except BaseException as e:
+                fail(e)
+            finally:
+                if output is not None and last:
+                    output.put(_DONE, stop)
+
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        threads = [threading.Thread(target=produce, name="pipeline-source")] + [
+            threading.Thread(
+                target=consume, args=(i, stage), name=f"pipeline-{stage.name}-{worker}"
+            )
+            for i, stage in enumerate(self.__stages)
+            for worker in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        report.seconds = time.perf_counter() - start
+        if trace_memory:
+            report.peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        logger.info(str(report))
+        if errors:
+            raise errors[0]
+        return report
@@ -0,0 +1,31 @@
+from dataclasses import dataclass
+
+from codr.logger import logger
+
+PROGRESS_LOG_INTERVAL = 500
+
+
+@dataclass
+class IndexProgress:
+    files: int = 0
+    bytes: int = 0
+    chunks: int = 0
+    embeddings: int = 0
+
+    def add_file(self, size: int) -> None:
+        self.files += 1
+        self.bytes += size
+        if self.files % PROGRESS_LOG_INTERVAL == 0:
+            logger.info(f"Ingested {self}")
+
+    def add_chunks(self, count: int) -> None:
+        self.chunks += count
+
+    def add_embeddings(self, count: int) -> None:
+        self.embeddings += count
+
+    def __str__(self) -> str:
+        return (
+            f"{self.files} files ({self.bytes} bytes), {self.chunks} chunks, "
+            f"{self.embeddings} embeddings"
+        )
@@ -0,0 +1,85 @@
+from typing import Any, Iterable, Iterator
+
+from codr.logger import logger
+
+Metadata = dict[str, Any]
+
+
+def get_first_chunk(chunks, overlap_size=100):
+    # The first chunk is the chunk where no other chunk ends with the overlap
+    for chunk in chunks:
+        overlap = chunk[:overlap_size]
+        for other_chunk in chunks:
+            if chunk == other_chunk:
+                continue
+            if other_chunk.endswith(overlap):
+                break
+        else:
+            return chunk
+    return None
+
+
+def merge_documents_with_overlap(chunks, overlap_size=100):
+    """Rebuilds a file from fixed size chunks by matching their overlaps.
+
+    Only needed for chunks indexed before offsets were stored, this is
+    quadratic in the number of chunks.
+    """
+    logger.info(f"Merging {len(chunks)} chunks")
+    first_chunk = get_first_chunk(chunks, overlap_size=overlap_size)
+    if first_chunk is None:
+        raise ValueError("Unable to find the first chunk")
+
+    # Initialize the merged document with the first chunk
+    merged_document = first_chunk
+    used_chunks = {first_chunk}
+
+    while len(used_chunks) < len(chunks):
+        for chunk in chunks:
+            if chunk in used_chunks:
+                continue
+            end_overlap = merged_document[-overlap_size:]
+            if chunk.startswith(end_overlap):
+                merged_document += chunk[overlap_size:]
+                used_chunks.add(chunk)
+                break
+        else:
+            logger.warning(
+                f"Unable to merge chunks, merged {len(used_chunks)} of {len(chunks)}"
+            )
+            break
+
+    return merged_document
+
+
+def stream_file(chunks: Iterable[tuple[str, Metadata]]) -> Iterator[str]:
+    """Yields the text of a file from its chunks, which must be ordered by offset.
+
+    Overlapping text is skipped using the character offsets. Whitespace-only
+    stretches that were never indexed are filled with the missing newlines.
+    """
+    position = 0
+    line = 1
+    for content, metadata in chunks:
+        offset = metadata["offset"]
+        if offset > position:
+            gap = "\n" * max(metadata["start_line"] - line, 0)
+            line += len(gap)
+            yield gap
+            position = offset
+        text = content[position - offset :]
+        if text:
+            line += text.count("\n")
+            position += len(text)
+            yield text
+
+
+def has_offsets(metadatas: list[Metadata]) -> bool:
+    return all("offset" in metadata for metadata in metadatas)
+
+
+def reconstruct_file(documents: list[str], metadatas: list[Metadata]) -> str:
+    if not has_offsets(metadatas):
+        return merge_documents_with_overlap(documents)
+    chunks = sorted(zip(documents, metadatas), key=lambda chunk: chunk[1]["offset"])
+    return "".join(stream_file(chunks))
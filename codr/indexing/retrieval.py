@@ -0,0 +1,194 @@
+from dataclasses import dataclass, field
+
+from codr.indexing.lexical import (
+    DEFINITION_PREFIX,
+    BM25Index,
+    Metadata,
+    parse_symbol_query,
+    reciprocal_rank_fusion,
+)
+from codr.logger import logger
+from codr.storage.lexical_store import LexicalIndexStore
+from codr.storage.vector_db import N_RESULTS, VectorDb
+
+# Files scoring below this fraction of the best file are cut off
+RELATIVE_CUTOFF = 0.2
+MAX_FILES = 20
+
+
+@dataclass
+class Span:
+    # 1-based and inclusive
+    start_line: int
+    end_line: int
+    score: float
+
+
+@dataclass
+class FileResult:
+    path: str
+    score: float
+    spans: list[Span] = field(default_factory=list)
+
+
+def merge_spans(spans: list[Span]) -> list[Span]:
+    """Merges overlapping and adjacent spans, keeping the best score, in line order."""
+    merged: list[Span] = []
+    for span in sorted(spans, key=lambda span: span.start_line):
+        if merged and span.start_line <= merged[-1].end_line + 1:
+            last = merged[-1]
+            last.end_line = max(last.end_line, span.end_line)
+            last.score = max(last.score, span.score)
+        else:
+            merged.append(Span(span.start_line, span.end_line, span.score))
+    return merged
+
+
+def fuse_by_file(
+    rankings: list[list[tuple[float, Metadata]]],
+    relative_cutoff: float = RELATIVE_CUTOFF,
+    max_files: int | None = MAX_FILES,
+) -> list[FileResult]:
+    """Ranks the files hit by several queries' rankings of chunks.
+
+    A file scores the sum over queries of its best chunk, so files matching
+    several queries come first. Instead of a fixed k, files scoring less
+    than `relative_cutoff` times the best file are dropped.
+    """
+    scores: dict[str, float] = {}
+    spans: dict[str, list[Span]] = {}
+    for ranking in rankings:
+        best: dict[str, float] = {}
+        for score, metadata in ranking:
+            path = metadata["source"]
+            best[path] = max(best.get(path, score), score)
+            start_line = metadata.get("start_line")
+            if start_line is not None:
+                spans.setdefault(path, []).append(
+                    Span(start_line, metadata.get("end_line", start_line), score)
+                )
+        for path, score in best.items():
+            scores[path] = scores.get(path, 0.0) + score
+    if not scores:
+        return []
+
+    top = max(scores.values())
+    ranked = sorted(
+        (path for path, score in scores.items() if score >= top * relative_cutoff),
+        key=lambda path: -scores[path],
+    )
+    return [
+        FileResult(path, scores[path], merge_spans(spans.get(path, [])))
+        for path in ranked[:max_files]
+    ]
+
+
+class HybridRetriever:
+    """Runs every query against the BM25 and the vector index and fuses the rankings.
+
+    Queries naming a symbol that is defined in the sha are answered by the
+    lexical index alone, which saves their embedding call.
+    """
+
+    def __init__(
+        self,
+        vector_db: VectorDb,
+        lexical_store: LexicalIndexStore,
+        n_results: int = N_RESULTS,
+        rrf_k: int = 60,
+        min_similarity: float | None = None,
+    ) -> None:
+        self.__vector_db = vector_db
+        self.__lexical_store = lexical_store
+        self.n_results = n_results
+        self.rrf_k = rrf_k
+        # Vector hits less similar than this are ignored
+        self.min_similarity = min_similarity
+
+    @staticmethod
+    def is_exact_symbol(lexical: BM25Index, query: str) -> bool:
+        symbol = parse_symbol_query(query)
+        return symbol is not None and lexical.has_term(
+            DEFINITION_PREFIX + symbol.lower()
+        )
+
+    def _vector_rankings(
+        self, queries: list[str], sha: str, repo: str | None = None
+    ) -> list[list[tuple[float, Metadata]]]:
+        if not queries:
+            return []
+        rankings = self.__vector_db.query_scores(
+            queries, sha=sha, n_results=self.n_results, repo=repo
+        )
+        if self.min_similarity is None:
+            return rankings
+        return [
+            [(score, m) for score, m in ranking if score >= self.min_similarity]
+            for ranking in rankings
+        ]
+
+    def rankings(
+        self, queries: list[str], sha: str, repo: str | None = None
+    ) -> list[list[tuple[float, Metadata]]]:
+        """Returns the fused (score, metadata) ranking of chunks of every query."""
+        lexical = self.__lexical_store.get(sha, repo)
+        if lexical is None:
+            return [
+                reciprocal_rank_fusion([[m for _, m in ranking]], k=self.rrf_k)
+                for ranking in self._vector_rankings(queries, sha, repo)
+            ]
+
+        semantic = [
+            i
+            for i, query in enumerate(queries)
+            if not self.is_exact_symbol(lexical, query)
+        ]
+        # All remaining queries are embedded and scored in one call
+        vector_results = self._vector_rankings(
+            [queries[i] for i in semantic], sha, repo
+        )
+        logger.info(
+            f"Skipped embedding {len(queries) - len(semantic)} of {len(queries)} queries naming a symbol"
+        )
+        vector_rankings = dict(zip(semantic, vector_results))
+
+        results = []
+        for i, query in enumerate(queries):
+            lexical_ranking = [
+                metadata
+                for _, metadata in lexical.search_text(query, n_results=self.n_results)
+            ]
+            vector_ranking = [metadata for _, metadata in vector_rankings.get(i, [])]
+            results.append(
+                reciprocal_rank_fusion(
+                    [lexical_ranking, vector_ranking],
+                    k=self.rrf_k,
+                    n_results=self.n_results,
+                )
+            )
+        return results
+
+    def search(
+        self, queries: list[str], sha: str, repo: str | None = None
+    ) -> list[list[Metadata]]:
+        return [
+            [metadata for _, metadata in ranking]
+            for ranking in self.rankings(queries, sha, repo)
+        ]
+
+    def search_files(
+        self,
+        queries: list[str],
+        sha: str,
+        relative_cutoff: float = RELATIVE_CUTOFF,
+        max_files: int | None = MAX_FILES,
+        repo: str | None = None,
+    ) -> list[FileResult]:
+        """Returns one ranked list of files and their hit spans for all queries."""
+        files = fuse_by_file(
+            self.rankings(queries, sha, repo),
+            relative_cutoff=relative_cutoff,
+            max_files=max_files,
+        )
+        logger.info(f"Found {len(files)} files for {len(queries)} queries")
+        return files
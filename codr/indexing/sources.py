@@ -0,0 +1,180 @@
+import base64
+import tarfile
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass
+from enum import auto
+from typing import IO, Iterator
+
+import requests
+from github.Repository import Repository
+
+from codr.common.utils import BaseEnum
+from codr.indexing.progress import IndexProgress
+from codr.logger import logger
+
+# Above this many changed files a single tarball download beats per-blob requests
+MAX_BLOB_REQUESTS = 100
+# Seconds to connect, and to wait for each read of the tarball stream
+TARBALL_TIMEOUT = (10, 60)
+
+
+class IngestionMode(BaseEnum):
+    API = auto()
+    TARBALL = auto()
+
+
+@dataclass
+class SourceFile:
+    path: str
+    content: str
+
+
+class SourceProvider(ABC):
+    def __init__(
+        self,
+        suffixes: tuple[str, ...] = (".py",),
+        paths: set[str] | None = None,
+        progress: IndexProgress | None = None,
+    ) -> None:
+        self.suffixes = suffixes
+        self.paths = paths
+        self.progress = progress or IndexProgress()
+
+    def accepts(self, path: str) -> bool:
+        if self.paths is not None and path not in self.paths:
+            return False
+        return path.endswith(self.suffixes)
+
+    def _decode(self, path: str, raw: bytes) -> SourceFile | None:
+        self.progress.add_file(len(raw))
+        try:
+            return SourceFile(path=path, content=raw.decode("utf-8"))
+        except UnicodeDecodeError:
+            logger.warning(f"Skipping {path}, content is not valid utf-8")
+            return None
+
+    @abstractmethod
+    def files(self) -> Iterator[SourceFile]:
+        raise NotImplementedError
+
+
+class GitHubApiSource(SourceProvider):
+    """Walks the repository through the contents API, one request per directory and file."""
+
+    def __init__(
+        self,
+        repo: Repository,
+        sha: str,
+        suffixes: tuple[str, ...] = (".py",),
+        paths: set[str] | None = None,
+        progress: IndexProgress | None = None,
+    ) -> None:
+        super().__init__(suffixes=suffixes, paths=paths, progress=progress)
+        self.__repo = repo
+        self.__sha = sha
+
+    def files(self) -> Iterator[SourceFile]:
+        pending = deque(self.__repo.get_contents("", ref=self.__sha))
+        while pending:
+            file_content = pending.popleft()
+            if file_content.type == "dir":
+                pending.extend(
+                    self.__repo.get_contents(file_content.path, ref=self.__sha)
+                )
+            elif file_content.type == "file" and self.accepts(file_content.path):
+                source_file = self._decode(
+                    file_content.path, file_content.decoded_content
+                )
+                if source_file is not None:
+                    yield source_file
+
+
+class TarballSource(SourceProvider):
+    """Streams the files of a gzipped tarball without extracting it to disk.
+
+    GitHub archives wrap every entry in a single `<owner>-<repo>-<sha>/` root
+    folder, which is stripped from the yielded paths.
+    """
+
+    def __init__(
+        self,
+        fileobj: IO[bytes],
+        suffixes: tuple[str, ...] = (".py",),
+        paths: set[str] | None = None,
+        progress: IndexProgress | None = None,
+    ) -> None:
+        super().__init__(suffixes=suffixes, paths=paths, progress=progress)
+        self.__fileobj = fileobj
+
+    @classmethod
+    def from_repository(
+        cls,
+        repo: Repository,
+        sha: str,
+        suffixes: tuple[str, ...] = (".py",),
+        paths: set[str] | None = None,
+        progress: IndexProgress | None = None,
+    ) -> "TarballSource":
+        tarball_url = repo.get_archive_link("tarball", ref=sha)
+        logger.info(f"Streaming tarball of {repo.full_name} at {sha}")
+        response = requests.get(tarball_url, stream=True, timeout=TARBALL_TIMEOUT)
+        response.raise_for_status()
+        return cls(
+            fileobj=response.raw, suffixes=suffixes, paths=paths, progress=progress
+        )
+
+    def files(self) -> Iterator[SourceFile]:
+        try:
+            with tarfile.open(fileobj=self.__fileobj, mode="r|gz") as tar:
+                for member in tar:
+                    if not member.isfile():
+                        continue
+                    _, _, path = member.name.partition("/")
+                    if not path or not self.accepts(path):
+                        continue
+                    extracted = tar.extractfile(member)
+                    if extracted is None:
+                        continue
+                    source_file = self._decode(path, extracted.read())
+                    if source_file is not None:
+                        yield source_file
+        finally:
+            self.__fileobj.close()
+
+
+class GitHubBlobSource(SourceProvider):
+    """Fetches a known set of files by their git blob sha, one request per file."""
+
+    def __init__(
+        self,
+        repo: Repository,
+        blobs: dict[str, str],
+        progress: IndexProgress | None = None,
+    ) -> None:
+        super().__init__(suffixes=("",), paths=set(blobs), progress=progress)
+        self.__repo = repo
+        self.__blobs = blobs
+
+    def files(self) -> Iterator[SourceFile]:
+        for path, blob_sha in self.__blobs.items():
+            blob = self.__repo.get_git_blob(blob_sha)
+            source_file = self._decode(path, base64.b64decode(blob.content))
+            if source_file is not None:
+                yield source_file
+
+
+def get_source_provider(
+    mode: IngestionMode,
+    repo: Repository,
+    sha: str,
+    blobs: dict[str, str] | None = None,
+    progress: IndexProgress | None = None,
+) -> SourceProvider:
+    """Returns the cheapest source for the whole commit, or only for `blobs` if given."""
+    if blobs is not None and len(blobs) <= MAX_BLOB_REQUESTS:
+        return GitHubBlobSource(repo, blobs, progress=progress)
+    paths = set(blobs) if blobs is not None else None
+    if mode == IngestionMode.TARBALL:
+        return TarballSource.from_repository(repo, sha, paths=paths, progress=progress)
+    return GitHubApiSource(repo, sha, paths=paths, progress=progress)
@@ -0,0 +1,304 @@
+import ast
+from dataclasses import dataclass, field
+from enum import auto
+from typing import Any
+
+from codr.common.utils import BaseEnum
+from codr.logger import logger
+
+
+class SymbolKind(BaseEnum):
+    MODULE = auto()
+    CLASS = auto()
+    FUNCTION = auto()
+    ASSIGNMENT = auto()
+
+
+@dataclass(frozen=True)
+class Symbol:
+    # Dotted path of the definition, e.g. "codr.models.Repo.name"
+    qualified_name: str
+    kind: SymbolKind
+    path: str
+    # 1-based and inclusive, decorators included
+    start_line: int
+    end_line: int
+
+    @property
+    def name(self) -> str:
+        return self.qualified_name.rsplit(".", 1)[-1]
+
+
+@dataclass(frozen=True)
+class Reference:
+    # Referenced identifier, references are matched to definitions by name
+    name: str
+    path: str
+    line: int
+    # Qualified name of the innermost enclosing definition
+    scope: str
+    is_call: bool
+
+
+@dataclass
+class FileSymbols:
+    definitions: list[Symbol]
+    references: list[Reference]
+    # Absolute names of the imported modules, and of the names imported from them
+    imports: list[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "definitions": [
+                [s.qualified_name, s.kind.value, s.start_line, s.end_line]
+                for s in self.definitions
+            ],
+            "references": [
+                [r.name, r.line, r.scope, r.is_call] for r in self.references
+            ],
+            "imports": self.imports,
+        }
+
+    @classmethod
+    def from_dict(cls, path: str, data: dict[str, Any]) -> "FileSymbols":
+        return cls(
+            definitions=[
+                Symbol(name, SymbolKind(kind), path, start, end)
+                for name, kind, start, end in data["definitions"]
+            ],
+            references=[
+                Reference(name, path, line, scope, is_call)
+                for name, line, scope, is_call in data["references"]
+            ],
+            imports=data.get("imports", []),
+        )
+
+
+def module_name(path: str) -> str:
+    """Maps "codr/storage/__init__.py" to "codr.storage" and "a/b.py" to "a.b"."""
+    parts = path.removesuffix(".py").split("/")
+    if parts[-1] == "__init__" and len(parts) > 1:
+        parts = parts[:-1]
+    return ".".join(parts)
+
+
+def package_name(path: str) -> str:
+    module = module_name(path)
+    if path.endswith("__init__.py"):
+        return module
+    return module.rpartition(".")[0]
+
+
+class _SymbolVisitor(ast.NodeVisitor):
+    def __init__(self, path: str, module: str) -> None:
+        self.path = path
+        self.scopes = [module]
+        self.definitions: list[Symbol] = []
+        self.references: list[Reference] = []
+        self.imports: list[str] = []
+        # Module and class bodies define attributes, function bodies define locals
+        self.in_function = False
+
+    def _define(self, name: str, kind: SymbolKind, node: ast.AST) -> str:
+        qualified_name = f"{self.scopes[-1]}.{name}"
+        decorators = getattr(node, "decorator_list", [])
+        self.definitions.append(
+            Symbol(
+                qualified_name=qualified_name,
+                kind=kind,
+                path=self.path,
+                start_line=min([d.lineno for d in decorators] + [node.lineno]),  # type: ignore[attr-defined]
+                end_line=node.end_lineno or node.lineno,  # type: ignore[attr-defined]
+            )
+        )
+        return qualified_name
+
+    def _refer(self, name: str, node: ast.AST, is_call: bool = False) -> None:
+        self.references.append(
+            Reference(
+                name=name,
+                path=self.path,
+                line=node.lineno,  # type: ignore[attr-defined]
+                scope=self.scopes[-1],
+                is_call=is_call,
+            )
+        )
+
+    def _visit_definition(self, node: ast.AST, name: str, kind: SymbolKind) -> None:
+        for decorator in getattr(node, "decorator_list", []):
+            self.visit(decorator)
+        qualified_name = self._define(name, kind, node)
+        in_function = self.in_function
+        self.scopes.append(qualified_name)
+        self.in_function = kind == SymbolKind.FUNCTION
+        for field in ("bases", "keywords", "args", "returns", "body"):
+            value = getattr(node, field, None)
+            if isinstance(value, list):
+                for child in value:
+                    self.visit(child)
+            elif isinstance(value, ast.AST):
+                self.visit(value)
+        self.scopes.pop()
+        self.in_function = in_function
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> None:
+        self._visit_definition(node, node.name, SymbolKind.CLASS)
+
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
+        self._visit_definition(node, node.name, SymbolKind.FUNCTION)
+
+    def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef) -> None:
+        self._visit_definition(node, node.name, SymbolKind.FUNCTION)
+
+    def _visit_assignment(self, node: ast.AST, targets: list[ast.expr]) -> None:
+        if not self.in_function:
+            for target in targets:
+                for name in ast.walk(target):
+                    if isinstance(name, ast.Name):
+                        self._define(name.id, SymbolKind.ASSIGNMENT, node)
+        self.generic_visit(node)
+
+    def visit_Assign(self, node: ast.Assign) -> None:
+        self._visit_assignment(node, node.targets)
+
+    def visit_AnnAssign(self, node: ast.AnnAssign) -> None:
+        self._visit_assignment(node, [node.target])
+
+    def visit_Import(self, node: ast.Import) -> None:
+        for alias in node.names:
+            self.imports.append(alias.name)
+            self._refer(alias.name.rsplit(".", 1)[-1], node)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        module = node.module or ""
+        if node.level:
+            package = package_name(self.path).split(".")
+            base = ".".join(package[: len(package) - node.level + 1])
+            module = f"{base}.{module}".strip(".")
+        if module:
+            self.imports.append(module)
+        for alias in node.names:
+            # The imported name may be a submodule
+            if alias.name != "*":
+                self.imports.append(f"{module}.{alias.name}".strip("."))
+            self._refer(alias.name, node)
+
+    def visit_Call(self, node: ast.Call) -> None:
+        if isinstance(node.func, ast.Name):
+            self._refer(node.func.id, node, is_call=True)
+        elif isinstance(node.func, ast.Attribute):
+            self._refer(node.func.attr, node, is_call=True)
+            self.visit(node.func.value)
+        else:
+            self.visit(node.func)
+        for child in node.args + node.keywords:  # type: ignore[operator]
+            self.visit(child)
+
+    def visit_Name(self, node: ast.Name) -> None:
+        if isinstance(node.ctx, ast.Load):
+            self._refer(node.id, node)
+
+    def visit_Attribute(self, node: ast.Attribute) -> None:
+        if isinstance(node.ctx, ast.Load):
+            self._refer(node.attr, node)
+        self.visit(node.value)
+
+
+def extract_symbols(path: str, content: str) -> FileSymbols | None:
+    """Collects the definitions and references of a Python file, None if it does not parse."""
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        logger.warning(f"Unable to parse {path}, it is left out of the symbol index")
+        return None
+    module = module_name(path)
+    visitor = _SymbolVisitor(path, module)
+    visitor.definitions.append(
+        Symbol(
+            qualified_name=module,
+            kind=SymbolKind.MODULE,
+            path=path,
+            start_line=1,
+            end_line=max(len(content.splitlines()), 1),
+        )
+    )
+    visitor.visit(tree)
+    return FileSymbols(visitor.definitions, visitor.references, visitor.imports)
+
+
+class SymbolIndex:
+    """Definitions and references of the Python files of one sha.
+
+    Lookups go through dicts keyed by qualified and plain names. References
+    are matched by name only, without resolving imports or types, so the
+    callers of a common method name include calls to unrelated methods of
+    the same name.
+    """
+
+    def __init__(self) -> None:
+        self.files: dict[str, FileSymbols] = {}
+        self.__definitions: dict[str, list[Symbol]] | None = None
+        self.__references: dict[str, list[Reference]] = {}
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def add_file(self, path: str, content: str) -> None:
+        symbols = extract_symbols(path, content)
+        if symbols is not None:
+            self.files[path] = symbols
+            self.__definitions = None
+
+    def carry_forward(self, previous: "SymbolIndex", sources: set[str]) -> int:
+        carried = 0
+        for path in sources & previous.files.keys():
+            self.files[path] = previous.files[path]
+            carried += 1
+        self.__definitions = None
+        return carried
+
+    def _build(self) -> None:
+        definitions: dict[str, list[Symbol]] = {}
+        references: dict[str, list[Reference]] = {}
+        for symbols in self.files.values():
+            for symbol in symbols.definitions:
+                definitions.setdefault(symbol.qualified_name, []).append(symbol)
+                if symbol.kind != SymbolKind.MODULE:
+                    definitions.setdefault(symbol.name, []).append(symbol)
+            for reference in symbols.references:
+                references.setdefault(reference.name, []).append(reference)
+        self.__definitions = definitions
+        self.__references = references
+
+    def lookup(self, name: str) -> list[Symbol]:
+        """Finds the definitions of a qualified, partially qualified or plain name."""
+        if self.__definitions is None:
+            self._build()
+        definitions = self.__definitions  # type: ignore[union-attr]
+        if name in definitions:  # type: ignore[operator]
+            return list(definitions[name])  # type: ignore[index]
+        # "Class.method" matches the qualified names ending with it
+        suffix = "." + name
+        return [
+            symbol
+            for symbol in definitions.get(name.rsplit(".", 1)[-1], [])  # type: ignore[union-attr]
+            if symbol.qualified_name.endswith(suffix)
+        ]
+
+    def references(self, name: str) -> list[Reference]:
+        if self.__definitions is None:
+            self._build()
+        return list(self.__references.get(name.rsplit(".", 1)[-1], []))
+
+    def callers(self, name: str) -> list[Reference]:
+        return [reference for reference in self.references(name) if reference.is_call]
+
+    def to_dict(self) -> dict[str, Any]:
+        return {path: symbols.to_dict() for path, symbols in self.files.items()}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "SymbolIndex":
+        index = cls()
+        for path, symbols in data.items():
+            index.files[path] = FileSymbols.from_dict(path, symbols)
+        return index
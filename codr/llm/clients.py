@@ -1,3 +1,5 @@
+import os
+import time
 from typing import List, TypedDict
 
 from dotenv import load_dotenv
@@ -5,20 +7,42 @@ from langchain_core.messages import SystemMessage
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.pydantic_v1 import BaseModel, Field
+from langchain_core.rate_limiters import InMemoryRateLimiter
 from langchain_openai import ChatOpenAI
 from langgraph.prebuilt import create_react_agent
 
+from codr.llm.context import PackedFile
 from codr.llm.documents import document_storage
+from codr.llm.response_cache import LlmResponseCache, cached
 from codr.llm.tools import DocumentInspectionTool, LineNumberSearchTool
+from codr.logger import logger
 
 load_dotenv()
 
+# Files sent to the coding assistant at once
+LLM_CONCURRENCY = int(os.getenv("CODR_LLM_CONCURRENCY", "8"))
+# Token bucket shared by every chat model call of the process
+LLM_REQUESTS_PER_SECOND = float(os.getenv("CODR_LLM_REQUESTS_PER_SECOND", "10"))
+
+rate_limiter = InMemoryRateLimiter(
+    requests_per_second=LLM_REQUESTS_PER_SECOND,
+    check_every_n_seconds=0.05,
+    # A burst may start every concurrent call at once
+    max_bucket_size=max(LLM_CONCURRENCY, 1),
+)
+response_cache = LlmResponseCache()
+
+
+def model_settings(model: ChatOpenAI) -> dict:
+    return {"model": model.model_name, "temperature": model.temperature}
+
 
 class Queries(BaseModel):
     queries: list[str]
 
 
-query_assistant = ChatOpenAI(model="gpt-4o").with_structured_output(Queries)
+query_model = ChatOpenAI(model="gpt-4o", rate_limiter=rate_limiter)
+query_assistant = query_model.with_structured_output(Queries)
 
 query_prompt_template = ChatPromptTemplate.from_messages(
     [
@@ -45,9 +69,19 @@ query_prompt_template = ChatPromptTemplate.from_messages(
 )
 
 
-def invoke_query_assistant(task: str) -> Queries:
+def invoke_query_assistant(task: str, bypass_cache: bool = False) -> Queries:
     query_prompt = query_prompt_template.invoke({"task": task, "agent_scratchpad": []})
-    return query_assistant.invoke(query_prompt)
+    chain = cached(
+        query_assistant,
+        response_cache,
+        Queries,
+        model=model_settings(query_model),
+        config={"structured_output": True},
+        bypass=bypass_cache,
+    )
+    queries = chain.invoke(query_prompt)
+    logger.info(f"LLM response cache: {response_cache.stats}")
+    return queries
 
 
 class CodeChange(TypedDict):
@@ -68,7 +102,7 @@ parser = PydanticOutputParser(pydantic_object=CodeChanges)
 
 tools = [DocumentInspectionTool(), LineNumberSearchTool()]
 
-llm = ChatOpenAI(model="gpt-4o")
+llm = ChatOpenAI(model="gpt-4o", rate_limiter=rate_limiter)
 code_change_prompt = ChatPromptTemplate.from_messages(
     [
         (
@@ -79,21 +113,22 @@ code_change_prompt = ChatPromptTemplate.from_messages(
         Focus solely on the task, do not reformat the code or make any other changes. Only touch the code that is totally necessary to complete the task. \
         Make ALL necessary changes and do not skip any, since your code changes will be used to update the codebase.
         The code changes should be in the form of a list of code changes. If you dont want to make any changes, return an empty list.
-        Use the LineNumberSearchTool to find the line numbers where the changes should be made.
+        Take the line numbers where the changes should be made from the snippet.
 
         This is the task:
         {task}
 
         This is the file with the file_path: {file_path}
 
-        This is the code snippet:
+        This is the code snippet. Every line starts with its line number in the file, counted from 1, followed by " | ". \
+        Lines marked as elided are left out of it and must not be changed:
         {snippet}
 
         Return a list of code changes with the following fields:
         - file_path: The path to the file where the change is necessary \
-        - line_start: The line number where the change starts \
-        - line_end: The line number where the change ends \
-        - original_text: The original text that needs to be changed \
+        - line_start: The line number in the file where the change starts, counted from 1 \
+        - line_end: The line number in the file where the change ends, counted from 1 \
+        - original_text: The original text that needs to be changed, without the line numbers \
         - new_text: The new text that should replace the original text. Wrap the output in `json` tags\n{format_instructions}. Just write the json, do NOT include ```json```""",
         ),
         ("placeholder", "{messages}"),
@@ -113,30 +148,54 @@ code_edit_system_message = SystemMessage(
 )
 
 
-def invoke_coding_assistant(task: str, relevant_files: list) -> CodeChanges:
-
-    document_storage.documents = {doc[0]: doc[1] for doc in relevant_files}
-    llm.bind_tools(tools)
+def invoke_coding_assistant(
+    task: str,
+    relevant_files: list[PackedFile] | list[tuple[str, str]],
+    bypass_cache: bool = False,
+) -> CodeChanges:
+    """Asks for the code changes of every file, given packed or as (path, content)."""
+    files = [
+        file if isinstance(file, PackedFile) else PackedFile.whole(*file)
+        for file in relevant_files
+    ]
+    document_storage.documents = {file.path: file.content for file in files}
+
+    # The chain has no tool loop, so the model answers from the prompt alone
+    # and the tools are not part of the cache key
+    chain = code_change_prompt | cached(
+        llm | parser,
+        response_cache,
+        CodeChanges,
+        model=model_settings(llm),
+        config={},
+        bypass=bypass_cache,
+    )
+    inputs = [
+        {
+            "input": f"{task}, These are the possible files: {', '.join(document_storage.documents.keys())}",
+            "task": task,
+            "file_path": file.path,
+            "snippet": file.numbered,
+            "agent_scratchpad": [],
+        }
+        for file in files
+    ]
+    # Files are processed concurrently, responses come back in the order of the files
+    start = time.perf_counter()
+    responses = chain.batch(inputs, config={"max_concurrency": LLM_CONCURRENCY})
+    logger.info(
+        f"Got code changes for {len(inputs)} files in {time.perf_counter() - start:.2f}s, "
+        f"LLM response cache: {response_cache.stats}"
+    )
 
+    # Line numbers refer to the file, elided ones are moved onto the snippet
     code_changes = []
-    for fp, doc in document_storage.documents.items():
-        chain = code_change_prompt | llm | parser
-        resp = chain.invoke(
-            {
-                "input": f"{task}, These are the possible files: {', '.join(document_storage.documents.keys())}",
-                "task": task,
-                "file_path": fp,
-                "snippet": doc,
-                "agent_scratchpad": [],
-            },
-        )
-
-        code_changes.extend(resp.code_changes)
-
+    for file, resp in zip(files, responses):
+        code_changes.extend(file.remap(change) for change in resp.code_changes)
     return CodeChanges(code_changes=code_changes)
 
 
-verify_agent = ChatOpenAI(model="gpt-4o")
+verify_agent = ChatOpenAI(model="gpt-4o", rate_limiter=rate_limiter)
 
 verify_prompt_template = ChatPromptTemplate.from_messages(
     [
@@ -161,8 +220,8 @@ verify_prompt_template = ChatPromptTemplate.from_messages(
 
         Return a list of code changes with the following fields:
         - file_path: The path to the file where the change is necessary \
-        - line_start: The line number where the change starts \
-        - line_end: The line number where the change ends \
+        - line_start: The line number in the file where the change starts, counted from 1 \
+        - line_end: The line number in the file where the change ends, counted from 1 \
         - original_text: The original text that needs to be changed \
         - new_text: The new text that should replace the original text. Wrap the output in `json` tags\n{format_instructions}. Just write the json, do NOT include ```json```
         """,
@@ -172,7 +231,9 @@ verify_prompt_template = ChatPromptTemplate.from_messages(
 ).partial(format_instructions=parser.get_format_instructions())
 
 
-def invoke_verify_agent(task: str, code_changes: CodeChanges) -> CodeChanges:
+def invoke_verify_agent(
+    task: str, code_changes: CodeChanges, bypass_cache: bool = False
+) -> CodeChanges:
     verify_prompt = verify_prompt_template.invoke(
         {
             "task": task,
@@ -181,5 +242,14 @@ def invoke_verify_agent(task: str, code_changes: CodeChanges) -> CodeChanges:
         }
     )
 
-    chain = verify_agent | parser
-    return chain.invoke(verify_prompt)
+    chain = cached(
+        verify_agent | parser,
+        response_cache,
+        CodeChanges,
+        model=model_settings(verify_agent),
+        config={},
+        bypass=bypass_cache,
+    )
+    verified = chain.invoke(verify_prompt)
+    logger.info(f"LLM response cache: {response_cache.stats}")
+    return verified
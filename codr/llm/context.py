@@ -0,0 +1,198 @@
+import bisect
+import io
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Callable
+
+from codr.indexing.retrieval import Span
+from codr.indexing.symbols import Symbol, SymbolKind
+from codr.logger import logger
+from codr.storage.embedding_batcher import TokenEstimator
+
+# Tokens of one file's snippet in the coding assistant prompt
+CONTEXT_TOKENS = int(os.getenv("CODR_CONTEXT_TOKENS", "6000"))
+# Lines kept around a span that has no enclosing definition, or whose definition does not fit
+CONTEXT_LINES = 5
+# Generous cost of the elision marker each added region may introduce
+MARKER_TOKENS = 16
+HEADER = re.compile(r"^\s*(?:async\s+def|def|class)\b")
+
+
+def split_lines(content: str) -> list[str]:
+    """Splits on newlines only, like the chunkers, str.splitlines also breaks on form feeds."""
+    return [line.removesuffix("\n") for line in io.StringIO(content).readlines()]
+
+
+def elision_marker(start_line: int, end_line: int) -> str:
+    if start_line == end_line:
+        return f"... line {start_line} elided ..."
+    return f"... lines {start_line}-{end_line} elided ..."
+
+
+@dataclass
+class PackedFile:
+    """Snippet of a file sent to the coding assistant, with elided lines marked."""
+
+    path: str
+    # The whole file, for tools reading it
+    content: str
+    text: str
+    # 1-based file line of every snippet line, None for elision markers
+    lines: list[int | None] = field(default_factory=list)
+
+    @classmethod
+    def whole(cls, path: str, content: str) -> "PackedFile":
+        return cls(
+            path, content, content, list(range(1, len(split_lines(content)) + 1))
+        )
+
+    @property
+    def elided(self) -> int:
+        return len(split_lines(self.content)) - sum(
+            1 for line in self.lines if line is not None
+        )
+
+    @property
+    def numbered(self) -> str:
+        """The snippet as sent in the prompt, every line after its 1-based file line."""
+        width = len(str(len(split_lines(self.content))))
+        return "\n".join(
+            text if line is None else f"{line:>{width}} | {text}"
+            for line, text in zip(self.lines, split_lines(self.text))
+        )
+
+    def file_line(self, line: int, end: bool = False) -> int:
+        """Moves a file line that was elided onto the snippet.
+
+        An elided line moves to the first line shown after it, or the last
+        line shown before it for the `end` of a range.
+        """
+        shown = [n for n in self.lines if n is not None]
+        if not shown:
+            return line
+        if end:
+            return shown[max(bisect.bisect_right(shown, line) - 1, 0)]
+        return shown[min(bisect.bisect_left(shown, line), len(shown) - 1)]
+
+    def remap(self, change: dict) -> dict:
+        """Keeps the line range of a code change on the lines of the snippet."""
+        if change.get("file_path") != self.path or not self.elided:
+            return change
+        return {
+            **change,
+            "line_start": self.file_line(change["line_start"]),
+            "line_end": self.file_line(change["line_end"], end=True),
+        }
+
+
+class ContextPacker:
+    """Fits the retrieved spans of a file and their context under a token budget.
+
+    Files within the budget are sent whole. Otherwise, by decreasing span
+    score, a span brings the header lines of its enclosing definitions and
+    the innermost of them in full, or only its surroundings if that does
+    not fit. The lines before the first definition, usually imports, and
+    the headers of the remaining definitions fill what is left.
+    """
+
+    def __init__(
+        self,
+        budget: int = CONTEXT_TOKENS,
+        context_lines: int = CONTEXT_LINES,
+        estimate_tokens: Callable[[str], int] | None = None,
+    ) -> None:
+        self.budget = budget
+        self.context_lines = context_lines
+        self.estimate_tokens = estimate_tokens or TokenEstimator("gpt-4o")
+
+    @staticmethod
+    def _header(lines: list[str], definition: Symbol) -> tuple[int, int]:
+        # Definitions start at their first decorator
+        for line in range(definition.start_line, definition.end_line + 1):
+            if HEADER.match(lines[line - 1]):
+                return line, line
+        return definition.start_line, definition.start_line
+
+    def _regions(
+        self, lines: list[str], spans: list[Span], definitions: list[Symbol]
+    ) -> list[list[tuple[int, int]]]:
+        """Lists the regions to add in order, each with the fallbacks tried if it does not fit."""
+        definitions = [d for d in definitions if d.kind != SymbolKind.MODULE]
+        regions: list[list[tuple[int, int]]] = []
+        for span in sorted(spans, key=lambda span: -span.score):
+            around = (
+                span.start_line - self.context_lines,
+                span.end_line + self.context_lines,
+            )
+            enclosing = sorted(
+                (
+                    d
+                    for d in definitions
+                    if d.kind != SymbolKind.ASSIGNMENT
+                    and d.start_line <= span.start_line
+                    and span.end_line <= d.end_line
+                ),
+                key=lambda d: d.start_line,
+            )
+            regions.extend([self._header(lines, d)] for d in enclosing)
+            if enclosing:
+                innermost = enclosing[-1]
+                regions.append([(innermost.start_line, innermost.end_line), around])
+            else:
+                regions.append([around])
+        first = min((d.start_line for d in definitions), default=len(lines) + 1)
+        if first > 1:
+            regions.append([(1, first - 1)])
+        regions.extend(
+            [self._header(lines, d)]
+            for d in sorted(definitions, key=lambda d: d.start_line)
+            if d.kind != SymbolKind.ASSIGNMENT
+        )
+        return regions
+
+    def pack(
+        self,
+        path: str,
+        content: str,
+        spans: list[Span] | None = None,
+        definitions: list[Symbol] | None = None,
+    ) -> PackedFile:
+        lines = split_lines(content)
+        tokens = [self.estimate_tokens(line) + 1 for line in lines]
+        if sum(tokens) <= self.budget:
+            return PackedFile.whole(path, content)
+
+        selected = [False] * len(lines)
+        used = 0
+        for alternatives in self._regions(lines, spans or [], definitions or []):
+            for start_line, end_line in alternatives:
+                rows = range(max(start_line, 1) - 1, min(end_line, len(lines)))
+                cost = sum(tokens[row] for row in rows if not selected[row])
+                if cost == 0:
+                    break
+                if used + cost + MARKER_TOKENS <= self.budget:
+                    for row in rows:
+                        selected[row] = True
+                    used += cost + MARKER_TOKENS
+                    break
+
+        text: list[str] = []
+        mapping: list[int | None] = []
+        row = 0
+        while row < len(lines):
+            if selected[row]:
+                text.append(lines[row])
+                mapping.append(row + 1)
+                row += 1
+                continue
+            start = row
+            while row < len(lines) and not selected[row]:
+                row += 1
+            text.append(elision_marker(start + 1, row))
+            mapping.append(None)
+        packed = PackedFile(path, content, "\n".join(text), mapping)
+        logger.info(
+            f"Packed {path} into ~{used} tokens, {packed.elided} of {len(lines)} lines elided"
+        )
+        return packed
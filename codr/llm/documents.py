@@ -1,6 +1,28 @@
+from codr.indexing.symbols import SymbolIndex
+from codr.storage.blob_store import BlobStore
+
+
 class DocumentStorage:
     def __init__(self) -> None:
         self.documents = {}
+        self.blob_store = None
+        self.sha = None
+        self.symbols = None
+
+    def attach(
+        self, blob_store: BlobStore, sha: str, symbols: SymbolIndex | None = None
+    ) -> None:
+        """Serves files that are not in `documents` from the blob store at `sha`."""
+        self.blob_store = blob_store
+        self.sha = sha
+        self.symbols = symbols
+
+    def get(self, path: str) -> str | None:
+        if path in self.documents:
+            return self.documents[path]
+        if self.blob_store is None or self.sha is None:
+            return None
+        return self.blob_store.read_file(self.sha, path)
 
 
 document_storage = DocumentStorage()
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Type, TypeVar
+
+from langchain_core.prompt_values import PromptValue
+from langchain_core.pydantic_v1 import BaseModel
+from langchain_core.runnables import Runnable, RunnableLambda
+
+from codr.application.exceptions import LlmCacheMissError
+from codr.logger import logger
+from codr.storage.embedding_cache import EVICTION_TARGET, CacheStats
+from codr.utils import DATA_DIR
+
+DEFAULT_MAX_BYTES = 256 * 1024**2
+DEFAULT_TTL = 7 * 24 * 60 * 60
+# Replays and benchmarks set this to fail on a miss instead of calling the model
+REPLAY = os.getenv("CODR_LLM_REPLAY", "").lower() in ("1", "true")
+
+Output = TypeVar("Output", bound=BaseModel)
+
+
+def prompt_key(model: dict[str, Any], prompt: str, config: dict[str, Any]) -> str:
+    """Hashes the model settings, the rendered prompt and the tool and format configuration."""
+    payload = json.dumps([model, prompt, config], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LlmResponseCache:
+    """Persistent cache of parsed chat model responses keyed by prompt_key.
+
+    Entries expire `ttl` seconds after they were written, and the least
+    recently used ones are evicted once the responses exceed `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        path: str = os.path.join(DATA_DIR, "llm_cache.sqlite"),
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl: float = DEFAULT_TTL,
+    ) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        self.__connection.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+            """
+        )
+        self.__size = self.__connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self.__lock:
+            row = self.__connection.execute(
+                "SELECT response, size, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[2] < now - self.ttl:
+                self.__connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.__size -= row[1]
+                self.stats.evictions += 1
+                row = None
+            elif row is not None:
+                self.__connection.execute(
+                    "UPDATE responses SET last_used = ? WHERE key = ?", (now, key)
+                )
+            self.__connection.commit()
+            if row is None:
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self.__lock:
+            previous = self.__connection.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self.__size += size - (previous[0] if previous else 0)
+            self.__connection.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now),
+            )
+            if self.__size > self.max_bytes:
+                self._evict(now)
+            self.__connection.commit()
+
+    def _evict(self, now: float) -> None:
+        expired = self.__connection.execute(
+            "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM responses WHERE created_at < ?",
+            (now - self.ttl,),
+        ).fetchone()
+        self.__connection.execute(
+            "DELETE FROM responses WHERE created_at < ?", (now - self.ttl,)
+        )
+        self.__size -= expired[0]
+        evicted = []
+        target = self.max_bytes * EVICTION_TARGET
+        cursor = self.__connection.execute(
+            "SELECT key, size FROM responses ORDER BY last_used ASC"
+        )
+        for key, size in cursor:
+            if self.__size <= target:
+                break
+            evicted.append((key,))
+            self.__size -= size
+        self.__connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.stats.evictions += expired[1] + len(evicted)
+        logger.info(
+            f"Evicted {expired[1]} expired and {len(evicted)} least recently used LLM responses"
+        )
+
+
+def cached(
+    runnable: Runnable,
+    cache: LlmResponseCache,
+    output_type: Type[Output],
+    model: dict[str, Any],
+    config: dict[str, Any],
+    bypass: bool = False,
+) -> Runnable:
+    """Wraps a runnable from a prompt to `output_type` with the response cache.
+
+    `bypass` skips the lookup but still stores the fresh response.
+    """
+    config = {**config, "output": output_type.schema()}
+
+    def invoke(prompt: PromptValue) -> Output:
+        key = prompt_key(model, prompt.to_string(), config)
+        if not bypass:
+            response = cache.get(key)
+            if response is not None:
+                return output_type.parse_raw(response)
+            if REPLAY:
+                raise LlmCacheMissError(f"No cached {output_type.__name__} for {key}")
+        output = runnable.invoke(prompt)
+        cache.put(key, output.json())
+        return output
+
+    return RunnableLambda(invoke)
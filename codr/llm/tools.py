@@ -5,6 +5,7 @@ from langchain_core.pydantic_v1 import BaseModel, Field
 from langchain_core.tools import BaseTool
 from pydantic import BaseModel
 
+from codr.indexing.lexical import parse_symbol_query
 from codr.llm.documents import document_storage
 
 
@@ -29,7 +30,7 @@ class DocumentInspectionTool(BaseTool):
 
     def _run(self, path: str) -> Any:
         """This function inspects the document, it returns the python file"""
-        return document_storage.documents.get(path, None)
+        return document_storage.get(path)
 
     async def _arun(self, path: str) -> Any:
         return await self._run(path)
@@ -87,18 +88,24 @@ class LineNumberSearchTool(BaseTool):
     """Tool that is useful for finding the line numbers of the start and the end of a specific text in a file"""
 
     name: str = "line-number-search-tool"
-    description: str = "useful for finding the line numbers of the start and the end of a specific text in a file"
+    description: str = "useful for finding the line numbers of the start and the end of a specific text in a file, counted from 1, or -1 if the text is not found"
     args_schema: type[BaseModel] = LineNumberSearchInput
     verbose = True
 
     def _run(self, file_path: str, text: str) -> Any:
-        # Check if the file content is in the document_storage.documents dictionary
-        if file_path not in document_storage.documents:
-            # If the file is not in document_storage.documents, initialize it with an empty string
-            document_storage.documents[file_path] = ""
-
-        # Read the contents from the document_storage.documents dictionary
-        content = document_storage.documents[file_path]
+        # The span of a symbol defined in the file comes from the symbol index
+        symbol = parse_symbol_query(text)
+        if symbol is not None and document_storage.symbols is not None:
+            for definition in document_storage.symbols.lookup(symbol):
+                if definition.path == file_path:
+                    return {
+                        "file_path": file_path,
+                        "line_start": definition.start_line,
+                        "line_end": definition.end_line,
+                    }
+
+        # Read the contents from the document storage, falling back to the blob store
+        content = document_storage.get(file_path) or ""
 
         # Split the content into lines
         lines = content.split("\n")
@@ -107,8 +114,8 @@ class LineNumberSearchTool(BaseTool):
         start_line_number = -1
         end_line_number = -1
 
-        # Iterate over the lines to find the start and end line numbers
-        for i, line in enumerate(lines):
+        # Iterate over the lines to find the start and end line numbers, counted from 1
+        for i, line in enumerate(lines, start=1):
             if text in line:
                 if start_line_number == -1:
                     start_line_number = i
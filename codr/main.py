@@ -25,9 +25,8 @@ class Codr:
             storage=SqlCodebaseStorage(), vector_db=ChromaDb(), repo_client=repo_client
         )
         codebase_service.create_embeddings(slug=repo_slug)
-        relevant_files = codebase_service.get_relevant_files(task_description)
         code_changes = codebase_service.get_code_changes(
-            task_description, relevant_files
+            task_description, sha=repo_client.sha, repo=repo_slug
         )
         codebase_service.apply_code_changes(code_changes=code_changes)
 
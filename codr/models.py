@@ -46,6 +46,32 @@ class RepoModel(Base):
     embeddings_created: Mapped[bool] = mapped_column(default=False)
 
 
+class IndexedCommitModel(Base):
+    __tablename__ = "indexed_commits"
+    id: Mapped[str] = mapped_column(primary_key=True, default=new_uuid)
+    owner: Mapped[str]
+    name: Mapped[str]
+    sha: Mapped[str]
+    # Loaded only on request, listings of commits never need it
+    manifest: Mapped[dict[str, str]] = mapped_column(JSON, default=dict, deferred=True)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+
+
+class IndexJobModel(Base):
+    __tablename__ = "index_jobs"
+    id: Mapped[str] = mapped_column(primary_key=True, default=new_uuid)
+    user_id: Mapped[str]
+    repo_id: Mapped[str]
+    ref: Mapped[str | None]
+    status: Mapped[str]
+    files: Mapped[int] = mapped_column(default=0)
+    chunks: Mapped[int] = mapped_column(default=0)
+    embeddings: Mapped[int] = mapped_column(default=0)
+    error: Mapped[str | None]
+    created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    updated_at: Mapped[datetime] = mapped_column(default=datetime.now)
+
+
 class VersionControlInfoModel(Base):
     __tablename__ = "version_control_info"
     id: Mapped[str] = mapped_column(primary_key=True, default=new_uuid)
@@ -0,0 +1,196 @@
+import math
+import os
+import tempfile
+from dataclasses import dataclass
+
+import numpy as np
+
+from codr.logger import logger
+
+# Rows assigned to centroids at once, bounds the size of the distance matrix
+ASSIGN_BATCH_SIZE = 16384
+
+
+def normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Returns the column indices of the `k` highest scores of every row, best first."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(
+        -np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable"
+    )
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+@dataclass
+class IvfParams:
+    # Defaults to 4 * sqrt(rows) at training time
+    n_lists: int | None = None
+    n_probe: int = 8
+    train_iterations: int = 10
+    training_points_per_list: int = 64
+    # Smaller indexes are searched exactly
+    min_rows: int = 20_000
+    seed: int = 0
+
+    def lists_for(self, rows: int) -> int:
+        return self.n_lists or max(1, min(rows, int(4 * math.sqrt(rows))))
+
+
+class IvfFlatIndex:
+    """Inverted file index over unit length vectors, scored by inner product.
+
+    Training runs spherical k-means on a sample to find `n_lists` centroids,
+    and every vector is stored uncompressed in the list of its nearest
+    centroid. A search only scores the vectors in the `n_probe` lists whose
+    centroids are closest to the query, trading recall for speed. Vectors can
+    be added at any time after training, without touching the centroids.
+    """
+
+    def __init__(self, params: IvfParams | None = None) -> None:
+        self.params = params or IvfParams()
+        self.centroids: np.ndarray | None = None
+        self.__vectors: list[np.ndarray] = []
+        self.__ids: list[np.ndarray] = []
+        self.__sizes: list[int] = []
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self) -> int:
+        return sum(self.__sizes)
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), ASSIGN_BATCH_SIZE):
+            batch = np.asarray(vectors[start : start + ASSIGN_BATCH_SIZE])
+            assignments[start : start + len(batch)] = np.argmax(
+                batch @ self.centroids.T, axis=1  # type: ignore[union-attr]
+            )
+        return assignments
+
+    def train(self, vectors: np.ndarray) -> None:
+        n_lists = self.params.lists_for(len(vectors))
+        rng = np.random.default_rng(self.params.seed)
+        sample_size = min(len(vectors), n_lists * self.params.training_points_per_list)
+        sample = np.asarray(
+            vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))],
+            dtype=np.float32,
+        )
+        self.centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+        for _ in range(self.params.train_iterations):
+            assignments = self._assign(sample)
+            order = np.argsort(assignments, kind="stable")
+            lists, first = np.unique(assignments[order], return_index=True)
+            sums = np.zeros_like(self.centroids)
+            sums[lists] = np.add.reduceat(sample[order], first, axis=0)
+            empty = np.ones(n_lists, dtype=bool)
+            empty[lists] = False
+            # Empty lists are restarted on random points
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            self.centroids = normalize(sums).astype(np.float32)
+
+        self.__vectors = [
+            np.empty((0, vectors.shape[1]), dtype=np.float32) for _ in range(n_lists)
+        ]
+        self.__ids = [np.empty(0, dtype=np.int64) for _ in range(n_lists)]
+        self.__sizes = [0] * n_lists
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray | None = None) -> None:
+        if not self.trained:
+            raise ValueError("The index has to be trained before adding vectors")
+        if ids is None:
+            ids = np.arange(len(self), len(self) + len(vectors))
+        for start in range(0, len(vectors), ASSIGN_BATCH_SIZE):
+            batch = np.asarray(
+                vectors[start : start + ASSIGN_BATCH_SIZE], dtype=np.float32
+            )
+            batch_ids = ids[start : start + len(batch)]
+            assignments = self._assign(batch)
+            order = np.argsort(assignments, kind="stable")
+            lists, first = np.unique(assignments[order], return_index=True)
+            for list_id, rows in zip(lists, np.split(order, first[1:])):
+                self._append(int(list_id), batch[rows], batch_ids[rows])
+
+    def _append(self, list_id: int, vectors: np.ndarray, ids: np.ndarray) -> None:
+        size = self.__sizes[list_id]
+        capacity = len(self.__ids[list_id])
+        if size + len(ids) > capacity:
+            # Capacity doubles so repeated inserts stay amortised constant time
+            capacity = max(size + len(ids), 2 * capacity, 16)
+            grown_vectors = np.empty((capacity, vectors.shape[1]), dtype=np.float32)
+            grown_vectors[:size] = self.__vectors[list_id][:size]
+            grown_ids = np.empty(capacity, dtype=np.int64)
+            grown_ids[:size] = self.__ids[list_id][:size]
+            self.__vectors[list_id] = grown_vectors
+            self.__ids[list_id] = grown_ids
+        self.__vectors[list_id][size : size + len(ids)] = vectors
+        self.__ids[list_id][size : size + len(ids)] = ids
+        self.__sizes[list_id] = size + len(ids)
+
+    def search(
+        self, queries: np.ndarray, k: int, n_probe: int | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the scores and ids of the best `k` vectors per query.
+
+        Rows are padded with -inf and -1 when the probed lists hold fewer
+        than `k` vectors.
+        """
+        if not self.trained:
+            raise ValueError("The index has to be trained before searching")
+        n_probe = min(n_probe or self.params.n_probe, len(self.__sizes))
+        probes = top_k(queries @ self.centroids.T, n_probe)  # type: ignore[union-attr]
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for q, query in enumerate(queries):
+            lists = [int(l) for l in probes[q] if self.__sizes[l]]
+            if not lists:
+                continue
+            candidate_scores = np.concatenate(
+                [self.__vectors[l][: self.__sizes[l]] @ query for l in lists]
+            )
+            candidate_ids = np.concatenate(
+                [self.__ids[l][: self.__sizes[l]] for l in lists]
+            )
+            best = top_k(candidate_scores[None, :], k)[0]
+            scores[q, : len(best)] = candidate_scores[best]
+            ids[q, : len(best)] = candidate_ids[best]
+        return scores, ids
+
+    def save(self, path: str) -> None:
+        if not self.trained:
+            raise ValueError("Only a trained index can be saved")
+        directory = os.path.dirname(path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".npz")
+        with os.fdopen(fd, "wb") as file:
+            np.savez(
+                file,
+                centroids=self.centroids,
+                sizes=np.asarray(self.__sizes, dtype=np.int64),
+                vectors=np.concatenate(
+                    [v[:s] for v, s in zip(self.__vectors, self.__sizes)]
+                ),
+                ids=np.concatenate([i[:s] for i, s in zip(self.__ids, self.__sizes)]),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, params: IvfParams | None = None) -> "IvfFlatIndex":
+        index = cls(params)
+        with np.load(path) as data:
+            index.centroids = data["centroids"]
+            sizes = data["sizes"]
+            splits = np.cumsum(sizes)[:-1]
+            index.__vectors = np.split(data["vectors"], splits)
+            index.__ids = np.split(data["ids"], splits)
+            index.__sizes = [int(size) for size in sizes]
+        logger.info(f"Loaded IVF index with {len(index)} vectors from {path}")
+        return index
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import math
+import mmap
+import os
+import tempfile
+import time
+
+from codr.storage.embedding_cache import TtlLruCache
+from codr.utils import DATA_DIR
+
+Manifest = dict[str, str]
+
+# Blobs are written before the manifest referencing them, younger ones are never collected
+GARBAGE_COLLECTION_GRACE_PERIOD = 60 * 60
+# Manifests of the commits read most recently kept in memory
+MANIFEST_CACHE_SIZE = 32
+
+
+def git_blob_sha(content: bytes) -> str:
+    """Computes the sha git uses for a blob with this content."""
+    header = f"blob {len(content)}\0".encode("utf-8")
+    return hashlib.sha1(header + content).hexdigest()
+
+
+class BlobStore:
+    """Content addressed file store keyed by git blob sha.
+
+    Every commit has a manifest mapping its paths to blob shas, so a file that
+    does not change between commits is stored once. Blobs are read through
+    mmap and handed out as memoryviews without copying.
+    """
+
+    def __init__(
+        self,
+        root: str = os.path.join(DATA_DIR, "blobs"),
+        manifest_cache_size: int = MANIFEST_CACHE_SIZE,
+    ) -> None:
+        self.root = root
+        # Manifests of a commit never change once written, so they never expire
+        self.__manifests: TtlLruCache[Manifest] = TtlLruCache(
+            max_entries=manifest_cache_size, ttl=math.inf
+        )
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(root, "manifests"), exist_ok=True)
+
+    def _blob_path(self, blob_sha: str) -> str:
+        return os.path.join(self.root, "objects", blob_sha[:2], blob_sha[2:])
+
+    def _manifest_path(self, sha: str) -> str:
+        return os.path.join(self.root, "manifests", f"{sha}.json")
+
+    def _write_atomic(self, path: str, content: bytes) -> None:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, "wb") as file:
+            file.write(content)
+        os.replace(tmp_path, path)
+
+    def has(self, blob_sha: str) -> bool:
+        return os.path.exists(self._blob_path(blob_sha))
+
+    def put(self, content: bytes) -> str:
+        blob_sha = git_blob_sha(content)
+        try:
+            # Refreshed so garbage collection spares it until the new manifest is written
+            os.utime(self._blob_path(blob_sha))
+        except FileNotFoundError:
+            self._write_atomic(self._blob_path(blob_sha), content)
+        return blob_sha
+
+    def put_manifest(self, sha: str, manifest: Manifest) -> None:
+        self._write_atomic(
+            self._manifest_path(sha), json.dumps(manifest).encode("utf-8")
+        )
+        self.__manifests.put(sha, manifest)
+
+    def get_manifest(self, sha: str) -> Manifest | None:
+        manifest = self.__manifests.get(sha)
+        if manifest is None:
+            try:
+                with open(self._manifest_path(sha), "rb") as file:
+                    manifest = json.load(file)
+            except FileNotFoundError:
+                return None
+            self.__manifests.put(sha, manifest)
+        return manifest
+
+    def open_blob(self, blob_sha: str) -> memoryview | None:
+        try:
+            with open(self._blob_path(blob_sha), "rb") as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    return memoryview(b"")
+                # The mapping stays valid after the file is closed
+                return memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        except FileNotFoundError:
+            return None
+
+    def open_file(self, sha: str, path: str) -> memoryview | None:
+        manifest = self.get_manifest(sha)
+        if manifest is None or path not in manifest:
+            return None
+        return self.open_blob(manifest[path])
+
+    def read_file(self, sha: str, path: str) -> str | None:
+        blob = self.open_file(sha, path)
+        if blob is None:
+            return None
+        return str(blob, "utf-8")
+
+    def drop_manifest(self, sha: str) -> int:
+        """Forgets the files of `sha`, their blobs are freed by `collect_garbage`."""
+        self.__manifests.invalidate(lambda key: key == sha)
+        path = self._manifest_path(sha)
+        try:
+            reclaimed = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+        return reclaimed
+
+    def collect_garbage(
+        self, grace_period: float = GARBAGE_COLLECTION_GRACE_PERIOD
+    ) -> int:
+        """Deletes the blobs no manifest references and returns the bytes freed."""
+        referenced = set()
+        manifests = os.path.join(self.root, "manifests")
+        for name in os.listdir(manifests):
+            if not name.endswith(".json"):
+                continue
+            # Read past the cache, which would otherwise end up holding every manifest
+            try:
+                with open(os.path.join(manifests, name), "rb") as file:
+                    referenced.update(json.load(file).values())
+            except FileNotFoundError:
+                continue
+
+        cutoff = time.time() - grace_period
+        reclaimed = 0
+        objects = os.path.join(self.root, "objects")
+        for prefix in os.listdir(objects):
+            for rest in os.listdir(os.path.join(objects, prefix)):
+                path = os.path.join(objects, prefix, rest)
+                if prefix + rest in referenced:
+                    continue
+                try:
+                    stat = os.stat(path)
+                    if stat.st_mtime > cutoff:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                reclaimed += stat.st_size
+        return reclaimed
@@ -0,0 +1,233 @@
+import glob
+import json
+import os
+import threading
+
+import numpy as np
+
+from codr.logger import logger
+
+# A base is rewritten without its unreferenced rows once they make up this fraction
+GARBAGE_FRACTION = 0.25
+
+
+class PooledRows:
+    """Matrix of pooled vectors read from the memory mapped bases on indexing.
+
+    Only the (base, row) location of every row is held in memory, so a sha
+    costs 16 bytes per chunk until its rows are read.
+    """
+
+    def __init__(
+        self, bases: list[np.ndarray], locations: np.ndarray, dimensions: int
+    ) -> None:
+        self.bases = bases
+        self.locations = locations
+        self.shape = (len(locations), dimensions)
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the rows once read."""
+        return self.shape[0] * self.shape[1] * 4
+
+    def __getitem__(self, rows: slice | np.ndarray | list[int]) -> np.ndarray:
+        """Copies `rows` into one matrix, in order."""
+        locations = self.locations[rows]
+        matrix = np.empty((len(locations), self.shape[1]), dtype=np.float32)
+        for number in np.unique(locations[:, 0]):
+            positions = np.flatnonzero(locations[:, 0] == number)
+            base_rows = locations[positions, 1]
+            # Sorted rows keep the reads from the memory map sequential
+            order = np.argsort(base_rows)
+            matrix[positions[order]] = self.bases[number][base_rows[order]]
+        return matrix
+
+
+class ChunkPool:
+    """Content addressed store of chunk embeddings shared by every sha.
+
+    Each distinct chunk is stored once under its content key, and shas refer
+    to chunks by key. Vectors are appended as small segments, which are
+    merged into one memory mapped base on the next read.
+
+    Reference counts are kept as a snapshot plus an append-only log of
+    deltas, folded into the snapshot on the next read. When a base holds too
+    many chunks that no sha references anymore, it is rewritten without
+    them.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.__lock = threading.RLock()
+        # Keys of every stored vector, including unmerged segments
+        self.__known: set[str] | None = None
+        # Loaded bases and where every key lives in them
+        self.__bases: list[np.ndarray] | None = None
+        self.__base_keys: list[list[str]] = []
+        self.__locations: dict[str, tuple[int, int]] = {}
+        self.__refcounts: dict[str, int] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _parts(self, prefix: str) -> list[str]:
+        return sorted(
+            path.removesuffix(".npy")
+            for path in glob.glob(self._path(f"{prefix}-*.npy"))
+        )
+
+    @staticmethod
+    def _read_keys(part: str) -> list[str]:
+        with open(f"{part}.json") as file:
+            return json.load(file)
+
+    def _write_part(self, part: str, keys: list[str], vectors: np.ndarray) -> None:
+        with open(f"{part}.json", "w") as file:
+            json.dump(keys, file)
+        # The .npy file is written last, a part only counts once it exists
+        with open(f"{part}.npy.tmp", "wb") as file:
+            np.save(file, vectors.astype(np.float32))
+        os.replace(f"{part}.npy.tmp", f"{part}.npy")
+
+    def _next_part(self, prefix: str) -> str:
+        parts = self._parts(prefix)
+        number = int(parts[-1].rsplit("-", 1)[1]) + 1 if parts else 0
+        return self._path(f"{prefix}-{number:06d}")
+
+    def known(self) -> set[str]:
+        with self.__lock:
+            if self.__known is None:
+                self.__known = set()
+                for part in self._parts("base") + self._parts("segment"):
+                    self.__known.update(self._read_keys(part))
+            return self.__known
+
+    def missing(self, keys: list[str]) -> list[str]:
+        known = self.known()
+        return list(dict.fromkeys(key for key in keys if key not in known))
+
+    def add(self, keys: list[str], vectors: np.ndarray) -> None:
+        """Stores the vectors of keys that are not stored yet."""
+        with self.__lock:
+            self._write_part(self._next_part("segment"), keys, vectors)
+            self.known().update(keys)
+            self.__bases = None
+
+    def reference(self, keys: list[str], delta: int = 1) -> None:
+        """Adds `delta` references to every occurrence of a key."""
+        counts: dict[str, int] = {}
+        for key in keys:
+            counts[key] = counts.get(key, 0) + delta
+        with self.__lock:
+            with open(self._path("refcounts.log"), "a") as file:
+                file.write(json.dumps(counts) + "\n")
+            if self.__bases is not None:
+                for key, count in counts.items():
+                    self.__refcounts[key] = self.__refcounts.get(key, 0) + count
+
+    def _load_refcounts(self) -> dict[str, int]:
+        try:
+            with open(self._path("refcounts.json")) as file:
+                refcounts = json.load(file)
+        except FileNotFoundError:
+            refcounts = {}
+        log = self._path("refcounts.log")
+        if not os.path.exists(log):
+            return refcounts
+        with open(log) as file:
+            for line in file:
+                if line.strip():
+                    for key, count in json.loads(line).items():
+                        refcounts[key] = refcounts.get(key, 0) + count
+        refcounts = {key: count for key, count in refcounts.items() if count > 0}
+        with open(self._path("refcounts.json.tmp"), "w") as file:
+            json.dump(refcounts, file)
+        os.replace(self._path("refcounts.json.tmp"), self._path("refcounts.json"))
+        os.remove(log)
+        return refcounts
+
+    def _merge_segments(self) -> None:
+        segments = self._parts("segment")
+        if not segments:
+            return
+        keys: list[str] = []
+        vectors = []
+        for segment in segments:
+            keys.extend(self._read_keys(segment))
+            vectors.append(np.load(f"{segment}.npy"))
+        self._write_part(self._next_part("base"), keys, np.concatenate(vectors))
+        for segment in segments:
+            os.remove(f"{segment}.npy")
+            os.remove(f"{segment}.json")
+
+    def _load(self) -> None:
+        if self.__bases is not None:
+            return
+        self._merge_segments()
+        self.__refcounts = self._load_refcounts()
+        self.__bases = []
+        self.__base_keys = []
+        self.__locations = {}
+        for number, base in enumerate(self._parts("base")):
+            keys = self._read_keys(base)
+            self.__bases.append(np.load(f"{base}.npy", mmap_mode="r"))
+            self.__base_keys.append(keys)
+            for row, key in enumerate(keys):
+                self.__locations[key] = (number, row)
+
+    def rows(self, keys: list[str]) -> PooledRows:
+        """Locates the vectors of `keys`, in order, without reading them."""
+        with self.__lock:
+            self._load()
+            bases = list(self.__bases)  # type: ignore[arg-type]
+            locations = np.asarray(
+                [self.__locations[key] for key in keys], dtype=np.int64
+            ).reshape(len(keys), 2)
+        dimensions = bases[0].shape[1] if bases else 0
+        # Bases rewritten later stay mapped until the rows are dropped
+        return PooledRows(bases, locations, dimensions)
+
+    def gather(self, keys: list[str]) -> np.ndarray:
+        """Copies the vectors of `keys` into one matrix, in order."""
+        return self.rows(keys)[:]
+
+    def refcount(self, key: str) -> int:
+        with self.__lock:
+            self._load()
+            return self.__refcounts.get(key, 0)
+
+    def collect_garbage(self, fraction: float = GARBAGE_FRACTION) -> int:
+        """Rewrites the bases with too many unreferenced chunks, returns the bytes freed."""
+        with self.__lock:
+            self.__bases = None
+            self._load()
+            reclaimed = 0
+            for base, keys in zip(self._parts("base"), list(self.__base_keys)):
+                live = [row for row, key in enumerate(keys) if key in self.__refcounts]
+                if len(live) > len(keys) * (1 - fraction):
+                    continue
+                size = os.path.getsize(f"{base}.npy") + os.path.getsize(f"{base}.json")
+                if live:
+                    vectors = np.load(f"{base}.npy", mmap_mode="r")
+                    replacement = self._next_part("base")
+                    self._write_part(
+                        replacement,
+                        [keys[row] for row in live],
+                        np.asarray(vectors[live]),
+                    )
+                    del vectors
+                    size -= os.path.getsize(f"{replacement}.npy")
+                    size -= os.path.getsize(f"{replacement}.json")
+                os.remove(f"{base}.npy")
+                os.remove(f"{base}.json")
+                reclaimed += size
+                logger.info(
+                    f"Freed {len(keys) - len(live)} unreferenced chunks from {base}"
+                )
+            self.__bases = None
+            self.__known = None
+            return reclaimed
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import Any
 
 from codr.storage.utils import E
 from codr.utils import Id
@@ -24,3 +25,11 @@ class DAO(ABC):
     @abstractmethod
     def get_by(self, **kwargs) -> E:
         raise NotImplementedError
+
+    @abstractmethod
+    def list_by(self, **kwargs) -> list[E]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_value(self, id_: Id, column: str) -> Any:
+        raise NotImplementedError
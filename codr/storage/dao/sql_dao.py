@@ -1,6 +1,6 @@
-from typing import Generator, Generic
+from typing import Any, Generator, Generic
 
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Query, Session
 
 from codr.models import Base
 from codr.storage.dao.abstract_dao import DAO
@@ -15,18 +15,33 @@ class SqlDAO(DAO):
         self.__session = session
         self.__mapper = mapper
 
+    def _query(self) -> Query:
+        # Rows can be written from another thread's session, e.g. by the index worker
+        return self.__session.query(self.__model).populate_existing()
+
     def insert(self, entity: type[E]) -> None:
         self.__session.add(self.__mapper.to_model(entity))
         self.__session.commit()
 
     def get(self, id_: Id) -> E:
-        model = self.__session.query(self.__model).filter_by(id=id_).first()
+        model = self._query().filter_by(id=id_).first()
         return self.__mapper.to_entity(model)
 
     def get_by(self, **kwargs) -> E:
-        model = self.__session.query(self.__model).filter_by(**kwargs).first()
+        model = self._query().filter_by(**kwargs).first()
         return self.__mapper.to_entity(model)
 
+    def list_by(self, **kwargs) -> list[E]:
+        models = self._query().filter_by(**kwargs).all()
+        return [self.__mapper.to_entity(model) for model in models]
+
+    def get_value(self, id_: Id, column: str) -> Any:
+        return (
+            self.__session.query(getattr(self.__model, column))
+            .filter_by(id=id_)
+            .scalar()
+        )
+
     def update(self, entity: E) -> E:
         stored_entity = self.get(entity.id)
         if stored_entity is None:
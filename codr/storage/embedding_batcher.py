@@ -0,0 +1,218 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable
+
+from openai import APIConnectionError, APIStatusError
+
+from codr.logger import logger
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+Embedding = list[float]
+
+# Limits of the OpenAI embeddings endpoint, with headroom for estimation errors
+MAX_BATCH_SIZE = 2048
+MAX_BATCH_TOKENS = 250_000
+MAX_INPUT_TOKENS = 8191
+
+
+class TokenEstimator:
+    """Counts tokens with tiktoken when it is installed, else assumes ~4 characters per token.
+
+    The encoding is loaded on first use, as tiktoken may have to download it.
+    """
+
+    def __init__(self, model: str) -> None:
+        self.model = model
+        self.__encoding = None
+        self.__loaded = tiktoken is None
+
+    def _load(self) -> None:
+        self.__loaded = True
+        try:
+            try:
+                self.__encoding = tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                self.__encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"Unable to load tiktoken encoding, estimating tokens: {e}")
+
+    def __call__(self, text: str) -> int:
+        if not self.__loaded:
+            self._load()
+        if self.__encoding is None:
+            return len(text) // 4 + 1
+        return len(self.__encoding.encode(text, disallowed_special=()))
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, APIConnectionError)
+
+
+def get_retry_after(error: Exception) -> float | None:
+    if not isinstance(error, APIStatusError):
+        return None
+    retry_after = error.response.headers.get("retry-after")
+    try:
+        return float(retry_after) if retry_after is not None else None
+    except ValueError:
+        return None
+
+
+@dataclass
+class EmbeddingThroughput:
+    chunks: int = 0
+    tokens: int = 0
+    requests: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.chunks} chunks, {self.tokens} tokens in {self.requests} requests "
+            f"({self.retries} retries) in {self.seconds:.2f}s: "
+            f"{self.chunks_per_second:.1f} chunks/s, {self.tokens_per_second:.0f} tokens/s"
+        )
+
+
+class EmbeddingBatcher:
+    """Packs texts into token bounded batches and embeds them on a worker pool.
+
+    Texts above the input limit are truncated to it. The pool is shared by
+    every call, so concurrent callers never run more than `max_workers`
+    requests at a time. Batches that fail with a rate limit, server or
+    connection error are retried with exponential backoff, honouring
+    Retry-After when present. Embeddings are returned in the order of the
+    input texts.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[list[str]], list[Embedding]],
+        estimate_tokens: Callable[[str], int],
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_batch_tokens: int = MAX_BATCH_TOKENS,
+        max_input_tokens: int = MAX_INPUT_TOKENS,
+        max_workers: int = 4,
+        max_retries: int = 6,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ) -> None:
+        self.__embed = embed
+        self.__estimate_tokens = estimate_tokens
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_input_tokens = max_input_tokens
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.throughput = EmbeddingThroughput()
+        self.__lock = threading.Lock()
+        self.__executor: ThreadPoolExecutor | None = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self.__lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="embed"
+                )
+            return self.__executor
+
+    def fit(self, text: str) -> tuple[str, int]:
+        """Truncates `text` to the input limit, returns it with its estimated token count."""
+        tokens = self.__estimate_tokens(text)
+        if tokens <= self.max_input_tokens:
+            return text, tokens
+        logger.warning(
+            f"Input has ~{tokens} tokens, truncating it to the {self.max_input_tokens} token limit"
+        )
+        while tokens > self.max_input_tokens:
+            text = text[
+                : min(len(text) * self.max_input_tokens // tokens, len(text) - 1)
+            ]
+            tokens = self.__estimate_tokens(text)
+        return text, tokens
+
+    def batches(self, tokens: list[int]) -> list[tuple[list[int], int]]:
+        """Groups the indices of inputs of `tokens` tokens into batches, with their token count."""
+        batches = []
+        indices: list[int] = []
+        batch_tokens = 0
+        for index, text_tokens in enumerate(tokens):
+            if indices and (
+                len(indices) >= self.max_batch_size
+                or batch_tokens + text_tokens > self.max_batch_tokens
+            ):
+                batches.append((indices, batch_tokens))
+                indices, batch_tokens = [], 0
+            indices.append(index)
+            batch_tokens += text_tokens
+        if indices:
+            batches.append((indices, batch_tokens))
+        return batches
+
+    def _embed_with_retries(self, texts: list[str]) -> list[Embedding]:
+        attempt = 0
+        while True:
+            with self.__lock:
+                self.throughput.requests += 1
+            try:
+                return self.__embed(texts)
+            except Exception as error:
+                if attempt >= self.max_retries or not is_retryable(error):
+                    raise
+                delay = get_retry_after(error) or min(
+                    self.backoff * 2**attempt, self.max_backoff
+                )
+                attempt += 1
+                with self.__lock:
+                    self.throughput.retries += 1
+                logger.warning(
+                    f"Embedding request failed ({error}), retry {attempt} in {delay:.1f}s"
+                )
+                time.sleep(delay)
+
+    def __call__(self, texts: list[str]) -> list[Embedding]:
+        if not texts:
+            return []
+        start = time.perf_counter()
+        texts, tokens = map(list, zip(*(self.fit(text) for text in texts)))
+        batches = self.batches(tokens)
+        embeddings: list[Embedding | None] = [None] * len(texts)
+        executor = self._get_executor()
+        futures = [
+            (
+                indices,
+                executor.submit(self._embed_with_retries, [texts[i] for i in indices]),
+            )
+            for indices, _ in batches
+        ]
+        for indices, future in futures:
+            for index, embedding in zip(indices, future.result()):
+                embeddings[index] = embedding
+
+        seconds = time.perf_counter() - start
+        with self.__lock:
+            self.throughput.chunks += len(texts)
+            self.throughput.tokens += sum(tokens for _, tokens in batches)
+            self.throughput.seconds += seconds
+        logger.info(
+            f"Embedded {len(texts)} chunks in {len(batches)} batches in {seconds:.2f}s, total: {self.throughput}"
+        )
+        return embeddings  # type: ignore[return-value]
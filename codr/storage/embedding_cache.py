@@ -0,0 +1,287 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Generic, Hashable, Protocol, TypeVar
+
+from codr.logger import logger
+from codr.utils import DATA_DIR
+
+DEFAULT_MAX_BYTES = 2 * 1024**3
+# Evict down to this fraction of the limit so eviction does not run on every insert
+EVICTION_TARGET = 0.9
+QUERY_CACHE_SIZE = 10_000
+QUERY_CACHE_TTL = 24 * 60 * 60
+
+Embedding = list[float]
+Value = TypeVar("Value")
+
+
+class EmbeddingFunction(Protocol):
+    model: str
+    # None when the model's full size is used
+    dimensions: int | None
+
+    def __call__(self, input: list[str]) -> list[Embedding]:
+        ...
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.hits} hits, {self.misses} misses ({self.hit_rate:.1%} hit rate), "
+            f"{self.evictions} evictions"
+        )
+
+
+def content_key(model: str, text: str, dimensions: int | None = None) -> str:
+    if dimensions is not None:
+        model = f"{model}\0{dimensions}"
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by the content hash of a chunk and the model.
+
+    Shortened embeddings of a model are keyed by their dimensions as well.
+    Entries are shared across shas, repositories and forks. The least recently
+    used entries are evicted once the stored vectors exceed `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        path: str = os.path.join(DATA_DIR, "embedding_cache.sqlite"),
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        self.__connection.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+            """
+        )
+        self.__size = self.__connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    def get_many(
+        self, model: str, texts: list[str], dimensions: int | None = None
+    ) -> list[Embedding | None]:
+        keys = [content_key(model, text, dimensions) for text in texts]
+        found: dict[str, Embedding] = {}
+        with self.__lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start : start + 500]
+                rows = self.__connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = array("f", vector).tolist()
+            now = time.time()
+            self.__connection.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+            self.__connection.commit()
+            self.stats.hits += sum(1 for key in keys if key in found)
+            self.stats.misses += sum(1 for key in keys if key not in found)
+        return [found.get(key) for key in keys]
+
+    def put_many(
+        self,
+        model: str,
+        texts: list[str],
+        embeddings: list[Embedding],
+        dimensions: int | None = None,
+    ) -> None:
+        now = time.time()
+        rows = []
+        for text, embedding in zip(texts, embeddings):
+            vector = array("f", embedding).tobytes()
+            rows.append(
+                (content_key(model, text, dimensions), vector, len(vector), now)
+            )
+        with self.__lock:
+            for key, _, size, _ in rows:
+                previous = self.__connection.execute(
+                    "SELECT size FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                self.__size += size - (previous[0] if previous else 0)
+            self.__connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            if self.__size > self.max_bytes:
+                self._evict()
+            self.__connection.commit()
+
+    def _evict(self) -> None:
+        target = self.max_bytes * EVICTION_TARGET
+        cursor = self.__connection.execute(
+            "SELECT key, size FROM embeddings ORDER BY last_used ASC"
+        )
+        evicted = []
+        for key, size in cursor:
+            if self.__size <= target:
+                break
+            evicted.append((key,))
+            self.__size -= size
+        self.__connection.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+        self.stats.evictions += len(evicted)
+        logger.info(f"Evicted {len(evicted)} embeddings from the cache")
+
+
+class CachedEmbeddingFunction:
+    """Serves embeddings from the cache and only sends misses to `embedding_function`."""
+
+    def __init__(
+        self, embedding_function: EmbeddingFunction, cache: EmbeddingCache
+    ) -> None:
+        self.embedding_function = embedding_function
+        self.cache = cache
+
+    @property
+    def model(self) -> str:
+        return self.embedding_function.model
+
+    @property
+    def dimensions(self) -> int | None:
+        return self.embedding_function.dimensions
+
+    def __call__(self, input: list[str]) -> list[Embedding]:
+        embeddings = self.cache.get_many(self.model, input, self.dimensions)
+        missing = list(
+            dict.fromkeys(
+                text for text, embedding in zip(input, embeddings) if embedding is None
+            )
+        )
+        if missing:
+            computed = dict(zip(missing, self.embedding_function(missing)))
+            self.cache.put_many(
+                self.model, missing, list(computed.values()), self.dimensions
+            )
+            embeddings = [
+                embedding if embedding is not None else computed[text]
+                for text, embedding in zip(input, embeddings)
+            ]
+        logger.info(f"Embedding cache: {self.cache.stats}")
+        return embeddings
+
+
+class TtlLruCache(Generic[Value]):
+    """In-memory LRU cache whose entries also expire `ttl` seconds after insertion."""
+
+    def __init__(
+        self, max_entries: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self.__entries: OrderedDict[Hashable, tuple[float, Value]] = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get(self, key: Hashable) -> Value | None:
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.__entries[key]
+                    self.stats.evictions += 1
+                self.stats.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.stats.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Value) -> None:
+        with self.__lock:
+            self.__entries[key] = (time.monotonic() + self.ttl, value)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def invalidate(self, matches: Callable[[Any], bool]) -> int:
+        """Removes the entries whose key satisfies the `matches` predicate."""
+        with self.__lock:
+            keys = [key for key in self.__entries if matches(key)]
+            for key in keys:
+                del self.__entries[key]
+        return len(keys)
+
+
+class MemoryCachedEmbeddingFunction:
+    """Keeps the embeddings of recent queries in memory in front of `embedding_function`.
+
+    Meant for query strings, which repeat across tasks, and not for chunks,
+    which would only churn the cache.
+    """
+
+    def __init__(
+        self,
+        embedding_function: EmbeddingFunction,
+        cache: TtlLruCache[Embedding] | None = None,
+    ) -> None:
+        self.embedding_function = embedding_function
+        self.cache: TtlLruCache[Embedding] = cache or TtlLruCache()
+
+    @property
+    def model(self) -> str:
+        return self.embedding_function.model
+
+    @property
+    def dimensions(self) -> int | None:
+        return self.embedding_function.dimensions
+
+    def __call__(self, input: list[str]) -> list[Embedding]:
+        keys = [content_key(self.model, text, self.dimensions) for text in input]
+        embeddings = [self.cache.get(key) for key in keys]
+        missing = list(
+            dict.fromkeys(
+                text for text, embedding in zip(input, embeddings) if embedding is None
+            )
+        )
+        if missing:
+            computed = dict(zip(missing, self.embedding_function(missing)))
+            for text, embedding in computed.items():
+                self.cache.put(
+                    content_key(self.model, text, self.dimensions), embedding
+                )
+            embeddings = [
+                embedding if embedding is not None else computed[text]
+                for text, embedding in zip(input, embeddings)
+            ]
+        logger.info(f"Query embedding cache: {self.cache.stats}")
+        return embeddings  # type: ignore[return-value]
@@ -0,0 +1,73 @@
+import math
+import os
+import tempfile
+
+import numpy as np
+
+from codr.indexing.graph import Adjacency, CodeGraph
+from codr.storage.embedding_cache import TtlLruCache
+from codr.utils import DATA_DIR, partition_name
+
+# Graphs kept loaded, they are a few arrays of integers per sha
+GRAPH_CACHE_SIZE = 32
+
+
+class CodeGraphStore:
+    """Keeps the code graph of every repo and sha as the arrays of its adjacency lists.
+
+    The `cache_size` most recently read graphs stay loaded.
+    """
+
+    def __init__(
+        self,
+        root: str = os.path.join(DATA_DIR, "graphs"),
+        cache_size: int = GRAPH_CACHE_SIZE,
+    ) -> None:
+        self.root = root
+        self.__graphs: TtlLruCache[CodeGraph] = TtlLruCache(cache_size, ttl=math.inf)
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, sha: str, repo: str | None = None) -> str:
+        return os.path.join(self.root, f"{partition_name(repo, sha)}.npz")
+
+    def put(self, sha: str, graph: CodeGraph, repo: str | None = None) -> None:
+        path = self._path(sha, repo)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root)
+        with os.fdopen(fd, "wb") as file:
+            np.savez(
+                file,
+                paths=np.asarray(graph.paths, dtype=np.str_),
+                imports_indptr=graph.imports.indptr,
+                imports_indices=graph.imports.indices,
+                calls_indptr=graph.calls.indptr,
+                calls_indices=graph.calls.indices,
+            )
+        os.replace(tmp_path, path)
+        self.__graphs.put(path, graph)
+
+    def get(self, sha: str, repo: str | None = None) -> CodeGraph | None:
+        path = self._path(sha, repo)
+        cached = self.__graphs.get(path)
+        if cached is not None:
+            return cached
+        try:
+            with np.load(path) as arrays:
+                graph = CodeGraph(
+                    arrays["paths"].tolist(),
+                    Adjacency(arrays["imports_indptr"], arrays["imports_indices"]),
+                    Adjacency(arrays["calls_indptr"], arrays["calls_indices"]),
+                )
+        except FileNotFoundError:
+            return None
+        self.__graphs.put(path, graph)
+        return graph
+
+    def drop(self, sha: str, repo: str | None = None) -> int:
+        path = self._path(sha, repo)
+        self.__graphs.invalidate(lambda key: key == path)
+        try:
+            reclaimed = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+        return reclaimed
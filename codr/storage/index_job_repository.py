@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from codr.application.entities import IndexJob, IndexJobStatus
+from codr.storage.repository import Repository
+from codr.utils import Id
+
+
+class IndexJobRepository(Repository[IndexJob]):
+    def update(self, entity: IndexJob) -> IndexJob:
+        entity.updated_at = datetime.now()
+        return super().update(entity)
+
+    def list_for_repo(self, repo_id: Id) -> list[IndexJob]:
+        jobs = self._dao.list_by(repo_id=repo_id)
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def get_latest_for_repo(self, repo_id: Id) -> IndexJob | None:
+        jobs = self.list_for_repo(repo_id)
+        return jobs[0] if jobs else None
+
+    def get_next_pending(self) -> IndexJob | None:
+        jobs = self._dao.list_by(status=IndexJobStatus.PENDING.value)
+        return min(jobs, key=lambda job: job.created_at, default=None)
+
+    def requeue_running(self) -> list[IndexJob]:
+        """Puts jobs that were interrupted by a restart back into the queue."""
+        jobs = self._dao.list_by(status=IndexJobStatus.RUNNING.value)
+        for job in jobs:
+            job.status = IndexJobStatus.PENDING
+            self.update(job)
+        return jobs
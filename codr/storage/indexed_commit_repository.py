@@ -0,0 +1,26 @@
+from codr.application.entities import IndexedCommit
+from codr.storage.repository import Repository
+from codr.utils import Id
+
+
+class IndexedCommitRepository(Repository[IndexedCommit]):
+    """Indexed commits are read without their manifest, which get_manifest loads."""
+
+    def get_by_identifier_and_sha(
+        self, owner: str, name: str, sha: str
+    ) -> IndexedCommit | None:
+        return self._dao.get_by(owner=owner, name=name, sha=sha)
+
+    def get_manifest(self, id_: Id) -> dict[str, str]:
+        return self._dao.get_value(id_, "manifest") or {}
+
+    def list_all(self) -> list[IndexedCommit]:
+        return self._dao.list_by()
+
+    def list_for_repo(self, owner: str, name: str) -> list[IndexedCommit]:
+        commits = self._dao.list_by(owner=owner, name=name)
+        return sorted(commits, key=lambda commit: commit.created_at, reverse=True)
+
+    def get_latest(self, owner: str, name: str) -> IndexedCommit | None:
+        commits = self.list_for_repo(owner=owner, name=name)
+        return commits[0] if commits else None
@@ -0,0 +1,154 @@
+import json
+import math
+import os
+import tempfile
+from typing import Any
+
+from codr.application.entities import Document
+from codr.indexing.lexical import BM25Index, Metadata, count_terms
+from codr.storage.embedding_cache import TtlLruCache
+from codr.storage.overlay_store import OverlayStore
+from codr.utils import DATA_DIR, copy_joined_lines, partition_name
+
+# Indexes kept loaded, each holds the terms of every chunk of a sha
+LEXICAL_CACHE_SIZE = 8
+
+
+class LexicalIndexStore:
+    """Keeps the BM25 index of every repo and sha as a JSON file.
+
+    The `cache_size` most recently read indexes stay loaded, Dependencies
+    shares one store per process so they survive between requests. The
+    index of an overlay sha is merged with the index of its base on the
+    first read.
+    """
+
+    def __init__(
+        self,
+        root: str = os.path.join(DATA_DIR, "lexical"),
+        overlays: OverlayStore | None = None,
+        cache_size: int = LEXICAL_CACHE_SIZE,
+    ) -> None:
+        self.root = root
+        self.overlays = overlays
+        self.__indexes: TtlLruCache[BM25Index] = TtlLruCache(cache_size, ttl=math.inf)
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, sha: str, repo: str | None = None) -> str:
+        return os.path.join(self.root, f"{partition_name(repo, sha)}.json")
+
+    def put(self, sha: str, index: BM25Index, repo: str | None = None) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.root)
+        with os.fdopen(fd, "w") as file:
+            json.dump({"metadatas": index.metadatas, "terms": index.terms}, file)
+        self._replace(tmp_path, self._path(sha, repo), index)
+
+    def writer(self, sha: str, repo: str | None = None) -> "LexicalIndexWriter":
+        return LexicalIndexWriter(self, sha, repo)
+
+    def _replace(
+        self, tmp_path: str, path: str, index: BM25Index | None = None
+    ) -> None:
+        os.replace(tmp_path, path)
+        # Merged indexes are keyed by the overlay's path and its base's path
+        self.__indexes.invalidate(lambda key: path in key.split("+"))
+        if index is not None:
+            self.__indexes.put(path, index)
+
+    def get(self, sha: str, repo: str | None = None) -> BM25Index | None:
+        overlay = self.overlays.get(sha, repo) if self.overlays is not None else None
+        path = self._path(sha, repo)
+        if overlay is None:
+            return self._load(path)
+        base_path = self._path(overlay.base_sha, repo)
+        key = f"{path}+{base_path}"
+        cached = self.__indexes.get(key)
+        if cached is not None:
+            return cached
+        base = self._load(base_path)
+        delta = self._load(path)
+        if base is None or delta is None:
+            return None
+        index = overlay.merge_lexical(base, delta)
+        self.__indexes.put(key, index)
+        return index
+
+    def _load(self, path: str) -> BM25Index | None:
+        cached = self.__indexes.get(path)
+        if cached is not None:
+            return cached
+        try:
+            with open(path) as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return None
+        index = BM25Index()
+        index.add(data["metadatas"], data["terms"])
+        self.__indexes.put(path, index)
+        return index
+
+    def drop(self, sha: str, repo: str | None = None) -> int:
+        path = self._path(sha, repo)
+        self.__indexes.invalidate(lambda key: path in key.split("+"))
+        try:
+            reclaimed = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+        return reclaimed
+
+
+class LexicalIndexWriter:
+    """Writes the BM25 index of one sha without holding its chunks in memory.
+
+    Chunks are appended to temporary files while the sha is indexed and
+    `commit` streams them into the index file. Nothing is stored unless
+    `commit` is called before the writer is closed.
+    """
+
+    def __init__(self, store: LexicalIndexStore, sha: str, repo: str | None) -> None:
+        self.sha = sha
+        self.__store = store
+        self.__path = store._path(sha, repo)
+        self.__metadatas = tempfile.TemporaryFile("w+", dir=store.root)
+        self.__terms = tempfile.TemporaryFile("w+", dir=store.root)
+
+    def __enter__(self) -> "LexicalIndexWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.__metadatas.close()
+        self.__terms.close()
+
+    def add(self, metadatas: list[Metadata], terms: list[dict[str, int]]) -> None:
+        for metadata, counts in zip(metadatas, terms):
+            self.__metadatas.write(json.dumps(metadata) + "\n")
+            self.__terms.write(json.dumps(counts) + "\n")
+
+    def add_documents(self, documents: list[Document]) -> None:
+        self.add(
+            [document.metadata for document in documents],
+            [count_terms(document.content) for document in documents],
+        )
+
+    def carry_forward(self, previous: BM25Index, sources: set[str]) -> int:
+        rows = [
+            i
+            for i, metadata in enumerate(previous.metadatas)
+            if metadata["source"] in sources
+        ]
+        self.add(
+            [{**previous.metadatas[i], "sha": self.sha} for i in rows],
+            [previous.terms[i] for i in rows],
+        )
+        return len(rows)
+
+    def commit(self) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.__store.root)
+        with os.fdopen(fd, "w") as file:
+            file.write('{"metadatas": [')
+            copy_joined_lines(self.__metadatas, file)
+            file.write('], "terms": [')
+            copy_joined_lines(self.__terms, file)
+            file.write("]}")
+        self.__store._replace(tmp_path, self.__path)
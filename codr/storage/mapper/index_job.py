@@ -0,0 +1,39 @@
+from codr.application.entities import IndexJob, IndexJobStatus
+from codr.models import IndexJobModel
+from codr.storage.mapper.base import Mapper
+
+
+class MapperIndexJob(Mapper):
+    @staticmethod
+    def to_entity(model: IndexJobModel) -> IndexJob | None:
+        if model is None:
+            return None
+        return IndexJob(
+            id=model.id,
+            user_id=model.user_id,
+            repo_id=model.repo_id,
+            ref=model.ref,
+            status=IndexJobStatus[model.status],
+            files=model.files,
+            chunks=model.chunks,
+            embeddings=model.embeddings,
+            error=model.error,
+            created_at=model.created_at,
+            updated_at=model.updated_at,
+        )
+
+    @staticmethod
+    def to_model(entity: IndexJob) -> IndexJobModel:
+        return IndexJobModel(
+            id=entity.id,
+            user_id=entity.user_id,
+            repo_id=entity.repo_id,
+            ref=entity.ref,
+            status=entity.status.value,
+            files=entity.files,
+            chunks=entity.chunks,
+            embeddings=entity.embeddings,
+            error=entity.error,
+            created_at=entity.created_at,
+            updated_at=entity.updated_at,
+        )
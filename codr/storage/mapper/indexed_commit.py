@@ -0,0 +1,36 @@
+from sqlalchemy import inspect
+
+from codr.application.entities import IndexedCommit
+from codr.models import IndexedCommitModel
+from codr.storage.mapper.base import Mapper
+
+
+class MapperIndexedCommit(Mapper):
+    @staticmethod
+    def to_entity(model: IndexedCommitModel) -> IndexedCommit | None:
+        if model is None:
+            return None
+        # The manifest column is deferred, reading it here would load it for every row
+        unloaded = inspect(model).unloaded
+        return IndexedCommit(
+            id=model.id,
+            owner=model.owner,
+            name=model.name,
+            sha=model.sha,
+            manifest=None if "manifest" in unloaded else model.manifest,
+            created_at=model.created_at,
+        )
+
+    @staticmethod
+    def to_model(entity: IndexedCommit) -> IndexedCommitModel:
+        model = IndexedCommitModel(
+            id=entity.id,
+            owner=entity.owner,
+            name=entity.name,
+            sha=entity.sha,
+            created_at=entity.created_at,
+        )
+        # Left unset, merging a commit read without its manifest keeps the stored one
+        if entity.manifest is not None:
+            model.manifest = entity.manifest
+        return model
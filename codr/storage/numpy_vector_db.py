@@ -0,0 +1,535 @@
+import glob
+import hashlib
+import json
+import math
+import os
+import shutil
+import threading
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+
+from codr.application.entities import Document
+from codr.logger import logger
+from codr.storage.ann import IvfFlatIndex, IvfParams, normalize, top_k
+from codr.storage.chunk_pool import ChunkPool, PooledRows
+from codr.storage.embedding_cache import (
+    EmbeddingFunction,
+    MemoryCachedEmbeddingFunction,
+    TtlLruCache,
+    content_key,
+)
+from codr.storage.quantization import Codes, Quantization, Quantizer, get_quantizer
+from codr.storage.vector_db import (
+    ADD_BATCH_SIZE,
+    N_RESULTS,
+    VectorDb,
+    belongs_to,
+    check_embedding_metadata,
+    embedding_creator,
+)
+from codr.utils import DATA_DIR, directory_size
+
+# Directory of the chunk pools next to the sha directories
+POOLS = ".pools"
+# Shas kept loaded, each holds its records, codes or IVF index
+VECTOR_CACHE_SIZE = 8
+
+
+@dataclass
+class ShaIndex:
+    # Unit length float32 rows, read from the chunk pool when indexed
+    embeddings: PooledRows
+    ids: list[str]
+    documents: list[str]
+    metadatas: list[dict[str, Any]]
+    ann: IvfFlatIndex | None = None
+    # Quantized rows kept in memory, the float rows are only read to rescore
+    codes: Codes | None = None
+    # Model and dimensions of the embeddings
+    embedding_metadata: dict[str, Any] = field(default_factory=dict)
+    # Rows of each repo searched so far
+    masks: dict[str | None, np.ndarray | None] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def mask(self, repo: str | None) -> np.ndarray | None:
+        """Flags the rows of `repo`, None if every row belongs to it."""
+        if repo not in self.masks:
+            mask = np.asarray(
+                [belongs_to(metadata, repo) for metadata in self.metadatas], dtype=bool
+            )
+            self.masks[repo] = None if mask.all() else mask
+        return self.masks[repo]
+
+
+class NumpyVectorDb(VectorDb):
+    """In-process vector store searching the float32 rows of one sha at a time.
+
+    Vectors are stored once per distinct chunk in a ChunkPool, keyed by the
+    hash of their content, and a sha only records the keys, documents and
+    metadata of its chunks. Carrying unchanged files forward therefore adds
+    references rather than vectors, and dropping a sha frees the vectors no
+    other sha refers to.
+
+    Every `create` appends a segment of records next to the index of its
+    sha. Segments are merged into a single `records.json` on the next read,
+    which locates the sha's rows in the memory mapped pool. Embeddings are
+    stored with unit length, so an exact query is a matrix product and a
+    top-k selection over cosine similarities, a block of rows at a time.
+
+    With quantization or `coarse_dimensions`, searches score compact codes
+    and rescore a shortlist of `rescore_factor` times the requested results
+    with the float rows.
+
+    The model and dimensions of every sha are recorded in its `index.json`,
+    embeddings that do not match are rejected. The `cache_size` most
+    recently read shas stay loaded.
+    """
+
+    def __init__(
+        self,
+        root: str = os.path.join(DATA_DIR, "vectors"),
+        embedding_function: EmbeddingFunction = embedding_creator,
+        ann: IvfParams | None = None,
+        quantization: Quantization = Quantization.NONE,
+        coarse_dimensions: int | None = None,
+        rescore_factor: int = 4,
+        cache_size: int = VECTOR_CACHE_SIZE,
+    ) -> None:
+        self.root = root
+        self.__embedding_function = embedding_function
+        self.__query_embedding_function = MemoryCachedEmbeddingFunction(
+            embedding_function
+        )
+        self.__ann = ann
+        self.__quantizer = get_quantizer(quantization, coarse_dimensions)
+        self.rescore_factor = rescore_factor
+        self.__indexes: TtlLruCache[ShaIndex] = TtlLruCache(cache_size, ttl=math.inf)
+        self.__pools: dict[str, ChunkPool] = {}
+        self.__lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+
+    def _directory(self, sha: str) -> str:
+        return os.path.join(self.root, sha)
+
+    def _segments(self, sha: str) -> list[str]:
+        return sorted(glob.glob(os.path.join(self._directory(sha), "segment-*.json")))
+
+    def _pool(self, model: str, dimensions: int) -> ChunkPool:
+        # Keys include the model, the pools are split so their rows have one width
+        name = f"{hashlib.sha1(model.encode('utf-8')).hexdigest()[:8]}-{dimensions}"
+        with self.__lock:
+            if name not in self.__pools:
+                self.__pools[name] = ChunkPool(os.path.join(self.root, POOLS, name))
+            return self.__pools[name]
+
+    def _read_embedding_metadata(self, sha: str) -> dict[str, Any]:
+        try:
+            with open(os.path.join(self._directory(sha), "index.json")) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def _write_segment(
+        self,
+        sha: str,
+        ids: list[str],
+        documents: list[str],
+        metadatas: list[dict[str, Any]],
+        dimensions: int,
+        embeddings: np.ndarray | None = None,
+    ) -> None:
+        """Adds chunks to a sha, `ids` are their keys in the pool.
+
+        Chunks the pool already holds only get another reference, so
+        `embeddings` may be None when all of them are known.
+        """
+        with self.__lock:
+            directory = self._directory(sha)
+            os.makedirs(directory, exist_ok=True)
+            model = self.__embedding_function.model
+            recorded = self._read_embedding_metadata(sha)
+            check_embedding_metadata(recorded, model, dimensions)
+            if not recorded:
+                with open(os.path.join(directory, "index.json"), "w") as file:
+                    json.dump({"model": model, "dimensions": dimensions}, file)
+
+            pool = self._pool(model, dimensions)
+            missing = set(pool.missing(ids))
+            if missing:
+                rows = {key: row for row, key in enumerate(ids) if key in missing}
+                pool.add(
+                    list(rows),
+                    normalize(np.asarray(embeddings)[list(rows.values())]),  # type: ignore[index]
+                )
+            # Counted before the records are written, a crash can leak but never free a chunk
+            pool.reference(ids)
+
+            name = os.path.join(directory, f"segment-{len(self._segments(sha)):06d}")
+            with open(f"{name}.json.tmp", "w") as file:
+                json.dump(
+                    {"ids": ids, "documents": documents, "metadatas": metadatas}, file
+                )
+            os.replace(f"{name}.json.tmp", f"{name}.json")
+            self.__indexes.invalidate(lambda key: key == sha)
+
+    def _compact(self, sha: str) -> None:
+        directory = self._directory(sha)
+        main = os.path.join(directory, "records.json")
+        parts = ([main] if os.path.exists(main) else []) + self._segments(sha)
+        records: dict[str, list] = {"ids": [], "documents": [], "metadatas": []}
+        for part in parts:
+            with open(part) as file:
+                part_records = json.load(file)
+            for key in records:
+                records[key].extend(part_records[key])
+        with open(os.path.join(directory, "records.tmp.json"), "w") as file:
+            json.dump(records, file)
+        os.replace(os.path.join(directory, "records.tmp.json"), main)
+        for part in parts:
+            if part != main:
+                os.remove(part)
+
+    def _load(self, sha: str) -> ShaIndex | None:
+        with self.__lock:
+            cached = self.__indexes.get(sha)
+            if cached is not None:
+                return cached
+            directory = self._directory(sha)
+            if self._segments(sha):
+                self._compact(sha)
+            if not os.path.exists(os.path.join(directory, "records.json")):
+                return None
+            with open(os.path.join(directory, "records.json")) as file:
+                records = json.load(file)
+            embedding_metadata = self._read_embedding_metadata(sha)
+            pool = self._pool(
+                embedding_metadata["model"], embedding_metadata["dimensions"]
+            )
+            index = ShaIndex(
+                embeddings=pool.rows(records["ids"]),
+                ids=records["ids"],
+                documents=records["documents"],
+                metadatas=records["metadatas"],
+                embedding_metadata=embedding_metadata,
+            )
+            if self.__ann is not None and len(index) >= self.__ann.min_rows:
+                index.ann = self._load_ann(sha, index)
+            elif self.__quantizer is not None:
+                index.codes = self._load_codes(sha, index, self.__quantizer)
+                logger.info(
+                    f"Loaded {len(index)} {self.__quantizer.name} codes for {sha}: "
+                    f"{self.__quantizer.nbytes(index.codes)} bytes resident, "
+                    f"{index.embeddings.nbytes} bytes as float32"
+                )
+            self.__indexes.put(sha, index)
+            return index
+
+    def _load_codes(self, sha: str, index: ShaIndex, quantizer: Quantizer) -> Codes:
+        path = os.path.join(self._directory(sha), f"codes.{quantizer.name}.npz")
+        codes: Codes = {}
+        if os.path.exists(path):
+            with np.load(path) as data:
+                codes = {key: data[key] for key in data.files}
+        rows = len(next(iter(codes.values()))) if codes else 0
+        if rows < len(index):
+            tail = [
+                quantizer.encode(index.embeddings[start : start + ADD_BATCH_SIZE])
+                for start in range(rows, len(index), ADD_BATCH_SIZE)
+            ]
+            codes = {
+                key: np.concatenate(
+                    ([codes[key]] if codes else []) + [t[key] for t in tail]
+                )
+                for key in tail[0]
+            }
+            with open(f"{path}.tmp", "wb") as file:
+                np.savez(file, **codes)
+            os.replace(f"{path}.tmp", path)
+        return codes
+
+    def _rescore(
+        self,
+        index: ShaIndex,
+        codes: Codes,
+        queries: np.ndarray,
+        n_results: int,
+        mask: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        approximate = self.__quantizer.score(codes, queries)  # type: ignore[union-attr]
+        if mask is not None:
+            approximate[:, ~mask] = -np.inf
+        shortlists = top_k(approximate, n_results * self.rescore_factor)
+        # Rows of -1 pad the queries with fewer rows to rank
+        scores = np.full(
+            (len(queries), min(n_results, len(index))), -np.inf, dtype=np.float32
+        )
+        rows = np.full(scores.shape, -1, dtype=np.int64)
+        for q, shortlist in enumerate(shortlists):
+            # Sorted rows keep the reads sequential
+            shortlist = np.sort(shortlist[np.isfinite(approximate[q, shortlist])])
+            exact = index.embeddings[shortlist] @ queries[q]
+            best = top_k(exact[None, :], n_results)[0]
+            scores[q, : len(best)] = exact[best]
+            rows[q, : len(best)] = shortlist[best]
+        return scores, rows
+
+    def _load_ann(self, sha: str, index: ShaIndex) -> IvfFlatIndex:
+        path = os.path.join(self._directory(sha), "ivf.npz")
+        if os.path.exists(path):
+            ann = IvfFlatIndex.load(path, self.__ann)
+        else:
+            ann = IvfFlatIndex(self.__ann)
+            ann.train(index.embeddings)
+        # Rows are only ever appended, so the rows added since the last save are the tail
+        if len(ann) < len(index):
+            for start in range(len(ann), len(index), ADD_BATCH_SIZE):
+                ann.add(index.embeddings[start : start + ADD_BATCH_SIZE])
+            ann.save(path)
+        return ann
+
+    @staticmethod
+    def _exact(
+        index: ShaIndex,
+        queries: np.ndarray,
+        n_results: int,
+        mask: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Scores every row, reading a block of rows from the pool at a time."""
+        scores = np.empty((len(queries), 0), dtype=np.float32)
+        rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(index), ADD_BATCH_SIZE):
+            block = queries @ index.embeddings[start : start + ADD_BATCH_SIZE].T
+            if mask is not None:
+                block[:, ~mask[start : start + ADD_BATCH_SIZE]] = -np.inf
+            best = top_k(block, n_results)
+            scores = np.concatenate(
+                [scores, np.take_along_axis(block, best, axis=1)], axis=1
+            )
+            rows = np.concatenate([rows, best + start], axis=1)
+            kept = top_k(scores, n_results)
+            scores = np.take_along_axis(scores, kept, axis=1)
+            rows = np.take_along_axis(rows, kept, axis=1)
+        return scores, rows
+
+    def _shas(self, sha: str | None) -> list[str]:
+        if sha is not None:
+            return [sha]
+        return sorted(name for name in os.listdir(self.root) if name != POOLS)
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        return self.__embedding_function(texts)
+
+    def create(
+        self, documents: list[Document], embeddings: list[list[float]] | None = None
+    ) -> None:
+        if not documents:
+            return
+        if embeddings is None:
+            embeddings = self.embed([d.content for d in documents])
+        by_sha: dict[str, list[int]] = {}
+        for i, document in enumerate(documents):
+            by_sha.setdefault(document.sha, []).append(i)
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        model = self.__embedding_function.model
+        dimensions = matrix.shape[1]
+        for sha, rows in by_sha.items():
+            self._write_segment(
+                sha,
+                ids=[
+                    content_key(model, documents[i].content, dimensions) for i in rows
+                ],
+                documents=[documents[i].content for i in rows],
+                metadatas=[documents[i].metadata for i in rows],
+                dimensions=dimensions,
+                embeddings=matrix[rows],
+            )
+
+    def carry_forward(
+        self,
+        source_sha: str,
+        target_sha: str,
+        sources: set[str],
+        repo: str | None = None,
+    ) -> int:
+        index = self._load(source_sha)
+        if index is None:
+            return 0
+        check_embedding_metadata(
+            index.embedding_metadata, self.__embedding_function.model, None
+        )
+        rows = [
+            i
+            for i, metadata in enumerate(index.metadatas)
+            if metadata["source"] in sources and belongs_to(metadata, repo)
+        ]
+        # Only references are copied, the vectors stay in the chunk pool
+        for start in range(0, len(rows), ADD_BATCH_SIZE):
+            batch = rows[start : start + ADD_BATCH_SIZE]
+            self._write_segment(
+                target_sha,
+                ids=[index.ids[i] for i in batch],
+                documents=[index.documents[i] for i in batch],
+                metadatas=[{**index.metadatas[i], "sha": target_sha} for i in batch],
+                dimensions=index.embedding_metadata["dimensions"],
+            )
+        return len(rows)
+
+    def get(self, sha: str, repo: str | None = None) -> list:
+        index = self._load(sha)
+        if index is None:
+            return []
+        mask = index.mask(repo)
+        return list(index.embeddings[:] if mask is None else index.embeddings[mask])
+
+    def _search(
+        self,
+        query_texts: list[str],
+        sha: str | None,
+        n_results: int = N_RESULTS,
+        repo: str | None = None,
+    ) -> dict[str, list[list]]:
+        queries = normalize(
+            np.asarray(self.__query_embedding_function(query_texts), dtype=np.float32)
+        )
+        # Candidates of every sha as (similarity, sha index, row) per query
+        candidates: list[list[tuple[float, ShaIndex, int]]] = [[] for _ in query_texts]
+        for candidate_sha in self._shas(sha):
+            index = self._load(candidate_sha)
+            if index is None or len(index) == 0:
+                continue
+            check_embedding_metadata(
+                index.embedding_metadata,
+                self.__embedding_function.model,
+                queries.shape[1],
+            )
+            mask = index.mask(repo)
+            if mask is not None and not mask.any():
+                continue
+            if index.ann is not None:
+                # The IVF lists hold every repo, the others' rows are fetched over and dropped
+                fetch = n_results
+                if mask is not None:
+                    fetch = n_results * math.ceil(len(index) / int(mask.sum()))
+                scores, rows = index.ann.search(queries, min(fetch, len(index)))
+            elif index.codes is not None:
+                scores, rows = self._rescore(
+                    index, index.codes, queries, n_results, mask
+                )
+            else:
+                scores, rows = self._exact(index, queries, n_results, mask)
+            for q in range(len(query_texts)):
+                candidates[q].extend(
+                    (float(score), index, int(row))
+                    for score, row in zip(scores[q], rows[q])
+                    if row >= 0 and (mask is None or mask[row])
+                )
+
+        results: dict[str, list[list]] = {
+            "ids": [],
+            "documents": [],
+            "metadatas": [],
+            "distances": [],
+        }
+        for query_candidates in candidates:
+            best = sorted(query_candidates, key=lambda c: -c[0])[:n_results]
+            results["ids"].append([index.ids[row] for _, index, row in best])
+            results["documents"].append(
+                [index.documents[row] for _, index, row in best]
+            )
+            results["metadatas"].append(
+                [index.metadatas[row] for _, index, row in best]
+            )
+            results["distances"].append([1.0 - score for score, _, _ in best])
+        return results
+
+    def query(
+        self, query: str, sha: str | None = None, repo: str | None = None
+    ) -> dict[str, list[list]]:
+        return self._search([query], sha=sha, repo=repo)
+
+    def query_texts(
+        self, query_texts: list[str], sha: str | None = None, repo: str | None = None
+    ) -> list:
+        return self._search(query_texts, sha=sha, repo=repo)["metadatas"]
+
+    def query_scores(
+        self,
+        query_texts: list[str],
+        sha: str | None = None,
+        n_results: int = N_RESULTS,
+        repo: str | None = None,
+    ) -> list[list[tuple[float, dict]]]:
+        results = self._search(query_texts, sha=sha, n_results=n_results, repo=repo)
+        return [
+            [(1.0 - distance, metadata) for distance, metadata in zip(d, m)]
+            for d, m in zip(results["distances"], results["metadatas"])
+        ]
+
+    def get_by_metadata(
+        self, key: str, value: str, sha: str | None = None, repo: str | None = None
+    ) -> dict:
+        results: dict[str, list] = {"ids": [], "documents": [], "metadatas": []}
+        for candidate_sha in self._shas(sha):
+            index = self._load(candidate_sha)
+            if index is None:
+                continue
+            for i, metadata in enumerate(index.metadatas):
+                if metadata.get(key) == value and belongs_to(metadata, repo):
+                    results["ids"].append(index.ids[i])
+                    results["documents"].append(index.documents[i])
+                    results["metadatas"].append(metadata)
+        return results
+
+    def drop(self, sha: str, repo: str | None = None) -> int:
+        with self.__lock:
+            index = self._load(sha)
+            self.__indexes.invalidate(lambda key: key == sha)
+            directory = self._directory(sha)
+            reclaimed = directory_size(directory)
+            if index is None:
+                shutil.rmtree(directory, ignore_errors=True)
+                return reclaimed
+            dropped = [
+                i
+                for i, metadata in enumerate(index.metadatas)
+                if belongs_to(metadata, repo)
+            ]
+            if len(dropped) == len(index):
+                shutil.rmtree(directory, ignore_errors=True)
+            else:
+                self._keep(sha, sorted(set(range(len(index))) - set(dropped)), index)
+                reclaimed -= directory_size(directory)
+            pool = self._pool(
+                index.embedding_metadata["model"],
+                index.embedding_metadata["dimensions"],
+            )
+            pool.reference([index.ids[i] for i in dropped], -1)
+            collected = pool.collect_garbage()
+            if collected:
+                # Loaded shas still map the rewritten bases, which keeps their disk space
+                self.__indexes.invalidate(lambda key: True)
+            reclaimed += collected
+        return reclaimed
+
+    def _keep(self, sha: str, rows: list[int], index: ShaIndex) -> None:
+        """Rewrites the records of a sha with only `rows`, its codes and IVF index are rebuilt."""
+        directory = self._directory(sha)
+        records = {
+            "ids": [index.ids[i] for i in rows],
+            "documents": [index.documents[i] for i in rows],
+            "metadatas": [index.metadatas[i] for i in rows],
+        }
+        with open(os.path.join(directory, "records.tmp.json"), "w") as file:
+            json.dump(records, file)
+        os.replace(
+            os.path.join(directory, "records.tmp.json"),
+            os.path.join(directory, "records.json"),
+        )
+        for path in glob.glob(os.path.join(directory, "codes.*.npz")) + glob.glob(
+            os.path.join(directory, "ivf.npz")
+        ):
+            os.remove(path)
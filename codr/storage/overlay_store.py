@@ -0,0 +1,75 @@
+import glob
+import json
+import math
+import os
+import tempfile
+
+from codr.indexing.overlay import Overlay
+from codr.storage.embedding_cache import TtlLruCache
+from codr.utils import DATA_DIR, partition_name
+
+# Overlays kept loaded, each is little more than its tombstoned paths
+OVERLAY_CACHE_SIZE = 256
+
+
+class OverlayStore:
+    """Keeps the overlay of every branch head indexed on top of a base sha.
+
+    An overlay is written after its delta, so a sha only resolves to an
+    overlay once everything it needs is stored. Overlays are kept per repo
+    and sha, as forks index the same shas. The `cache_size` most recently
+    read overlays stay loaded.
+    """
+
+    def __init__(
+        self,
+        root: str = os.path.join(DATA_DIR, "overlays"),
+        cache_size: int = OVERLAY_CACHE_SIZE,
+    ) -> None:
+        self.root = root
+        self.__overlays: TtlLruCache[Overlay] = TtlLruCache(cache_size, ttl=math.inf)
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, sha: str, repo: str | None = None) -> str:
+        return os.path.join(self.root, f"{partition_name(repo, sha)}.json")
+
+    def put(self, overlay: Overlay) -> None:
+        path = self._path(overlay.sha, overlay.repo)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root)
+        with os.fdopen(fd, "w") as file:
+            json.dump(overlay.to_dict(), file)
+        os.replace(tmp_path, path)
+        self.__overlays.put(path, overlay)
+
+    def get(self, sha: str, repo: str | None = None) -> Overlay | None:
+        return self._load(self._path(sha, repo))
+
+    def _load(self, path: str) -> Overlay | None:
+        cached = self.__overlays.get(path)
+        if cached is not None:
+            return cached
+        try:
+            with open(path) as file:
+                overlay = Overlay.from_dict(json.load(file))
+        except FileNotFoundError:
+            return None
+        self.__overlays.put(path, overlay)
+        return overlay
+
+    def list_all(self) -> list[Overlay]:
+        overlays = []
+        for path in sorted(glob.glob(os.path.join(self.root, "*.json"))):
+            overlay = self._load(path)
+            if overlay is not None:
+                overlays.append(overlay)
+        return overlays
+
+    def drop(self, sha: str, repo: str | None = None) -> int:
+        path = self._path(sha, repo)
+        self.__overlays.invalidate(lambda key: key == path)
+        try:
+            reclaimed = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+        return reclaimed
@@ -0,0 +1,115 @@
+from codr.application.entities import Document
+from codr.indexing.overlay import OVERFETCH, Overlay
+from codr.storage.overlay_store import OverlayStore
+from codr.storage.vector_db import N_RESULTS, VectorDb, merge_query_results
+
+
+class OverlayVectorDb(VectorDb):
+    """Answers queries against an overlay sha from its base and its delta.
+
+    Writes go to the wrapped backend unchanged, so the delta of an overlay
+    is stored under its own sha like any other index.
+    """
+
+    def __init__(self, vector_db: VectorDb, overlays: OverlayStore) -> None:
+        self.vector_db = vector_db
+        self.overlays = overlays
+
+    def _overlay(self, sha: str | None, repo: str | None) -> Overlay | None:
+        return self.overlays.get(sha, repo) if sha is not None else None
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        return self.vector_db.embed(texts)
+
+    def create(
+        self, documents: list[Document], embeddings: list[list[float]] | None = None
+    ) -> None:
+        self.vector_db.create(documents, embeddings=embeddings)
+
+    def carry_forward(
+        self,
+        source_sha: str,
+        target_sha: str,
+        sources: set[str],
+        repo: str | None = None,
+    ) -> int:
+        return self.vector_db.carry_forward(
+            source_sha=source_sha, target_sha=target_sha, sources=sources, repo=repo
+        )
+
+    def get(self, sha: str, repo: str | None = None) -> list:
+        return self.vector_db.get(sha=sha, repo=repo)
+
+    def query(
+        self, query: str, sha: str | None = None, repo: str | None = None
+    ) -> dict:
+        overlay = self._overlay(sha, repo)
+        if overlay is None:
+            return self.vector_db.query(query, sha=sha, repo=repo)
+        base = self.vector_db.query(query, sha=overlay.base_sha, repo=repo)
+        keys = ("distances", "ids", "documents", "metadatas")
+        visible = [
+            (distance, id_, document, overlay.rebase(metadata))
+            for distance, id_, document, metadata in zip(*(base[k][0] for k in keys))
+            if not overlay.hides(metadata)
+        ]
+        delta = self.vector_db.query(query, sha=overlay.sha, repo=repo)
+        return merge_query_results(
+            [{key: [[row[i] for row in visible]] for i, key in enumerate(keys)}, delta],
+            N_RESULTS,
+        )
+
+    def query_texts(
+        self, query_texts: list[str], sha: str | None = None, repo: str | None = None
+    ) -> list:
+        if self._overlay(sha, repo) is None:
+            return self.vector_db.query_texts(query_texts, sha=sha, repo=repo)
+        return [
+            [metadata for _, metadata in hits]
+            for hits in self.query_scores(query_texts, sha=sha, repo=repo)
+        ]
+
+    def query_scores(
+        self,
+        query_texts: list[str],
+        sha: str | None = None,
+        n_results: int = N_RESULTS,
+        repo: str | None = None,
+    ) -> list[list[tuple[float, dict]]]:
+        overlay = self._overlay(sha, repo)
+        if overlay is None:
+            return self.vector_db.query_scores(
+                query_texts, sha=sha, n_results=n_results, repo=repo
+            )
+        base = self.vector_db.query_scores(
+            query_texts,
+            sha=overlay.base_sha,
+            n_results=n_results * OVERFETCH,
+            repo=repo,
+        )
+        delta = self.vector_db.query_scores(
+            query_texts, sha=overlay.sha, n_results=n_results, repo=repo
+        )
+        return overlay.merge_rankings(base, delta, n_results)
+
+    def get_by_metadata(
+        self, key: str, value: str, sha: str | None = None, repo: str | None = None
+    ) -> dict:
+        overlay = self._overlay(sha, repo)
+        if overlay is None:
+            return self.vector_db.get_by_metadata(key, value, sha=sha, repo=repo)
+        results = self.vector_db.get_by_metadata(key, value, sha=overlay.sha, repo=repo)
+        base = self.vector_db.get_by_metadata(
+            key, value, sha=overlay.base_sha, repo=repo
+        )
+        for id_, document, metadata in zip(
+            base["ids"], base["documents"], base["metadatas"]
+        ):
+            if not overlay.hides(metadata):
+                results["ids"].append(id_)
+                results["documents"].append(document)
+                results["metadatas"].append(overlay.rebase(metadata))
+        return results
+
+    def drop(self, sha: str, repo: str | None = None) -> int:
+        return self.vector_db.drop(sha, repo=repo)
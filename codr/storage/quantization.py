@@ -0,0 +1,131 @@
+from abc import ABC, abstractmethod
+from enum import auto
+
+import numpy as np
+
+from codr.common.utils import BaseEnum
+from codr.storage.ann import normalize
+
+Codes = dict[str, np.ndarray]
+
+# Rows decoded at once while scoring, so the float32 block stays in cache
+SCORE_BLOCK_SIZE = 1024
+
+
+class Quantization(BaseEnum):
+    NONE = auto()
+    INT8 = auto()
+    BINARY = auto()
+
+
+class Quantizer(ABC):
+    """Compresses unit length embeddings into codes that approximate their inner products.
+
+    Codes are a dict of arrays whose first axis is the row, so codes of
+    appended rows can simply be concatenated.
+    """
+
+    name: str
+
+    @abstractmethod
+    def encode(self, embeddings: np.ndarray) -> Codes:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _score_block(self, codes: Codes, queries: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def score(self, codes: Codes, queries: np.ndarray) -> np.ndarray:
+        """Approximates `queries @ embeddings.T`, higher is more similar."""
+        rows = len(next(iter(codes.values())))
+        scores = np.empty((len(queries), rows), dtype=np.float32)
+        for start in range(0, rows, SCORE_BLOCK_SIZE):
+            block = {
+                key: value[start : start + SCORE_BLOCK_SIZE]
+                for key, value in codes.items()
+            }
+            scores[:, start : start + SCORE_BLOCK_SIZE] = self._score_block(
+                block, queries
+            )
+        return scores
+
+    @staticmethod
+    def nbytes(codes: Codes) -> int:
+        return sum(value.nbytes for value in codes.values())
+
+
+class Int8Quantizer(Quantizer):
+    """Scales every vector so its largest component maps to 127, 4x smaller than float32."""
+
+    name = "int8"
+
+    def encode(self, embeddings: np.ndarray) -> Codes:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        scales = np.abs(embeddings).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        codes = np.round(embeddings / scales[:, None]).astype(np.int8)
+        return {"codes": codes, "scales": scales.astype(np.float32)}
+
+    def _score_block(self, codes: Codes, queries: np.ndarray) -> np.ndarray:
+        return (queries @ codes["codes"].T.astype(np.float32)) * codes["scales"]
+
+
+class BinaryQuantizer(Quantizer):
+    """Keeps the sign of every component as one bit, 32x smaller than float32.
+
+    The float query is scored against the signs rather than binarized as
+    well, which ranks noticeably better than a Hamming distance. Scores are
+    still coarse and only meant to pick candidates for rescoring.
+    """
+
+    name = "binary"
+
+    def encode(self, embeddings: np.ndarray) -> Codes:
+        return {"bits": np.packbits(np.asarray(embeddings) > 0, axis=1)}
+
+    def _score_block(self, codes: Codes, queries: np.ndarray) -> np.ndarray:
+        # q . sign(x) = 2 * (q . bits) - sum(q), the offset does not change the ranking
+        bits = np.unpackbits(codes["bits"], axis=1, count=queries.shape[1])
+        return queries @ bits.T.astype(np.float32)
+
+
+class TruncatingQuantizer(Quantizer):
+    """Keeps the leading `dimensions` of every vector, rescaled to unit length.
+
+    Matryoshka trained models such as text-embedding-3 put most of the
+    signal in the leading dimensions, so a truncated search is a cheap
+    first stage before rescoring with the full vectors. The truncated
+    vectors can be quantized further by `inner`.
+    """
+
+    def __init__(self, dimensions: int, inner: Quantizer | None = None) -> None:
+        self.dimensions = dimensions
+        self.inner = inner
+        self.name = f"{inner.name if inner else 'float32'}-{dimensions}"
+
+    def encode(self, embeddings: np.ndarray) -> Codes:
+        truncated = normalize(
+            np.asarray(embeddings[:, : self.dimensions], dtype=np.float32)
+        )
+        if self.inner is not None:
+            return self.inner.encode(truncated)
+        return {"vectors": truncated.astype(np.float32)}
+
+    def _score_block(self, codes: Codes, queries: np.ndarray) -> np.ndarray:
+        truncated = normalize(queries[:, : self.dimensions]).astype(np.float32)
+        if self.inner is not None:
+            return self.inner._score_block(codes, truncated)
+        return truncated @ codes["vectors"].T
+
+
+def get_quantizer(
+    quantization: Quantization, coarse_dimensions: int | None = None
+) -> Quantizer | None:
+    quantizer: Quantizer | None = None
+    if quantization == Quantization.INT8:
+        quantizer = Int8Quantizer()
+    elif quantization == Quantization.BINARY:
+        quantizer = BinaryQuantizer()
+    if coarse_dimensions is not None:
+        return TruncatingQuantizer(coarse_dimensions, inner=quantizer)
+    return quantizer
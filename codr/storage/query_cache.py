@@ -0,0 +1,165 @@
+import threading
+from typing import Any, Callable
+
+from codr.application.entities import Document
+from codr.logger import logger
+from codr.storage.embedding_cache import CacheStats, TtlLruCache
+from codr.storage.overlay_store import OverlayStore
+from codr.storage.vector_db import N_RESULTS, VectorDb
+
+
+class CachedVectorDb(VectorDb):
+    """Caches the results of queries against a single sha.
+
+    A sha changes while it is being indexed and when it is dropped, so
+    writes and drops invalidate its results, and results searched while
+    any write ran are not kept. The overlay a sha resolves to, if any, is
+    part of the key, as the overlay is only stored once its delta is
+    complete. Queries spanning every sha are not cached.
+    """
+
+    def __init__(
+        self,
+        vector_db: VectorDb,
+        cache: TtlLruCache[Any] | None = None,
+        overlays: OverlayStore | None = None,
+    ) -> None:
+        self.vector_db = vector_db
+        self.cache: TtlLruCache[Any] = cache or TtlLruCache()
+        self.overlays = overlays
+        # Counts the writes started, results searched across one are stale
+        self.__writes = 0
+        self.__lock = threading.Lock()
+
+    @property
+    def stats(self) -> CacheStats:
+        return self.cache.stats
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        return self.vector_db.embed(texts)
+
+    def _invalidate(self, sha: str) -> int:
+        """Called after a write, so results cached while it ran are removed too."""
+        with self.__lock:
+            self.__writes += 1
+        return self.cache.invalidate(lambda key: sha in (key[1], key[2]))
+
+    def _base_sha(self, sha: str, repo: str | None) -> str | None:
+        overlay = self.overlays.get(sha, repo) if self.overlays is not None else None
+        return overlay.base_sha if overlay is not None else None
+
+    def create(
+        self, documents: list[Document], embeddings: list[list[float]] | None = None
+    ) -> None:
+        self.vector_db.create(documents, embeddings=embeddings)
+        for sha in {document.sha for document in documents}:
+            self._invalidate(sha)
+
+    def carry_forward(
+        self,
+        source_sha: str,
+        target_sha: str,
+        sources: set[str],
+        repo: str | None = None,
+    ) -> int:
+        carried = self.vector_db.carry_forward(
+            source_sha=source_sha, target_sha=target_sha, sources=sources, repo=repo
+        )
+        self._invalidate(target_sha)
+        return carried
+
+    def get(self, sha: str, repo: str | None = None) -> list:
+        return self.vector_db.get(sha=sha, repo=repo)
+
+    def query(
+        self, query: str, sha: str | None = None, repo: str | None = None
+    ) -> dict:
+        if sha is None:
+            return self.vector_db.query(query, sha=sha, repo=repo)
+        return self._cached(
+            "query",
+            [query],
+            sha,
+            lambda missing: [self.vector_db.query(missing[0], sha=sha, repo=repo)],
+            repo=repo,
+        )[0]
+
+    def query_texts(
+        self, query_texts: list[str], sha: str | None = None, repo: str | None = None
+    ) -> list:
+        if sha is None:
+            return self.vector_db.query_texts(query_texts, sha=sha, repo=repo)
+        return self._cached(
+            "query_texts",
+            query_texts,
+            sha,
+            lambda missing: self.vector_db.query_texts(missing, sha=sha, repo=repo),
+            repo=repo,
+        )
+
+    def _cached(
+        self,
+        method: str,
+        query_texts: list[str],
+        sha: str,
+        search: Callable[[list[str]], list],
+        n_results: int = N_RESULTS,
+        repo: str | None = None,
+    ) -> list:
+        """Looks up every query on its own and searches the misses in one call."""
+        base_sha = self._base_sha(sha, repo)
+        keys = [(method, sha, base_sha, text, n_results, repo) for text in query_texts]
+        results = [self.cache.get(key) for key in keys]
+        missing = list(
+            dict.fromkeys(
+                text for text, result in zip(query_texts, results) if result is None
+            )
+        )
+        if missing:
+            writes = self.__writes
+            computed = dict(zip(missing, search(missing)))
+            with self.__lock:
+                if writes == self.__writes:
+                    for text, result in computed.items():
+                        self.cache.put(
+                            (method, sha, base_sha, text, n_results, repo), result
+                        )
+            results = [
+                result if result is not None else computed[text]
+                for text, result in zip(query_texts, results)
+            ]
+        logger.info(f"Query cache: {self.cache.stats}")
+        return results
+
+    def query_scores(
+        self,
+        query_texts: list[str],
+        sha: str | None = None,
+        n_results: int = N_RESULTS,
+        repo: str | None = None,
+    ) -> list[list[tuple[float, dict]]]:
+        if sha is None:
+            return self.vector_db.query_scores(
+                query_texts, sha=sha, n_results=n_results, repo=repo
+            )
+        return self._cached(
+            "query_scores",
+            query_texts,
+            sha,
+            lambda missing: self.vector_db.query_scores(
+                missing, sha=sha, n_results=n_results, repo=repo
+            ),
+            n_results,
+            repo,
+        )
+
+    def get_by_metadata(
+        self, key: str, value: str, sha: str | None = None, repo: str | None = None
+    ) -> dict:
+        return self.vector_db.get_by_metadata(key, value, sha=sha, repo=repo)
+
+    def drop(self, sha: str, repo: str | None = None) -> int:
+        reclaimed = self.vector_db.drop(sha, repo=repo)
+        invalidated = self._invalidate(sha)
+        logger.info(f"Invalidated {invalidated} cached queries of {sha}")
+        return reclaimed
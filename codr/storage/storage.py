@@ -1,9 +1,11 @@
+import os
+
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from codr.models import Base
 
-engine = create_engine("sqlite:///sqlite.db", echo=True)
+engine = create_engine(os.getenv("CODR_DATABASE_URL", "sqlite:///sqlite.db"), echo=True)
 
 SessionLocal = sessionmaker(bind=engine)
 
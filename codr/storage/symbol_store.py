@@ -0,0 +1,129 @@
+import json
+import math
+import os
+import tempfile
+from typing import Any
+
+from codr.indexing.symbols import FileSymbols, SymbolIndex, extract_symbols
+from codr.storage.embedding_cache import TtlLruCache
+from codr.storage.overlay_store import OverlayStore
+from codr.utils import DATA_DIR, copy_joined_lines, partition_name
+
+# Indexes kept loaded, each holds every definition and reference of a sha
+SYMBOL_CACHE_SIZE = 8
+
+
+class SymbolIndexStore:
+    """Keeps the symbol index of every repo and sha, like LexicalIndexStore."""
+
+    def __init__(
+        self,
+        root: str = os.path.join(DATA_DIR, "symbols"),
+        overlays: OverlayStore | None = None,
+        cache_size: int = SYMBOL_CACHE_SIZE,
+    ) -> None:
+        self.root = root
+        self.overlays = overlays
+        self.__indexes: TtlLruCache[SymbolIndex] = TtlLruCache(cache_size, ttl=math.inf)
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, sha: str, repo: str | None = None) -> str:
+        return os.path.join(self.root, f"{partition_name(repo, sha)}.json")
+
+    def put(self, sha: str, index: SymbolIndex, repo: str | None = None) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.root)
+        with os.fdopen(fd, "w") as file:
+            json.dump(index.to_dict(), file)
+        self._replace(tmp_path, self._path(sha, repo), index)
+
+    def writer(self, sha: str, repo: str | None = None) -> "SymbolIndexWriter":
+        return SymbolIndexWriter(self, sha, repo)
+
+    def _replace(self, tmp_path: str, path: str, index: SymbolIndex) -> None:
+        os.replace(tmp_path, path)
+        # Merged indexes are keyed by the overlay's path and its base's path
+        self.__indexes.invalidate(lambda key: path in key.split("+"))
+        self.__indexes.put(path, index)
+
+    def get(self, sha: str, repo: str | None = None) -> SymbolIndex | None:
+        overlay = self.overlays.get(sha, repo) if self.overlays is not None else None
+        path = self._path(sha, repo)
+        if overlay is None:
+            return self._load(path)
+        base_path = self._path(overlay.base_sha, repo)
+        key = f"{path}+{base_path}"
+        cached = self.__indexes.get(key)
+        if cached is not None:
+            return cached
+        base = self._load(base_path)
+        delta = self._load(path)
+        if base is None or delta is None:
+            return None
+        index = overlay.merge_symbols(base, delta)
+        self.__indexes.put(key, index)
+        return index
+
+    def _load(self, path: str) -> SymbolIndex | None:
+        cached = self.__indexes.get(path)
+        if cached is not None:
+            return cached
+        try:
+            with open(path) as file:
+                index = SymbolIndex.from_dict(json.load(file))
+        except FileNotFoundError:
+            return None
+        self.__indexes.put(path, index)
+        return index
+
+    def drop(self, sha: str, repo: str | None = None) -> int:
+        path = self._path(sha, repo)
+        self.__indexes.invalidate(lambda key: path in key.split("+"))
+        try:
+            reclaimed = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+        return reclaimed
+
+
+class SymbolIndexWriter:
+    """Writes the symbol index of one sha a file at a time, like LexicalIndexWriter.
+
+    `commit` returns the index read back from the file it wrote.
+    """
+
+    def __init__(self, store: SymbolIndexStore, sha: str, repo: str | None) -> None:
+        self.__store = store
+        self.__path = store._path(sha, repo)
+        self.__files = tempfile.TemporaryFile("w+", dir=store.root)
+
+    def __enter__(self) -> "SymbolIndexWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.__files.close()
+
+    def _write(self, path: str, symbols: FileSymbols) -> None:
+        self.__files.write(f"{json.dumps(path)}: {json.dumps(symbols.to_dict())}\n")
+
+    def add_file(self, path: str, content: str) -> None:
+        symbols = extract_symbols(path, content)
+        if symbols is not None:
+            self._write(path, symbols)
+
+    def carry_forward(self, previous: SymbolIndex, sources: set[str]) -> int:
+        carried = sources & previous.files.keys()
+        for path in carried:
+            self._write(path, previous.files[path])
+        return len(carried)
+
+    def commit(self) -> SymbolIndex:
+        fd, tmp_path = tempfile.mkstemp(dir=self.__store.root)
+        with os.fdopen(fd, "w+") as file:
+            file.write("{")
+            copy_joined_lines(self.__files, file)
+            file.write("}")
+            file.seek(0)
+            index = SymbolIndex.from_dict(json.load(file))
+        self.__store._replace(tmp_path, self.__path, index)
+        return index
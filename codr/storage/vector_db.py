@@ -1,101 +1,450 @@
+import os
+import threading
 from abc import ABC, abstractmethod
+from enum import auto
+from typing import Any
 
 import chromadb
+from chromadb.api.models.Collection import Collection
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import NOT_GIVEN, OpenAI
 
 from codr.application.entities import Document
+from codr.application.exceptions import EmbeddingMismatchError
+from codr.common.utils import BaseEnum
 from codr.models import new_uuid
+from codr.storage.embedding_batcher import EmbeddingBatcher, TokenEstimator
+from codr.storage.embedding_cache import (
+    CachedEmbeddingFunction,
+    EmbeddingCache,
+    MemoryCachedEmbeddingFunction,
+)
+from codr.utils import partition_name
 
 load_dotenv()
 
-client = OpenAI()
+# Chroma rejects inserts larger than its max batch size (5461 by default)
+ADD_BATCH_SIZE = 5000
+# Files whose chunks one carry_forward read fetches
+CARRY_FORWARD_SOURCES = 100
+N_RESULTS = 10
+
+# Every sha was indexed into this collection before collections were partitioned
+LEGACY_COLLECTION = "codebase_embeddings_newnew"
+
+# Retries are handled by the EmbeddingBatcher
+client = OpenAI(max_retries=0)
+
+EMBEDDING_MODEL = os.getenv("CODR_EMBEDDING_MODEL", "text-embedding-3-large")
+# text-embedding-3 models can return shortened embeddings, unset means full size
+EMBEDDING_DIMENSIONS = (
+    int(os.environ["CODR_EMBEDDING_DIMENSIONS"])
+    if os.getenv("CODR_EMBEDDING_DIMENSIONS")
+    else None
+)
+
+
+def check_embedding_metadata(
+    recorded: dict[str, Any], model: str, dimensions: int | None
+) -> None:
+    """Rejects embeddings that cannot be compared with the ones already in an index.
+
+    Unknown dimensions are not checked, neither are indexes without metadata.
+    """
+    if "model" in recorded and recorded["model"] != model:
+        raise EmbeddingMismatchError(
+            f"Index holds {recorded['model']} embeddings, got {model} embeddings"
+        )
+    if (
+        dimensions is not None
+        and "dimensions" in recorded
+        and recorded["dimensions"] != dimensions
+    ):
+        raise EmbeddingMismatchError(
+            f"Index holds {recorded['dimensions']} dimensional embeddings, "
+            f"got {dimensions} dimensional embeddings"
+        )
 
 
 class EmbeddingCreator:
-    def get_embedding(self, input):
-        # Cast from list of bytes to list of strings
+    def __init__(
+        self,
+        model: str = EMBEDDING_MODEL,
+        dimensions: int | None = EMBEDDING_DIMENSIONS,
+        max_workers: int = 4,
+    ) -> None:
+        self.model = model
+        self.dimensions = dimensions
+        self.batcher = EmbeddingBatcher(
+            self._create_embeddings,
+            estimate_tokens=TokenEstimator(model),
+            max_workers=max_workers,
+        )
+
+    def _create_embeddings(self, input: list[str]) -> list[list[float]]:
         embeddings = client.embeddings.create(
-            input=input, model="text-embedding-3-large"
+            input=input, model=self.model, dimensions=self.dimensions or NOT_GIVEN
         )
-        # return all embeddings
         return [d.embedding for d in embeddings.data]
 
+    def get_embedding(self, input):
+        return self.batcher(list(input))
+
     def __call__(self, input):
         return self.get_embedding(input)
 
 
-embedding_creator = EmbeddingCreator()
+embedding_creator = CachedEmbeddingFunction(EmbeddingCreator(), EmbeddingCache())
+query_embedding_creator = MemoryCachedEmbeddingFunction(embedding_creator)
+
+
+class VectorDbBackend(BaseEnum):
+    CHROMA = auto()
+    NUMPY = auto()
+    # The NumPy store with an IVF index for large shas
+    IVF = auto()
 
 
 class VectorDb(ABC):
     @abstractmethod
-    def create(self, documents: list[Document]) -> None:
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def create(
+        self, documents: list[Document], embeddings: list[list[float]] | None = None
+    ) -> None:
+        """Stores `documents`, embedding them unless their `embeddings` are given."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def carry_forward(
+        self,
+        source_sha: str,
+        target_sha: str,
+        sources: set[str],
+        repo: str | None = None,
+    ) -> int:
+        """Copies the stored chunks of `sources` from one sha to another without re-embedding them.
+
+        Only the chunks of `repo` are copied if given, see belongs_to.
+        """
+        raise NotImplementedError
+
+    # Reads only see the chunks of `repo` if given, forks index the same shas
+
+    @abstractmethod
+    def get(self, sha: str, repo: str | None = None) -> list:
         raise NotImplementedError
 
     @abstractmethod
-    def get(self, sha: str) -> list:
+    def query(
+        self, query: str, sha: str | None = None, repo: str | None = None
+    ) -> list:
         raise NotImplementedError
 
     @abstractmethod
-    def query(self, query: str, sha: str | None = None) -> list:
+    def query_texts(
+        self, query_texts: list[str], sha: str | None = None, repo: str | None = None
+    ) -> list:
         raise NotImplementedError
 
     @abstractmethod
-    def query_texts(self, query_texts: list[str], sha: str | None = None) -> list:
+    def query_scores(
+        self,
+        query_texts: list[str],
+        sha: str | None = None,
+        n_results: int = N_RESULTS,
+        repo: str | None = None,
+    ) -> list[list[tuple[float, dict]]]:
+        """Embeds all queries at once and returns their (cosine similarity, metadata) hits."""
         raise NotImplementedError
 
     @abstractmethod
-    def get_by_metadata(self, key: str, value: str, sha: str | None = None) -> list:
+    def get_by_metadata(
+        self, key: str, value: str, sha: str | None = None, repo: str | None = None
+    ) -> list:
         raise NotImplementedError
 
+    @abstractmethod
+    def drop(self, sha: str, repo: str | None = None) -> int:
+        """Deletes what is stored for `sha` and returns roughly how many bytes that freed.
+
+        Forks share shas, so only the chunks of `repo` are deleted if given.
+        """
+        raise NotImplementedError
+
+
+def belongs_to(metadata: dict, repo: str | None) -> bool:
+    # Chunks indexed before the repo was recorded belong to any repo
+    return repo is None or metadata.get("repo") in (None, "", repo)
+
+
+def merge_query_results(results: list[dict], n_results: int) -> dict:
+    """Merges the results of the same queries against several collections by distance."""
+    if len(results) == 1:
+        return results[0]
+    keys = ("distances", "ids", "documents", "metadatas")
+    merged: dict[str, list] = {key: [] for key in keys}
+    for q in range(len(results[0]["ids"])):
+        rows = sorted(
+            (
+                tuple(result[key][q][i] for key in keys)
+                for result in results
+                for i in range(len(result["ids"][q]))
+            ),
+            key=lambda row: row[0],
+        )[:n_results]
+        for key, column in zip(keys, zip(*rows) if rows else ([],) * len(keys)):
+            merged[key].append(list(column))
+    return merged
+
 
 class ChromaDb(VectorDb):
+    """Keeps the chunks of every repository and sha in their own collection.
+
+    Searching a sha only touches its own collections and dropping a sha
+    deletes them. Shas indexed before partitioning stay in the legacy shared
+    collection and are still found there, filtered by sha.
+    """
+
     def __init__(self):
         self.__client = chromadb.HttpClient()
-        self.__collection = self.__client.get_or_create_collection(
-            "codebase_embeddings_newnew", embedding_function=embedding_creator
+        self.__legacy = self.__client.get_or_create_collection(
+            LEGACY_COLLECTION, embedding_function=embedding_creator
         )
+        check_embedding_metadata(
+            self.__legacy.metadata or {},
+            embedding_creator.model,
+            embedding_creator.dimensions,
+        )
+        # Partitions by name, for a repo and sha or for every repo at a sha if None
+        self.__partitions: dict[tuple[str | None, str], dict[str, Collection]] = {}
+        self.__lock = threading.Lock()
 
-    def create(self, documents: list[Document]) -> None:
-        return self.__collection.add(
-            documents=[d.content for d in documents],
-            ids=[new_uuid() for _ in range(len(documents))],
-            metadatas=[{"source": d.source, "sha": d.sha} for d in documents],
+    def _partition(self, repo: str | None, sha: str, dimensions: int) -> Collection:
+        name = partition_name(repo, sha)
+        with self.__lock:
+            collection = self.__partitions.get((repo, sha), {}).get(name)
+            if collection is None:
+                collection = self.__client.get_or_create_collection(
+                    name,
+                    embedding_function=embedding_creator,
+                    metadata={
+                        "repo": repo or "",
+                        "sha": sha,
+                        "model": embedding_creator.model,
+                        "dimensions": dimensions,
+                    },
+                )
+                for key in ((repo, sha), (None, sha)):
+                    if key in self.__partitions:
+                        self.__partitions[key][name] = collection
+        check_embedding_metadata(
+            collection.metadata or {}, embedding_creator.model, dimensions
         )
+        return collection
+
+    def _partitions(self, sha: str, repo: str | None = None) -> list[Collection]:
+        """Returns the partitions of `repo` at `sha`, or of every repo if None."""
+        with self.__lock:
+            if (repo, sha) not in self.__partitions:
+                names = [
+                    # Chroma 0.6 lists names instead of collections
+                    getattr(collection, "name", collection)
+                    for collection in self.__client.list_collections()
+                ]
+                # Chunks without a recorded repo are in the partition of None
+                wanted = {partition_name(repo, sha), partition_name(None, sha)}
+                partitions = {
+                    name: self.__client.get_collection(
+                        name, embedding_function=embedding_creator
+                    )
+                    for name in names
+                    if (name.endswith(f"-{sha}") if repo is None else name in wanted)
+                }
+                if not partitions:
+                    # Not cached, the sha may still be indexed by another process
+                    return []
+                self.__partitions[(repo, sha)] = partitions
+            return list(self.__partitions[(repo, sha)].values())
+
+    def _collections(
+        self, sha: str | None, repo: str | None = None
+    ) -> list[tuple[Collection, dict | None]]:
+        """Returns the collections holding `sha` with the filter to apply to them."""
+        if sha is None:
+            names = [
+                getattr(collection, "name", collection)
+                for collection in self.__client.list_collections()
+            ]
+            if repo is not None:
+                # Partition names start with the key of their repo
+                prefixes = (partition_name(repo, ""), partition_name(None, ""))
+                names = [
+                    name
+                    for name in names
+                    if name.startswith(prefixes) or name == LEGACY_COLLECTION
+                ]
+            return [
+                (
+                    self.__client.get_collection(
+                        name, embedding_function=embedding_creator
+                    ),
+                    None,
+                )
+                for name in names
+            ]
+        partitions = self._partitions(sha, repo)
+        if partitions:
+            return [(collection, None) for collection in partitions]
+        return [(self.__legacy, {"sha": {"$eq": sha}})]
 
-    def get(self, sha: str) -> list:
-        results = self.__collection.get(where={"sha": {"$eq": sha}})
-        return results["embeddings"]
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        return embedding_creator(texts)
 
-    def query(self, query: str, sha: str | None = None) -> list:
-        if sha is not None:
-            results = self.__collection.query(
-                query_texts=[query], n_results=10, where={"sha": {"$eq": sha}}
+    def create(
+        self, documents: list[Document], embeddings: list[list[float]] | None = None
+    ) -> None:
+        if not documents:
+            return
+        if embeddings is None:
+            embeddings = self.embed([d.content for d in documents])
+        partitions: dict[tuple[str | None, str], list[int]] = {}
+        for i, document in enumerate(documents):
+            partitions.setdefault((document.repo, document.sha), []).append(i)
+        for (repo, sha), rows in partitions.items():
+            self._partition(repo, sha, len(embeddings[0])).add(
+                documents=[documents[i].content for i in rows],
+                ids=[new_uuid() for _ in rows],
+                metadatas=[documents[i].metadata for i in rows],
+                embeddings=[embeddings[i] for i in rows],
             )
-        else:
-            results = self.__collection.query(query_texts=[query], n_results=10)
-        return results
 
-    def query_texts(self, query_texts: list[str], sha: str | None = None) -> list:
-        if sha is not None:
-            results = self.__collection.query(
-                query_texts=query_texts, n_results=10, where={"sha": {"$eq": sha}}
+    def carry_forward(
+        self,
+        source_sha: str,
+        target_sha: str,
+        sources: set[str],
+        repo: str | None = None,
+    ) -> int:
+        carried = 0
+        paths = sorted(sources)
+        for collection, where in self._collections(source_sha, repo):
+            # Only the chunks of `sources` are read, a few files at a time
+            for start in range(0, len(paths), CARRY_FORWARD_SOURCES):
+                in_sources = {
+                    "source": {"$in": paths[start : start + CARRY_FORWARD_SOURCES]}
+                }
+                results = collection.get(
+                    where=in_sources
+                    if where is None
+                    else {"$and": [where, in_sources]},
+                    include=["embeddings", "documents", "metadatas"],
+                )
+                rows: dict[str | None, list[int]] = {}
+                for row, metadata in enumerate(results["metadatas"]):
+                    if belongs_to(metadata, repo):
+                        rows.setdefault(metadata.get("repo"), []).append(row)
+                for chunk_repo, batch in rows.items():
+                    target = self._partition(
+                        chunk_repo, target_sha, len(results["embeddings"][batch[0]])
+                    )
+                    target.add(
+                        ids=[new_uuid() for _ in batch],
+                        embeddings=[results["embeddings"][i] for i in batch],
+                        documents=[results["documents"][i] for i in batch],
+                        metadatas=[
+                            {**results["metadatas"][i], "sha": target_sha}
+                            for i in batch
+                        ],
+                    )
+                    carried += len(batch)
+        return carried
+
+    def get(self, sha: str, repo: str | None = None) -> list:
+        embeddings: list = []
+        for collection, where in self._collections(sha, repo):
+            embeddings.extend(
+                collection.get(where=where, include=["embeddings"])["embeddings"]
             )
-        else:
-            results = self.__collection.query(query_texts=query_texts, n_results=10)
-        sources = [result for result in results.get("metadatas")]
-        return sources
+        return embeddings
+
+    def _query(
+        self,
+        query_texts: list[str],
+        sha: str | None,
+        n_results: int = N_RESULTS,
+        repo: str | None = None,
+    ) -> dict:
+        # Embedded once for all collections rather than by every collection
+        query_embeddings = query_embedding_creator(query_texts)
+        return merge_query_results(
+            [
+                collection.query(
+                    query_embeddings=query_embeddings, n_results=n_results, where=where
+                )
+                for collection, where in self._collections(sha, repo)
+            ],
+            n_results,
+        )
+
+    def query(
+        self, query: str, sha: str | None = None, repo: str | None = None
+    ) -> dict:
+        return self._query([query], sha=sha, repo=repo)
 
-    def get_by_metadata(self, key: str, value: str, sha: str | None = None) -> list:
-        query = {key: value}
+    def query_texts(
+        self, query_texts: list[str], sha: str | None = None, repo: str | None = None
+    ) -> list:
+        return self._query(query_texts, sha=sha, repo=repo)["metadatas"]
 
-        # If sha is provided, add it to the query with and operation
-        if sha is not None:
-            query = {"$and": [query, {"sha": {"$eq": sha}}]}
+    def query_scores(
+        self,
+        query_texts: list[str],
+        sha: str | None = None,
+        n_results: int = N_RESULTS,
+        repo: str | None = None,
+    ) -> list[list[tuple[float, dict]]]:
+        results = self._query(query_texts, sha=sha, n_results=n_results, repo=repo)
+        # Collections use squared L2 distances, which are 2 - 2 * cosine for unit vectors
+        return [
+            [(1.0 - distance / 2, metadata) for distance, metadata in zip(d, m)]
+            for d, m in zip(results["distances"], results["metadatas"])
+        ]
 
-        results = self.__collection.get(where=query)
+    def get_by_metadata(
+        self, key: str, value: str, sha: str | None = None, repo: str | None = None
+    ) -> dict:
+        results: dict[str, list] = {"ids": [], "documents": [], "metadatas": []}
+        for collection, where in self._collections(sha, repo):
+            query = {key: value} if where is None else {"$and": [{key: value}, where]}
+            found = collection.get(where=query)
+            for result_key in results:
+                results[result_key].extend(found[result_key])
         return results
 
-    def delete(self, identifier: str) -> None:
-        self.__client.delete_collection(identifier)
+    def drop(self, sha: str, repo: str | None = None) -> int:
+        # Chroma does not report sizes, so the freed vectors are estimated as float32
+        reclaimed = 0
+        for collection in self._partitions(sha, repo):
+            dimensions = (collection.metadata or {}).get("dimensions") or 0
+            reclaimed += collection.count() * dimensions * 4
+            self.__client.delete_collection(collection.name)
+        with self.__lock:
+            for key in [key for key in self.__partitions if key[1] == sha]:
+                if repo is None or key[0] in (repo, None):
+                    del self.__partitions[key]
+        where = {"sha": {"$eq": sha}}
+        legacy = self.__legacy.get(where=where, limit=1, include=["embeddings"])
+        if legacy["ids"]:
+            found = self.__legacy.get(where=where, include=["metadatas"])
+            ids = [
+                id_
+                for id_, metadata in zip(found["ids"], found["metadatas"])
+                if belongs_to(metadata, repo)
+            ]
+            reclaimed += len(ids) * len(legacy["embeddings"][0]) * 4
+            for start in range(0, len(ids), ADD_BATCH_SIZE):
+                self.__legacy.delete(ids=ids[start : start + ADD_BATCH_SIZE])
+        return reclaimed
@@ -1,6 +1,7 @@
+import hashlib
 import os
 from dataclasses import dataclass
-from typing import Any, TypeVar
+from typing import IO, Any, TypeVar
 
 from dotenv import load_dotenv
 
@@ -11,6 +12,9 @@ Kwargs = dict[str, Any]
 Id = str
 IdType = TypeVar("IdType", bound=Id)
 
+# Local indexes and caches live here
+DATA_DIR = os.getenv("CODR_DATA_DIR", ".codr")
+
 
 def get_env_var(name: str) -> str:
     env_var = os.getenv(name)
@@ -19,6 +23,35 @@ def get_env_var(name: str) -> str:
     return env_var
 
 
+def directory_size(path: str) -> int:
+    size = 0
+    for directory, _, files in os.walk(path):
+        for file in files:
+            try:
+                size += os.path.getsize(os.path.join(directory, file))
+            except FileNotFoundError:
+                pass
+    return size
+
+
+def copy_joined_lines(lines: IO[str], file: IO[str], separator: str = ",") -> None:
+    """Copies the lines of `lines` from its start into `file`, joined by `separator`."""
+    lines.seek(0)
+    for number, line in enumerate(lines):
+        if number:
+            file.write(separator)
+        file.write(line.rstrip("\n"))
+
+
+def partition_name(repo: str | None, sha: str) -> str:
+    """Name of the indexes of one repository at one sha.
+
+    Chroma limits collection names to 63 characters, so the repository is hashed.
+    """
+    repo_key = hashlib.sha1((repo or "").encode("utf-8")).hexdigest()[:8]
+    return f"{repo_key}-{sha}"
+
+
 @dataclass
 class GitHubCredentials:
     client_id: str
@@ -0,0 +1,127 @@
+import os
+import threading
+from datetime import timedelta
+from typing import Callable
+
+from codr.application.interactors.codebase.compact_indexes import (
+    CompactIndexes,
+    CompactIndexesRequest,
+)
+from codr.application.interactors.codebase.run_index_job import (
+    RunCodebaseIndexJob,
+    RunCodebaseIndexJobRequest,
+)
+from codr.logger import logger
+from codr.storage.index_job_repository import IndexJobRepository
+
+
+class IndexWorker:
+    """Runs queued index jobs one at a time on a background thread.
+
+    The queue lives in the database, so jobs that were pending or running
+    when the process stopped are picked up again on the next start.
+    """
+
+    def __init__(
+        self,
+        index_job_repository: Callable[[], IndexJobRepository],
+        run_index_job: Callable[[], RunCodebaseIndexJob],
+        poll_interval: float = 1.0,
+    ) -> None:
+        # Dependencies are built on the worker thread, which has its own session
+        self.__index_job_repository = index_job_repository
+        self.__run_index_job = run_index_job
+        self.__poll_interval = poll_interval
+        self.__stop = threading.Event()
+        self.__thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self.__thread is not None:
+            return
+        self.__stop.clear()
+        self.__thread = threading.Thread(
+            target=self._run, name="index-worker", daemon=True
+        )
+        self.__thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+            self.__thread = None
+
+    def _run(self) -> None:
+        jobs = self.__index_job_repository()
+        requeued = jobs.requeue_running()
+        if requeued:
+            logger.info(f"Requeued {len(requeued)} interrupted index jobs")
+
+        while not self.__stop.is_set():
+            job = jobs.get_next_pending()
+            if job is None:
+                self.__stop.wait(self.__poll_interval)
+                continue
+            try:
+                self.__run_index_job().execute(
+                    RunCodebaseIndexJobRequest(job_id=job.id)
+                )
+            except Exception:
+                logger.exception(f"Unable to run index job {job.id}")
+                self.__stop.wait(self.__poll_interval)
+
+
+def retention_policy() -> CompactIndexesRequest:
+    """Reads the retention policy from CODR_RETENTION_KEEP_LAST, CODR_RETENTION_MAX_AGE_DAYS and CODR_PINNED_SHAS."""
+    max_age_days = os.getenv("CODR_RETENTION_MAX_AGE_DAYS")
+    return CompactIndexesRequest(
+        keep_last=int(os.getenv("CODR_RETENTION_KEEP_LAST", "5")),
+        max_age=timedelta(days=float(max_age_days)) if max_age_days else None,
+        pinned_shas={
+            sha.strip()
+            for sha in os.getenv("CODR_PINNED_SHAS", "").split(",")
+            if sha.strip()
+        },
+    )
+
+
+class CompactionWorker:
+    """Periodically deletes the indexes of expired commits on a background thread."""
+
+    def __init__(
+        self,
+        compact_indexes: Callable[[], CompactIndexes],
+        policy: CompactIndexesRequest,
+        interval: float = 6 * 60 * 60,
+    ) -> None:
+        self.__compact_indexes = compact_indexes
+        self.__policy = policy
+        self.__interval = interval
+        self.__stop = threading.Event()
+        self.__thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self.__thread is not None:
+            return
+        self.__stop.clear()
+        self.__thread = threading.Thread(
+            target=self._run, name="compaction-worker", daemon=True
+        )
+        self.__thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+            self.__thread = None
+
+    def _run(self) -> None:
+        compact_indexes = self.__compact_indexes()
+        while not self.__stop.wait(self.__interval):
+            try:
+                response = compact_indexes.execute(self.__policy)
+                logger.info(
+                    f"Compaction expired {len(response.expired)} commits "
+                    f"and reclaimed {response.reclaimed_bytes} bytes"
+                )
+            except Exception:
+                logger.exception("Unable to compact indexes")
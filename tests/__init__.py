@@ -0,0 +1,11 @@
+import os
+import tempfile
+
+# Clients are created on import, tests never reach the services they call
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+os.environ.setdefault("CODR_DATA_DIR", tempfile.mkdtemp(prefix="codr-tests-"))
+os.environ.setdefault(
+    "CODR_DATABASE_URL",
+    f"sqlite:///{os.path.join(os.environ['CODR_DATA_DIR'], 'sqlite.db')}",
+)
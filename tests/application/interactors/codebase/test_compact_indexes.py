@@ -0,0 +1,128 @@
+import tempfile
+from datetime import datetime, timedelta
+from unittest import TestCase
+from unittest.mock import patch
+
+from codr.application.entities import IndexedCommit
+from codr.application.interactors.codebase.compact_indexes import (
+    CompactIndexes,
+    CompactIndexesPorts,
+    CompactIndexesRequest,
+    expired_commits,
+)
+from codr.indexing.lexical import BM25Index
+from codr.indexing.overlay import Overlay
+from tests.fakes import make_stores, memory_session
+
+NOW = datetime(2026, 1, 31)
+
+
+def commit(sha: str, days_ago: int, owner: str = "octo") -> IndexedCommit:
+    return IndexedCommit(
+        id=f"{owner}-{sha}",
+        owner=owner,
+        name="project",
+        sha=sha,
+        manifest={},
+        created_at=NOW - timedelta(days=days_ago),
+    )
+
+
+def shas(commits: list[IndexedCommit]) -> list[str]:
+    return [commit.sha for commit in commits]
+
+
+class TestExpiredCommits(TestCase):
+    def setUp(self) -> None:
+        self.commits = [commit(f"c{days}", days) for days in (3, 0, 2, 1)]
+
+    def test_keeps_the_latest_commits(self) -> None:
+        expired = expired_commits(self.commits, CompactIndexesRequest(keep_last=2), NOW)
+
+        self.assertEqual(shas(expired), ["c2", "c3"])
+
+    def test_always_keeps_the_latest_commit(self) -> None:
+        expired = expired_commits(self.commits, CompactIndexesRequest(keep_last=0), NOW)
+
+        self.assertEqual(shas(expired), ["c1", "c2", "c3"])
+
+    def test_keeps_commits_younger_than_the_maximum_age(self) -> None:
+        request = CompactIndexesRequest(keep_last=1, max_age=timedelta(days=2))
+
+        self.assertEqual(shas(expired_commits(self.commits, request, NOW)), ["c3"])
+
+    def test_keeps_pinned_shas(self) -> None:
+        request = CompactIndexesRequest(keep_last=1, pinned_shas={"c2"})
+
+        self.assertEqual(
+            shas(expired_commits(self.commits, request, NOW)), ["c1", "c3"]
+        )
+
+
+class TestCompactIndexes(TestCase):
+    def setUp(self) -> None:
+        self.stores = make_stores(tempfile.mkdtemp(), memory_session())
+        self.compact = CompactIndexes(
+            CompactIndexesPorts(
+                indexed_commit_repository=self.stores.commits,
+                repo_repository=self.stores.repos,
+                vector_db=self.stores.vector_db,
+                blob_store=self.stores.blobs,
+                lexical_store=self.stores.lexical,
+                symbol_store=self.stores.symbols,
+                graph_store=self.stores.graphs,
+                overlay_store=self.stores.overlays,
+            )
+        )
+        for indexed in (
+            commit("c1", 2),
+            commit("c2", 1),
+            commit("c1", 2, owner="fork"),
+            commit("c3", 0, owner="fork"),
+        ):
+            self.index(indexed.sha, indexed.identifier)
+            self.stores.commits.add(indexed)
+        self.stores.overlays.put(
+            Overlay(sha="b1", base_sha="c1", ref="feature", repo="octo/project")
+        )
+        self.index("b1", "octo/project")
+
+    def index(self, sha: str, repo: str) -> None:
+        self.stores.lexical.put(sha, BM25Index(), repo=repo)
+        self.stores.blobs.put_manifest(sha, {})
+
+    def test_drops_the_expired_indexes_of_each_repository(self) -> None:
+        response = self.compact.execute(CompactIndexesRequest(keep_last=1))
+
+        self.assertEqual(
+            sorted((c.identifier, c.sha) for c in response.expired),
+            [("fork/project", "c1"), ("octo/project", "c1")],
+        )
+        self.assertEqual(response.expired_overlays, ["b1"])
+        self.assertEqual(sorted(shas(self.stores.commits.list_all())), ["c2", "c3"])
+        self.assertIsNone(self.stores.lexical.get("c1", "octo/project"))
+        self.assertIsNone(self.stores.overlays.get("b1", "octo/project"))
+        self.assertIsNone(self.stores.blobs.get_manifest("c1"))
+        self.assertIsNotNone(self.stores.lexical.get("c2", "octo/project"))
+
+    def test_keeps_a_sha_another_repository_keeps(self) -> None:
+        self.stores.commits.remove("fork-c3")
+
+        response = self.compact.execute(CompactIndexesRequest(keep_last=1))
+
+        self.assertEqual([c.id for c in response.expired], ["octo-c1"])
+        self.assertIsNone(self.stores.lexical.get("c1", "octo/project"))
+        self.assertIsNotNone(self.stores.lexical.get("c1", "fork/project"))
+        self.assertEqual(self.stores.blobs.get_manifest("c1"), {})
+
+    def test_commits_are_forgotten_once_their_indexes_are_dropped(self) -> None:
+        with patch.object(self.stores.graphs, "drop", side_effect=OSError("disk")):
+            with self.assertRaises(OSError):
+                self.compact.execute(CompactIndexesRequest(keep_last=1))
+
+        self.assertEqual(len(self.stores.commits.list_all()), 4)
+
+        self.compact.execute(CompactIndexesRequest(keep_last=1))
+
+        self.assertEqual(sorted(shas(self.stores.commits.list_all())), ["c2", "c3"])
+        self.assertIsNone(self.stores.lexical.get("c1", "fork/project"))
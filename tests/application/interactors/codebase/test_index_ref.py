@@ -0,0 +1,143 @@
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import TestCase
+
+from codr.application.entities import IndexJobStatus, Repo
+from codr.application.interactors.codebase.create_index import (
+    CreateCodebaseIndex,
+    CreateCodebaseIndexPorts,
+)
+from codr.application.interactors.codebase.enqueue_index import (
+    EnqueueCodebaseIndex,
+    EnqueueCodebaseIndexRequest,
+)
+from codr.application.interactors.codebase.run_index_job import (
+    RunCodebaseIndexJob,
+    RunCodebaseIndexJobRequest,
+)
+from tests.fakes import (
+    FakeGitHubRepository,
+    FakeVersionControlService,
+    make_codebase_service,
+    make_index_job_repository,
+    make_stores,
+    memory_session,
+    sqlite_sessions,
+)
+
+
+class TestIndexJobRef(TestCase):
+    def setUp(self) -> None:
+        root = tempfile.mkdtemp()
+        sessions = sqlite_sessions(os.path.join(root, "codr.db"))
+        session = sessions()
+        self.stores = make_stores(root, session)
+        self.stores.repos.add(Repo(id="repo", owner="octo", name="project"))
+        self.jobs = make_index_job_repository(session)
+
+        self.repo = FakeGitHubRepository()
+        self.repo.commit("c1", {"app/main.py": "def main():\n    pass\n"})
+        self.repo.commit(
+            "b1",
+            {
+                "app/main.py": "def main():\n    return feature()\n\n\ndef feature():\n    pass\n"
+            },
+            branch="feature",
+        )
+        self.service = make_codebase_service(self.stores)
+        create_index = CreateCodebaseIndex(
+            CreateCodebaseIndexPorts(
+                version_control_service=FakeVersionControlService(self.repo),
+                codebase_service=self.service,
+                repo_repository=self.stores.repos,
+                user_repository=SimpleNamespace(
+                    get=lambda id_: SimpleNamespace(id=id_)
+                ),
+            )
+        )
+        self.enqueue = EnqueueCodebaseIndex(
+            repo_repository=self.stores.repos, index_job_repository=self.jobs
+        )
+        self.run_job = RunCodebaseIndexJob(
+            index_job_repository=self.jobs,
+            create_codebase_index=create_index,
+            progress_repository=lambda: make_index_job_repository(sessions()),
+        )
+
+    def test_job_indexes_its_ref_as_an_overlay(self) -> None:
+        job = self.enqueue.execute(
+            EnqueueCodebaseIndexRequest(user_id="user", repo_id="repo", ref="feature")
+        ).job
+        self.assertEqual(self.jobs.get(job.id).ref, "feature")
+
+        job = self.run_job.execute(RunCodebaseIndexJobRequest(job_id=job.id)).job
+
+        self.assertEqual(job.status, IndexJobStatus.SUCCEEDED, job.error)
+        overlay = self.stores.overlays.get("b1", "octo/project")
+        self.assertEqual((overlay.base_sha, overlay.ref), ("c1", "feature"))
+        self.assertEqual(overlay.tombstones, {"app/main.py"})
+        self.assertEqual(
+            len(self.service.find_symbol("feature", "b1", "octo/project")), 1
+        )
+        self.assertEqual(self.service.find_symbol("feature", "c1", "octo/project"), [])
+
+    def test_jobs_for_other_refs_are_not_merged(self) -> None:
+        default = self.enqueue.execute(
+            EnqueueCodebaseIndexRequest(user_id="user", repo_id="repo")
+        ).job
+
+        branch = self.enqueue.execute(
+            EnqueueCodebaseIndexRequest(user_id="user", repo_id="repo", ref="feature")
+        ).job
+        again = self.enqueue.execute(
+            EnqueueCodebaseIndexRequest(user_id="user", repo_id="repo", ref="feature")
+        ).job
+
+        self.assertNotEqual(branch.id, default.id)
+        self.assertEqual(again.id, branch.id)
+
+
+class TestForkOverlays(TestCase):
+    def setUp(self) -> None:
+        self.stores = make_stores(tempfile.mkdtemp(), memory_session())
+        self.service = make_codebase_service(self.stores)
+        self.repos = {}
+        for owner in ("octo", "fork"):
+            repo = FakeGitHubRepository(owner_login=owner)
+            repo.commit("c1", {"app/main.py": "def main():\n    pass\n"})
+            repo.commit(
+                "b1",
+                {
+                    "app/main.py": "def main():\n    pass\n\n\ndef feature():\n    pass\n"
+                },
+                branch="feature",
+            )
+            self.stores.repos.add(Repo(id=owner, owner=owner, name="project", sha="c1"))
+            self.repos[owner] = repo
+            self.service.create_index(repo)
+
+    def test_each_fork_indexes_its_own_overlay(self) -> None:
+        for owner in ("octo", "fork"):
+            self.service.create_index(self.repos[owner], ref="feature")
+
+        for repo in ("octo/project", "fork/project"):
+            overlay = self.stores.overlays.get("b1", repo)
+            self.assertEqual((overlay.repo, overlay.base_sha), (repo, "c1"))
+            self.assertEqual(len(self.service.find_symbol("feature", "b1", repo)), 1)
+
+    def test_indexing_a_fork_at_a_branch_head_keeps_the_other_overlay(self) -> None:
+        self.service.create_index(self.repos["octo"], ref="feature")
+        fork = self.repos["fork"]
+        fork.branches["main"] = "b1"
+        self.stores.repos.add(
+            Repo(id="fork-b1", owner="fork", name="project", sha="b1")
+        )
+
+        self.service.create_index(fork)
+
+        self.assertIsNotNone(self.stores.overlays.get("b1", "octo/project"))
+        self.assertIsNone(self.stores.overlays.get("b1", "fork/project"))
+        self.assertEqual(
+            len(self.service.find_symbol("feature", "b1", "octo/project")), 1
+        )
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from codr.application.entities import IndexJob, IndexJobStatus
+from codr.application.interactors.codebase.create_index import (
+    CreateCodebaseIndexRequest,
+    CreateCodebaseIndexResponse,
+)
+from codr.application.interactors.codebase.run_index_job import (
+    RunCodebaseIndexJob,
+    RunCodebaseIndexJobRequest,
+)
+from tests.fakes import make_index_job_repository, sqlite_sessions
+
+
+class ThreadedCreateCodebaseIndex:
+    """Reports progress from a pipeline thread until the job row shows it."""
+
+    def __init__(self, read_job) -> None:
+        self.read_job = read_job
+        self.seen = []
+
+    def execute(
+        self, request: CreateCodebaseIndexRequest
+    ) -> CreateCodebaseIndexResponse:
+        def work() -> None:
+            for files in range(1, 4):
+                request.progress.add_file(10)
+                request.progress.add_chunks(2)
+                deadline = time.monotonic() + 5
+                while self.read_job().files != files and time.monotonic() < deadline:
+                    time.sleep(0.005)
+                self.seen.append(self.read_job().files)
+
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+        return CreateCodebaseIndexResponse(progress=request.progress)
+
+
+class TestRunCodebaseIndexJob(TestCase):
+    def setUp(self) -> None:
+        self.sessions = sqlite_sessions(os.path.join(tempfile.mkdtemp(), "jobs.db"))
+        self.jobs = make_index_job_repository(self.sessions())
+        self.job = self.jobs.add(IndexJob(id="job", user_id="user", repo_id="repo"))
+        self.factory_threads = []
+
+    def progress_repository(self):
+        self.factory_threads.append(threading.current_thread())
+        return make_index_job_repository(self.sessions())
+
+    def read_job(self) -> IndexJob:
+        session = self.sessions()
+        try:
+            return make_index_job_repository(session).get("job")
+        finally:
+            session.close()
+
+    @patch(
+        "codr.application.interactors.codebase.run_index_job.PROGRESS_UPDATE_INTERVAL",
+        0.01,
+    )
+    def test_progress_is_written_from_its_own_thread_and_session(self) -> None:
+        create_index = ThreadedCreateCodebaseIndex(self.read_job)
+        run = RunCodebaseIndexJob(
+            index_job_repository=self.jobs,
+            create_codebase_index=create_index,
+            progress_repository=self.progress_repository,
+        )
+
+        job = run.execute(RunCodebaseIndexJobRequest(job_id="job")).job
+
+        self.assertEqual(create_index.seen, [1, 2, 3])
+        self.assertEqual(len(self.factory_threads), 1)
+        self.assertIsNot(self.factory_threads[0], threading.current_thread())
+        self.assertEqual(job.status, IndexJobStatus.SUCCEEDED)
+        self.assertEqual((job.files, job.chunks), (3, 6))
+        self.assertEqual(self.read_job().status, IndexJobStatus.SUCCEEDED)
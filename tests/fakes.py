@@ -0,0 +1,194 @@
+import base64
+import hashlib
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from codr.application.entities import IndexedCommit, IndexJob, Repo
+from codr.codebase_service import CodebaseService
+from codr.indexing.sources import IngestionMode
+from codr.models import Base, IndexedCommitModel, IndexJobModel, RepoModel
+from codr.storage.blob_store import BlobStore, git_blob_sha
+from codr.storage.dao.sql_dao import SqlDAO
+from codr.storage.graph_store import CodeGraphStore
+from codr.storage.index_job_repository import IndexJobRepository
+from codr.storage.indexed_commit_repository import IndexedCommitRepository
+from codr.storage.lexical_store import LexicalIndexStore
+from codr.storage.mapper.index_job import MapperIndexJob
+from codr.storage.mapper.indexed_commit import MapperIndexedCommit
+from codr.storage.mapper.repo import MapperRepo
+from codr.storage.numpy_vector_db import NumpyVectorDb
+from codr.storage.overlay_store import OverlayStore
+from codr.storage.overlay_vector_db import OverlayVectorDb
+from codr.storage.query_cache import CachedVectorDb
+from codr.storage.repo_repository import RepoRepository
+from codr.storage.repository import Factory
+from codr.storage.symbol_store import SymbolIndexStore
+
+
+class HashEmbeddingFunction:
+    """Deterministic embeddings derived from the hash of each text."""
+
+    model = "hash-embedding"
+
+    def __init__(self, dimensions: int = 16) -> None:
+        self.dimensions = dimensions
+        self.calls = 0
+
+    def __call__(self, input: list[str]) -> list[list[float]]:
+        self.calls += 1
+        embeddings = []
+        for text in input:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4])
+            rng = np.random.default_rng(seed)
+            embeddings.append(rng.standard_normal(self.dimensions).tolist())
+        return embeddings
+
+
+@dataclass
+class FakeGitHubRepository:
+    """The parts of a PyGithub repository the indexing code reads.
+
+    Every commit is a dict of paths to contents, the first one is the head
+    of the default branch and branches point at any other.
+    """
+
+    owner_login: str = "octo"
+    name: str = "project"
+    commits: dict[str, dict[str, str]] = field(default_factory=dict)
+    branches: dict[str, str] = field(default_factory=dict)
+    default_branch: str = "main"
+    # Commits whose tree GitHub cuts short, listing only their first path
+    truncated: set[str] = field(default_factory=set)
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.owner_login}/{self.name}"
+
+    @property
+    def owner(self) -> SimpleNamespace:
+        return SimpleNamespace(login=self.owner_login)
+
+    def commit(self, sha: str, files: dict[str, str], branch: str = "main") -> None:
+        self.commits[sha] = files
+        self.branches[branch] = sha
+
+    def get_branch(self, branch: str) -> SimpleNamespace:
+        return SimpleNamespace(commit=SimpleNamespace(sha=self.branches[branch]))
+
+    def get_commit(self, ref: str) -> SimpleNamespace:
+        return SimpleNamespace(sha=self.branches.get(ref, ref))
+
+    def get_git_tree(self, sha: str, recursive: bool = False) -> SimpleNamespace:
+        tree = [
+            SimpleNamespace(
+                path=path, sha=git_blob_sha(content.encode("utf-8")), type="blob"
+            )
+            for path, content in self.commits[sha].items()
+        ]
+        if sha in self.truncated:
+            return SimpleNamespace(raw_data={"truncated": True}, tree=tree[:1])
+        return SimpleNamespace(raw_data={}, tree=tree)
+
+    def get_git_blob(self, blob_sha: str) -> SimpleNamespace:
+        for files in self.commits.values():
+            for content in files.values():
+                raw = content.encode("utf-8")
+                if git_blob_sha(raw) == blob_sha:
+                    return SimpleNamespace(content=base64.b64encode(raw).decode())
+        raise KeyError(blob_sha)
+
+    def get_archive_link(self, archive_format: str, ref: str) -> str:
+        return f"https://codeload.github.com/{self.full_name}/{archive_format}/{ref}"
+
+    def get_contents(self, path: str, ref: str) -> list[SimpleNamespace]:
+        return [
+            SimpleNamespace(
+                type="file", path=file_path, decoded_content=content.encode("utf-8")
+            )
+            for file_path, content in self.commits[ref].items()
+        ]
+
+
+class FakeVersionControlService:
+    """Hands out one repository, as GitHubClient does once a user and repo are set."""
+
+    def __init__(self, repo: FakeGitHubRepository) -> None:
+        self.repo = repo
+
+    def set_user(self, user_id: str) -> None:
+        pass
+
+    def set_repository(self, slug: str) -> str:
+        return self.repo.branches[self.repo.default_branch]
+
+
+def memory_session() -> Session:
+    return sqlite_sessions("")()
+
+
+def sqlite_sessions(path: str) -> sessionmaker:
+    """Sessions of a database file, or of a private in-memory database for ''."""
+    engine = create_engine(
+        f"sqlite:///{path}", connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def make_index_job_repository(session: Session) -> IndexJobRepository:
+    return IndexJobRepository(
+        dao=SqlDAO(session=session, model=IndexJobModel, mapper=MapperIndexJob()),
+        factory=Factory(IndexJob),
+    )
+
+
+def make_stores(root: str, session: Session) -> SimpleNamespace:
+    """Creates every store the way Dependencies does, each under `root`."""
+    overlays = OverlayStore(root=f"{root}/overlays")
+    return SimpleNamespace(
+        repos=RepoRepository(
+            dao=SqlDAO(session=session, model=RepoModel, mapper=MapperRepo()),
+            factory=Factory(Repo),
+        ),
+        commits=IndexedCommitRepository(
+            dao=SqlDAO(
+                session=session,
+                model=IndexedCommitModel,
+                mapper=MapperIndexedCommit(),
+            ),
+            factory=Factory(IndexedCommit),
+        ),
+        overlays=overlays,
+        vector_db=CachedVectorDb(
+            OverlayVectorDb(
+                NumpyVectorDb(
+                    root=f"{root}/vectors", embedding_function=HashEmbeddingFunction()
+                ),
+                overlays=overlays,
+            ),
+            overlays=overlays,
+        ),
+        blobs=BlobStore(root=f"{root}/blobs"),
+        lexical=LexicalIndexStore(root=f"{root}/lexical", overlays=overlays),
+        symbols=SymbolIndexStore(root=f"{root}/symbols", overlays=overlays),
+        graphs=CodeGraphStore(root=f"{root}/graphs"),
+    )
+
+
+def make_codebase_service(stores: SimpleNamespace, **kwargs) -> CodebaseService:
+    return CodebaseService(
+        storage=stores.repos,
+        vector_db=stores.vector_db,
+        commits=stores.commits,
+        blob_store=stores.blobs,
+        lexical_store=stores.lexical,
+        symbol_store=stores.symbols,
+        graph_store=stores.graphs,
+        overlay_store=stores.overlays,
+        ingestion_mode=IngestionMode.API,
+        **kwargs,
+    )
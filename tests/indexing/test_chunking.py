@@ -0,0 +1,62 @@
+import io
+from unittest import TestCase
+
+from codr.indexing.chunking import FixedSizeChunker, PythonAstChunker
+
+SOURCE = """import os
+
+
+# Reads the config
+def load(path):
+    return open(path).read()
+
+
+class Config:
+    def get(self, key):
+        return os.environ[key]
+
+    def set(self, key, value):
+        os.environ[key] = value
+"""
+
+
+class TestChunkOffsets(TestCase):
+    def assert_chunks_locate_their_content(self, chunker, content: str) -> None:
+        lines = io.StringIO(content).readlines()
+        for chunk in chunker.chunk("a.py", content):
+            self.assertEqual(
+                content[chunk.offset : chunk.offset + len(chunk.content)],
+                chunk.content,
+            )
+            self.assertIn(
+                chunk.content, "".join(lines[chunk.start_line - 1 : chunk.end_line])
+            )
+
+    def test_python_chunks_cover_the_file_without_overlap(self) -> None:
+        chunks = PythonAstChunker().chunk("a.py", SOURCE)
+
+        self.assertEqual("".join(chunk.content for chunk in chunks), SOURCE)
+        self.assertEqual([chunk.start_line for chunk in chunks], [1, 4, 9, 13])
+        self.assert_chunks_locate_their_content(PythonAstChunker(), SOURCE)
+
+    def test_only_newlines_end_lines(self) -> None:
+        content = "import os\n\x0c\ndef a():\n    return 1\n"
+
+        chunks = PythonAstChunker().chunk("a.py", content)
+
+        self.assertEqual([chunk.start_line for chunk in chunks], [1, 3])
+        self.assertEqual(chunks[-1].content, "def a():\n    return 1\n")
+        self.assert_chunks_locate_their_content(PythonAstChunker(), content)
+
+    def test_long_definitions_are_split_on_lines(self) -> None:
+        chunker = PythonAstChunker(max_chunk_size=40)
+
+        self.assertGreater(len(chunker.chunk("a.py", SOURCE)), 4)
+        self.assert_chunks_locate_their_content(chunker, SOURCE)
+
+    def test_fixed_size_chunks_overlap(self) -> None:
+        chunker = FixedSizeChunker(chunk_size=50, overlap_size=10)
+        chunks = chunker.chunk("a.txt", SOURCE)
+
+        self.assertEqual([chunk.offset for chunk in chunks[:3]], [0, 40, 80])
+        self.assert_chunks_locate_their_content(chunker, SOURCE)
@@ -0,0 +1,103 @@
+from unittest import TestCase
+
+from codr.indexing.graph import MAX_CALL_TARGETS, Adjacency, CodeGraph
+from codr.indexing.symbols import SymbolIndex
+
+
+def graph(files: dict[str, str]) -> CodeGraph:
+    index = SymbolIndex()
+    for path, content in files.items():
+        index.add_file(path, content)
+    return CodeGraph.build(index)
+
+
+class TestAdjacency(TestCase):
+    def test_edges_are_deduplicated_and_transposed(self) -> None:
+        adjacency = Adjacency.from_edges(3, [(0, 1), (0, 2), (0, 1), (2, 1)])
+
+        self.assertEqual(adjacency.n_edges, 3)
+        self.assertEqual(sorted(adjacency.neighbours([0]).tolist()), [1, 2])
+        self.assertEqual(sorted(adjacency.transpose().neighbours([1]).tolist()), [0, 2])
+
+
+class TestCodeGraph(TestCase):
+    def test_src_layout_imports_resolve_by_suffix(self) -> None:
+        code_graph = graph(
+            {
+                "src/app/__init__.py": "",
+                "src/app/models.py": "class Repo: ...\n",
+                "src/app/service.py": "from app.models import Repo\n",
+                "tests/test_service.py": "from app import service\n",
+            }
+        )
+
+        self.assertEqual(
+            code_graph.expand(["src/app/service.py"]),
+            [
+                "src/app/models.py",
+                "tests/test_service.py",
+            ],
+        )
+
+    def test_ambiguous_suffixes_are_not_resolved(self) -> None:
+        code_graph = graph(
+            {
+                "one/utils.py": "",
+                "two/utils.py": "",
+                "main.py": "import utils\n",
+            }
+        )
+
+        self.assertEqual(code_graph.imports.n_edges, 0)
+
+    def test_relative_imports_link_their_files(self) -> None:
+        code_graph = graph(
+            {
+                "pkg/__init__.py": "from .core import run\n",
+                "pkg/core.py": "def run(): ...\n",
+            }
+        )
+
+        self.assertEqual(code_graph.expand(["pkg/__init__.py"]), ["pkg/core.py"])
+
+    def test_calls_to_names_defined_in_too_many_files_are_not_linked(self) -> None:
+        files = {f"handlers/h{i}.py": "def handle(): ...\n" for i in range(5)}
+        files["common.py"] = "def unique(): ...\n"
+        files["main.py"] = "def main():\n    handle()\n    unique()\n"
+        code_graph = graph(files)
+
+        self.assertEqual(code_graph.expand(["main.py"]), [])
+        self.assertEqual(code_graph.expand(["main.py"], calls=True), ["common.py"])
+
+    def test_calls_to_a_few_definitions_link_each(self) -> None:
+        files = {
+            f"handlers/h{i}.py": "def handle(): ...\n" for i in range(MAX_CALL_TARGETS)
+        }
+        files["main.py"] = "handle()\n"
+
+        self.assertEqual(
+            graph(files).expand(["main.py"], calls=True),
+            [f"handlers/h{i}.py" for i in range(MAX_CALL_TARGETS)],
+        )
+
+    def test_closer_and_more_connected_files_come_first(self) -> None:
+        code_graph = graph(
+            {
+                "a.py": "import b\nimport c\n",
+                "b.py": "import e\n",
+                "c.py": "import d\nimport e\n",
+                "d.py": "",
+                "e.py": "import f\n",
+                "f.py": "",
+            }
+        )
+
+        self.assertEqual(code_graph.expand(["a.py"], hops=1), ["b.py", "c.py"])
+        self.assertEqual(
+            code_graph.expand(["a.py"], hops=3),
+            ["b.py", "c.py", "e.py", "d.py", "f.py"],
+        )
+        self.assertEqual(
+            code_graph.expand(["a.py"], hops=3, limit=3), ["b.py", "c.py", "e.py"]
+        )
+        self.assertEqual(code_graph.expand(["missing.py"]), [])
@@ -0,0 +1,56 @@
+from unittest import TestCase
+
+from codr.application.entities import Document
+from codr.indexing.lexical import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def document(content: str, source: str, sha: str = "c1") -> Document:
+    return Document(id=source, content=content, source=source, sha=sha)
+
+
+def sources(hits: list) -> list[str]:
+    return [metadata["source"] for _, metadata in hits]
+
+
+class TestBM25Index(TestCase):
+    def setUp(self) -> None:
+        self.index = BM25Index()
+        self.index.add_documents(
+            [
+                document("def load_config(path): return read(path)", "config.py"),
+                document("config = load_config('app.toml')", "app.py"),
+                document("def render(template): return template", "views.py"),
+            ]
+        )
+
+    def test_identifiers_are_split_into_words(self) -> None:
+        self.assertEqual(tokenize("loadConfig")[1:], tokenize("load_config")[1:])
+        self.assertEqual(tokenize("load_config"), ["load_config", "load", "config"])
+
+    def test_the_definition_of_a_symbol_ranks_first(self) -> None:
+        self.assertEqual(
+            sources(self.index.search_text("load_config")), ["config.py", "app.py"]
+        )
+
+    def test_chunks_without_query_terms_are_not_returned(self) -> None:
+        self.assertEqual(sources(self.index.search_text("template")), ["views.py"])
+
+    def test_carry_forward_copies_the_chunks_of_sources(self) -> None:
+        index = BM25Index()
+
+        carried = index.carry_forward(self.index, sha="c2", sources={"views.py"})
+
+        self.assertEqual(carried, 1)
+        self.assertEqual(
+            [metadata["sha"] for _, metadata in index.search_text("render")], ["c2"]
+        )
+
+
+class TestReciprocalRankFusion(TestCase):
+    def test_chunks_ranked_by_both_come_first(self) -> None:
+        a, b, c = ({"source": source, "sha": "c1"} for source in "abc")
+
+        fused = reciprocal_rank_fusion([[a, b], [c, b]])
+
+        self.assertEqual(sources(fused), ["b", "a", "c"])
+        self.assertAlmostEqual(fused[0][0], 2 / 62)
@@ -0,0 +1,70 @@
+from unittest import TestCase
+
+from codr.application.entities import Document
+from codr.indexing.lexical import BM25Index
+from codr.indexing.overlay import Overlay
+from codr.indexing.symbols import SymbolIndex
+
+
+def document(content: str, source: str, sha: str = "c1") -> Document:
+    return Document(id=f"{sha}:{source}", content=content, source=source, sha=sha)
+
+
+def sources(hits: list) -> list[str]:
+    return [metadata["source"] for _, metadata in hits]
+
+
+class TestOverlay(TestCase):
+    def setUp(self) -> None:
+        self.overlay = Overlay(
+            sha="b1", base_sha="c1", ref="feature", tombstones={"old.py"}
+        )
+
+    def test_tombstoned_base_chunks_are_hidden(self) -> None:
+        base = [
+            [
+                (0.9, {"source": "old.py", "sha": "c1"}),
+                (0.5, {"source": "kept.py", "sha": "c1"}),
+            ]
+        ]
+        delta = [[(0.7, {"source": "old.py", "sha": "b1"})]]
+
+        merged = self.overlay.merge_rankings(base, delta, n_results=5)
+
+        self.assertEqual(
+            [(metadata["source"], metadata["sha"]) for _, metadata in merged[0]],
+            [("old.py", "b1"), ("kept.py", "b1")],
+        )
+
+    def test_merged_lexical_index_shares_term_statistics(self) -> None:
+        base = BM25Index()
+        base.add_documents(
+            [
+                document("def parse(): pass", "old.py"),
+                document("def parse_all(): parse()", "kept.py"),
+            ]
+        )
+        delta = BM25Index()
+        delta.add_documents([document("def parse(text): pass", "old.py", sha="b1")])
+
+        merged = self.overlay.merge_lexical(base, delta)
+
+        self.assertEqual(len(merged), 2)
+        self.assertEqual(sources(merged.search_text("parse")), ["old.py", "kept.py"])
+        self.assertEqual({m["sha"] for m in merged.metadatas}, {"b1"})
+
+    def test_merged_symbols_come_from_the_delta_for_tombstoned_files(self) -> None:
+        base = SymbolIndex()
+        base.add_file("old.py", "def parse():\n    pass\n")
+        base.add_file("kept.py", "def keep():\n    pass\n")
+        delta = SymbolIndex()
+        delta.add_file("old.py", "\n\ndef parse():\n    pass\n")
+
+        merged = self.overlay.merge_symbols(base, delta)
+
+        (parse,) = [s for s in merged.lookup("parse") if s.name == "parse"]
+        self.assertEqual(parse.start_line, 3)
+        self.assertIn("kept.py", merged.files)
+
+    def test_round_trips_through_a_dict(self) -> None:
+        self.assertEqual(Overlay.from_dict(self.overlay.to_dict()), self.overlay)
@@ -0,0 +1,108 @@
+import threading
+from typing import Iterator
+from unittest import TestCase
+
+from codr.indexing.pipeline import Pipeline, Stage, batch_stage
+
+
+class Source:
+    """Counts up to `size`, recording how far it was read and whether it was closed."""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.read = 0
+        self.closed = False
+
+    def __iter__(self) -> Iterator[int]:
+        try:
+            for item in range(self.size):
+                self.read += 1
+                yield item
+        finally:
+            self.closed = True
+
+
+class TestPipeline(TestCase):
+    def test_single_worker_stages_keep_the_order_of_the_source(self) -> None:
+        written: list[list[int]] = []
+
+        Pipeline(
+            Source(10),
+            [
+                Stage("double", lambda item: [item * 2]),
+                batch_stage("batch", 4),
+                Stage("write", lambda batch: written.append(batch) or ()),
+            ],
+        ).run()
+
+        self.assertEqual(written, [[0, 2, 4, 6], [8, 10, 12, 14], [16, 18]])
+
+    def test_queues_hold_at_most_queue_size_items(self) -> None:
+        release = threading.Event()
+
+        def slow(item: int) -> tuple:
+            release.wait()
+            return ()
+
+        source = Source(100)
+        reports = []
+        pipeline = Pipeline(source, [Stage("slow", slow)], queue_size=4)
+        thread = threading.Thread(target=lambda: reports.append(pipeline.run()))
+        thread.start()
+        try:
+            # One item is held by the stage and one by the source's blocked put
+            for _ in range(100):
+                if source.read >= 6:
+                    break
+                threading.Event().wait(0.01)
+            threading.Event().wait(0.05)
+            self.assertEqual(source.read, 6)
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual(reports[0].stages[0].peak_queued, 4)
+
+    def test_a_failing_stage_stops_the_source_and_is_raised(self) -> None:
+        def fail(item: int) -> Iterator[int]:
+            if item == 3:
+                raise ValueError("bad item")
+            yield item
+
+        source = Source(1000)
+        # Held here, so the generator is not closed by being collected
+        items = iter(source)
+
+        with self.assertRaisesRegex(ValueError, "bad item"):
+            Pipeline(items, [Stage("fail", fail)], queue_size=2).run()
+
+        self.assertLess(source.read, 1000)
+        self.assertTrue(source.closed)
+
+    def test_a_failing_source_is_raised(self) -> None:
+        def source() -> Iterator[int]:
+            yield 1
+            raise OSError("connection reset")
+
+        with self.assertRaisesRegex(OSError, "connection reset"):
+            Pipeline(source(), [Stage("collect", lambda item: ())]).run()
+
+    def test_the_last_worker_flushes_the_stage(self) -> None:
+        written: list[int] = []
+        lock = threading.Lock()
+
+        def write(batch: list[int]) -> tuple:
+            with lock:
+                written.extend(batch)
+            return ()
+
+        Pipeline(
+            Source(50),
+            [
+                Stage("square", lambda item: [item * item], workers=4),
+                batch_stage("batch", 8),
+                Stage("write", write),
+            ],
+        ).run()
+
+        self.assertEqual(sorted(written), [item * item for item in range(50)])
@@ -0,0 +1,64 @@
+import random
+from unittest import TestCase
+
+from codr.indexing.chunking import Chunk, FixedSizeChunker, PythonAstChunker
+from codr.indexing.reconstruction import reconstruct_file, stream_file
+from tests.indexing.test_chunking import SOURCE
+
+CONTENT = "".join(f"value_{n} = {n * n}  # line {n}\n" for n in range(1, 60))
+
+
+def metadata(chunk: Chunk) -> dict:
+    return {
+        "start_line": chunk.start_line,
+        "end_line": chunk.end_line,
+        "offset": chunk.offset,
+    }
+
+
+def shuffled(chunks: list[Chunk]) -> tuple[list[str], list[dict]]:
+    chunks = list(chunks)
+    random.Random(0).shuffle(chunks)
+    return [chunk.content for chunk in chunks], [metadata(chunk) for chunk in chunks]
+
+
+class TestReconstructFile(TestCase):
+    def test_overlapping_chunks_given_out_of_order(self) -> None:
+        chunks = FixedSizeChunker(chunk_size=200, overlap_size=50).chunk(
+            "a.py", CONTENT
+        )
+
+        self.assertGreater(len(chunks), 3)
+        self.assertEqual(reconstruct_file(*shuffled(chunks)), CONTENT)
+
+    def test_definition_chunks_given_out_of_order(self) -> None:
+        chunks = PythonAstChunker(max_chunk_size=40).chunk("a.py", SOURCE)
+
+        self.assertEqual(reconstruct_file(*shuffled(chunks)), SOURCE)
+
+    def test_chunks_without_offsets_are_merged_on_their_overlap(self) -> None:
+        chunks = FixedSizeChunker(chunk_size=300, overlap_size=100).chunk(
+            "a.py", CONTENT
+        )
+        documents, _ = shuffled(chunks)
+
+        self.assertEqual(reconstruct_file(documents, [{}] * len(documents)), CONTENT)
+
+
+class TestStreamFile(TestCase):
+    def test_chunks_fully_inside_the_text_read_add_nothing(self) -> None:
+        content = "a = 1\nb = 2\n"
+        chunks = [
+            ("a = 1\nb = 2\n", {"start_line": 1, "offset": 0}),
+            ("b = 2\n", {"start_line": 2, "offset": 6}),
+        ]
+
+        self.assertEqual("".join(stream_file(chunks)), content)
+
+    def test_unindexed_blank_lines_are_restored(self) -> None:
+        chunks = [
+            ("a = 1\n", {"start_line": 1, "offset": 0}),
+            ("b = 2\n", {"start_line": 4, "offset": 8}),
+        ]
+
+        self.assertEqual("".join(stream_file(chunks)), "a = 1\n\n\nb = 2\n")
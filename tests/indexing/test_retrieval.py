@@ -0,0 +1,126 @@
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from codr.application.entities import Document
+from codr.indexing.lexical import BM25Index
+from codr.indexing.retrieval import HybridRetriever, Span, fuse_by_file, merge_spans
+from tests.fakes import make_stores, memory_session
+
+
+def hit(score: float, source: str, start_line: int, end_line: int) -> tuple:
+    return score, {"source": source, "start_line": start_line, "end_line": end_line}
+
+
+class TestFuseByFile(TestCase):
+    def test_files_matching_several_queries_come_first(self) -> None:
+        files = fuse_by_file(
+            [
+                [
+                    hit(0.9, "a.py", 1, 5),
+                    hit(0.8, "b.py", 1, 5),
+                    hit(0.7, "a.py", 9, 9),
+                ],
+                [hit(0.6, "b.py", 20, 30), hit(0.5, "c.py", 1, 2)],
+            ]
+        )
+
+        self.assertEqual(
+            [(f.path, round(f.score, 6)) for f in files],
+            [("b.py", 1.4), ("a.py", 0.9), ("c.py", 0.5)],
+        )
+
+    def test_files_far_below_the_best_are_cut_off(self) -> None:
+        rankings = [
+            [hit(1.0, "a.py", 1, 1), hit(0.3, "b.py", 1, 1), hit(0.1, "c.py", 1, 1)]
+        ]
+
+        self.assertEqual([f.path for f in fuse_by_file(rankings)], ["a.py", "b.py"])
+        self.assertEqual(
+            [f.path for f in fuse_by_file(rankings, relative_cutoff=0.5)], ["a.py"]
+        )
+        self.assertEqual(
+            [f.path for f in fuse_by_file(rankings, relative_cutoff=0, max_files=2)],
+            ["a.py", "b.py"],
+        )
+
+    def test_spans_of_a_file_are_merged(self) -> None:
+        (file,) = fuse_by_file(
+            [
+                [hit(0.9, "a.py", 10, 20), hit(0.4, "a.py", 40, 50)],
+                [hit(0.7, "a.py", 15, 25), hit(0.2, "a.py", 51, 60)],
+            ]
+        )
+
+        self.assertEqual(file.spans, [Span(10, 25, 0.9), Span(40, 60, 0.4)])
+
+    def test_no_hits_no_files(self) -> None:
+        self.assertEqual(fuse_by_file([[], []]), [])
+
+    def test_merge_spans_keeps_separate_spans_apart(self) -> None:
+        self.assertEqual(
+            merge_spans([Span(5, 6, 0.1), Span(1, 3, 0.5)]),
+            [Span(1, 3, 0.5), Span(5, 6, 0.1)],
+        )
+
+
+class TestHybridRetriever(TestCase):
+    def setUp(self) -> None:
+        self.stores = make_stores(tempfile.mkdtemp(), memory_session())
+        documents = [
+            Document(
+                id=source,
+                content=content,
+                source=source,
+                sha="c1",
+                repo="octo/project",
+                start_line=1,
+                end_line=content.count("\n") + 1,
+            )
+            for source, content in (
+                ("config.py", "def load_config(path):\n    return read(path)"),
+                ("app.py", "config = load_config('app.toml')"),
+                ("views.py", "def render(template):\n    return template"),
+            )
+        ]
+        self.stores.vector_db.create(documents)
+        lexical = BM25Index()
+        lexical.add_documents(documents)
+        self.stores.lexical.put("c1", lexical, repo="octo/project")
+        self.retriever = HybridRetriever(self.stores.vector_db, self.stores.lexical)
+
+    def test_queries_naming_a_defined_symbol_are_not_embedded(self) -> None:
+        with patch.object(
+            self.stores.vector_db,
+            "query_scores",
+            wraps=self.stores.vector_db.query_scores,
+        ) as query_scores:
+            files = self.retriever.search_files(
+                ["load_config", "how are templates rendered"],
+                sha="c1",
+                repo="octo/project",
+            )
+
+        self.assertEqual(query_scores.call_args.args[0], ["how are templates rendered"])
+        self.assertEqual(files[0].path, "config.py")
+        self.assertIn("views.py", [f.path for f in files])
+
+    def test_symbol_queries_alone_skip_the_vector_db(self) -> None:
+        with patch.object(self.stores.vector_db, "query_scores") as query_scores:
+            files = self.retriever.search_files(
+                ["load_config()"], sha="c1", repo="octo/project"
+            )
+
+        query_scores.assert_not_called()
+        self.assertEqual(files[0].spans, [Span(1, 2, files[0].spans[0].score)])
+
+    def test_without_a_lexical_index_every_query_is_embedded(self) -> None:
+        self.stores.lexical.drop("c1", repo="octo/project")
+
+        files = self.retriever.search_files(
+            ["load_config"], sha="c1", repo="octo/project"
+        )
+
+        self.assertEqual(
+            sorted(f.path for f in files), ["app.py", "config.py", "views.py"]
+        )
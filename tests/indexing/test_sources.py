@@ -0,0 +1,107 @@
+import io
+import tarfile
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from codr.indexing.sources import (
+    TARBALL_TIMEOUT,
+    GitHubBlobSource,
+    IngestionMode,
+    TarballSource,
+    get_source_provider,
+)
+from codr.storage.blob_store import git_blob_sha
+from tests.fakes import FakeGitHubRepository
+
+FILES = {
+    "setup.py": b"from setuptools import setup\n",
+    "pkg/app.py": b"def main():\n    pass\n",
+    "pkg/data.json": b"{}",
+    "pkg/latin1.py": "caf\xe9 = 1\n".encode("latin-1"),
+}
+
+
+def tarball(files: dict[str, bytes], prefix: str = "octo-project-c1") -> bytes:
+    """Packs `files` under one top level directory, as GitHub does."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        directory = tarfile.TarInfo(prefix)
+        directory.type = tarfile.DIRTYPE
+        tar.addfile(directory)
+        for path, content in files.items():
+            info = tarfile.TarInfo(f"{prefix}/{path}")
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+class TestTarballSource(TestCase):
+    def test_reads_the_accepted_files_without_the_top_level_directory(self) -> None:
+        source = TarballSource(io.BytesIO(tarball(FILES)))
+
+        files = {f.path: f.content for f in source.files()}
+
+        self.assertEqual(
+            files,
+            {
+                "setup.py": "from setuptools import setup\n",
+                "pkg/app.py": "def main():\n    pass\n",
+            },
+        )
+        self.assertEqual(source.progress.files, 3)
+
+    def test_reads_only_the_given_paths(self) -> None:
+        source = TarballSource(io.BytesIO(tarball(FILES)), paths={"pkg/app.py"})
+
+        self.assertEqual([f.path for f in source.files()], ["pkg/app.py"])
+
+    def test_closes_the_stream_when_stopped_early(self) -> None:
+        stream = io.BytesIO(tarball(FILES))
+        files = TarballSource(stream).files()
+
+        next(files)
+        files.close()
+
+        self.assertTrue(stream.closed)
+
+    @patch("codr.indexing.sources.requests.get")
+    def test_streams_the_archive_with_a_timeout(self, get: MagicMock) -> None:
+        get.return_value.raw = io.BytesIO(tarball(FILES))
+
+        source = TarballSource.from_repository(FakeGitHubRepository(), "c1")
+
+        get.assert_called_once_with(
+            "https://codeload.github.com/octo/project/tarball/c1",
+            stream=True,
+            timeout=TARBALL_TIMEOUT,
+        )
+        self.assertEqual(len(list(source.files())), 2)
+
+
+class TestGitHubBlobSource(TestCase):
+    def setUp(self) -> None:
+        self.repo = FakeGitHubRepository()
+        self.repo.commit(
+            "c1", {"a.py": "a = 1\n", "b.py": "b = 2\n", "README.md": "# Project\n"}
+        )
+
+    def test_fetches_every_blob_whatever_its_suffix(self) -> None:
+        blobs = {
+            path: git_blob_sha(content.encode("utf-8"))
+            for path, content in self.repo.commits["c1"].items()
+            if path != "b.py"
+        }
+
+        files = list(GitHubBlobSource(self.repo, blobs).files())
+
+        self.assertEqual(
+            {f.path: f.content for f in files},
+            {"a.py": "a = 1\n", "README.md": "# Project\n"},
+        )
+
+    def test_few_changed_blobs_are_fetched_one_by_one(self) -> None:
+        blobs = {"a.py": git_blob_sha(b"a = 1\n")}
+
+        source = get_source_provider(IngestionMode.TARBALL, self.repo, "c1", blobs)
+
+        self.assertIsInstance(source, GitHubBlobSource)
@@ -0,0 +1,136 @@
+from unittest import TestCase
+
+from codr.indexing.symbols import SymbolIndex, SymbolKind, extract_symbols
+
+MODELS = """from dataclasses import dataclass
+
+LIMIT = 10
+
+
+@dataclass
+class Repo:
+    name: str
+
+    def rename(self, name):
+        self.name = clean(name)
+
+
+def clean(name):
+    limit = LIMIT
+    return name.strip()[:limit]
+"""
+
+SERVICE = """from . import models
+from .models import Repo, clean
+from ..utils import helper
+
+
+def create(name):
+    return Repo(clean(name)).rename(helper(name))
+"""
+
+
+class TestExtractSymbols(TestCase):
+    def setUp(self) -> None:
+        self.models = extract_symbols("codr/models.py", MODELS)
+
+    def test_definitions_are_qualified_by_module_and_class(self) -> None:
+        self.assertEqual(
+            [(s.qualified_name, s.kind) for s in self.models.definitions],
+            [
+                ("codr.models", SymbolKind.MODULE),
+                ("codr.models.LIMIT", SymbolKind.ASSIGNMENT),
+                ("codr.models.Repo", SymbolKind.CLASS),
+                ("codr.models.Repo.name", SymbolKind.ASSIGNMENT),
+                ("codr.models.Repo.rename", SymbolKind.FUNCTION),
+                ("codr.models.clean", SymbolKind.FUNCTION),
+            ],
+        )
+
+    def test_definitions_span_their_decorators(self) -> None:
+        (repo,) = [s for s in self.models.definitions if s.name == "Repo"]
+
+        self.assertEqual((repo.start_line, repo.end_line), (6, 11))
+
+    def test_calls_are_scoped_to_the_enclosing_definition(self) -> None:
+        (call,) = [r for r in self.models.references if r.name == "clean"]
+
+        self.assertTrue(call.is_call)
+        self.assertEqual((call.scope, call.line), ("codr.models.Repo.rename", 11))
+
+    def test_relative_imports_are_made_absolute(self) -> None:
+        service = extract_symbols("codr/api/service.py", SERVICE)
+
+        self.assertEqual(
+            service.imports,
+            [
+                "codr.api",
+                "codr.api.models",
+                "codr.api.models",
+                "codr.api.models.Repo",
+                "codr.api.models.clean",
+                "codr.utils",
+                "codr.utils.helper",
+            ],
+        )
+
+    def test_relative_imports_of_a_package_start_from_it(self) -> None:
+        package = extract_symbols("codr/api/__init__.py", "from .service import a")
+
+        self.assertEqual(package.imports, ["codr.api.service", "codr.api.service.a"])
+
+    def test_files_that_do_not_parse_are_skipped(self) -> None:
+        self.assertIsNone(extract_symbols("broken.py", "def broken(:\n"))
+
+
+class TestSymbolIndex(TestCase):
+    def setUp(self) -> None:
+        self.index = SymbolIndex()
+        self.index.add_file("codr/models.py", MODELS)
+        self.index.add_file("codr/api/service.py", SERVICE)
+        self.index.add_file("codr/tasks.py", "class Task:\n    def rename(self): ...\n")
+
+    def names(self, name: str) -> list[str]:
+        return sorted(s.qualified_name for s in self.index.lookup(name))
+
+    def test_lookup_by_qualified_and_plain_name(self) -> None:
+        self.assertEqual(self.names("codr.models.clean"), ["codr.models.clean"])
+        self.assertEqual(
+            self.names("rename"), ["codr.models.Repo.rename", "codr.tasks.Task.rename"]
+        )
+        self.assertEqual(self.names("codr.models"), ["codr.models"])
+
+    def test_lookup_by_qualified_suffix(self) -> None:
+        self.assertEqual(self.names("Repo.rename"), ["codr.models.Repo.rename"])
+        self.assertEqual(self.names("models.Repo.rename"), ["codr.models.Repo.rename"])
+        self.assertEqual(self.names("Other.rename"), [])
+
+    def test_callers_match_by_name(self) -> None:
+        callers = self.index.callers("codr.models.clean")
+
+        self.assertEqual(
+            sorted((r.path, r.scope) for r in callers),
+            [
+                ("codr/api/service.py", "codr.api.service.create"),
+                ("codr/models.py", "codr.models.Repo.rename"),
+            ],
+        )
+
+    def test_a_round_trip_keeps_the_lookups(self) -> None:
+        loaded = SymbolIndex.from_dict(self.index.to_dict())
+
+        self.assertEqual(loaded.lookup("Repo.rename"), self.index.lookup("Repo.rename"))
+        self.assertEqual(loaded.callers("clean"), self.index.callers("clean"))
+
+    def test_carried_files_replace_the_lookups(self) -> None:
+        index = SymbolIndex()
+        index.add_file("codr/tasks.py", "def run(): ...\n")
+        self.assertEqual(len(index.lookup("rename")), 0)
+
+        index.carry_forward(self.index, sources={"codr/models.py", "missing.py"})
+
+        self.assertEqual(len(index), 2)
+        self.assertEqual(
+            [s.qualified_name for s in index.lookup("rename")],
+            ["codr.models.Repo.rename"],
+        )
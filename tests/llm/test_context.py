@@ -0,0 +1,59 @@
+from unittest import TestCase
+
+from codr.indexing.retrieval import Span
+from codr.llm.context import ContextPacker, PackedFile
+
+CONTENT = "\n".join(f"line {n}" for n in range(1, 41))
+
+
+def change(line_start: int, line_end: int) -> dict:
+    return {"file_path": "a.py", "line_start": line_start, "line_end": line_end}
+
+
+class TestPackedFile(TestCase):
+    def setUp(self) -> None:
+        packer = ContextPacker(budget=100, context_lines=2, estimate_tokens=len)
+        self.packed = packer.pack("a.py", CONTENT, spans=[Span(20, 21, 1.0)])
+
+    def test_snippet_lines_carry_their_file_line(self) -> None:
+        numbered = self.packed.numbered.splitlines()
+
+        self.assertIn("20 | line 20", numbered)
+        self.assertIn("... lines 1-17 elided ...", numbered)
+        self.assertEqual([line for line in numbered if "|" in line][0], "18 | line 18")
+
+    def test_shown_lines_map_onto_themselves(self) -> None:
+        for line in (n for n in self.packed.lines if n is not None):
+            self.assertEqual(self.packed.remap(change(line, line)), change(line, line))
+
+    def test_elided_lines_move_onto_the_snippet(self) -> None:
+        self.assertEqual(self.packed.remap(change(5, 30)), change(18, 23))
+
+    def test_whole_files_are_not_remapped(self) -> None:
+        whole = PackedFile.whole("a.py", CONTENT)
+
+        self.assertEqual(whole.numbered.splitlines()[0], " 1 | line 1")
+        for line_start, line_end in ((0, 0), (1, 40), (12, 41)):
+            self.assertEqual(
+                whole.remap(change(line_start, line_end)), change(line_start, line_end)
+            )
+
+
+class TestFormFeeds(TestCase):
+    CONTENT = "def a():\n    pass\n\x0c\ndef b():\n    pass\n"
+
+    def test_form_feeds_do_not_end_lines(self) -> None:
+        whole = PackedFile.whole("a.py", self.CONTENT)
+
+        self.assertEqual(whole.lines, [1, 2, 3, 4, 5])
+        self.assertIn("4 | def b():", whole.numbered.split("\n"))
+
+    def test_packed_spans_keep_their_file_lines(self) -> None:
+        packer = ContextPacker(budget=36, context_lines=0, estimate_tokens=len)
+
+        packed = packer.pack("a.py", self.CONTENT, spans=[Span(4, 5, 1.0)])
+
+        self.assertEqual(
+            packed.numbered.split("\n"),
+            ["... lines 1-3 elided ...", "4 | def b():", "5 |     pass"],
+        )
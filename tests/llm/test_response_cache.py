@@ -0,0 +1,106 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from langchain_core.prompt_values import StringPromptValue
+from langchain_core.pydantic_v1 import BaseModel
+from langchain_core.runnables import RunnableLambda
+
+from codr.application.exceptions import LlmCacheMissError
+from codr.llm.response_cache import LlmResponseCache, cached, prompt_key
+
+MODEL = {"model": "gpt-4o", "temperature": 0}
+
+
+class Answer(BaseModel):
+    text: str
+
+
+class TestCached(TestCase):
+    def setUp(self) -> None:
+        self.cache = LlmResponseCache(os.path.join(tempfile.mkdtemp(), "llm.sqlite"))
+        self.prompts: list[str] = []
+
+    def answer(self, prompt: StringPromptValue) -> Answer:
+        self.prompts.append(prompt.to_string())
+        return Answer(text=f"answer {len(self.prompts)}")
+
+    def invoke(self, prompt: str, **kwargs) -> Answer:
+        runnable = cached(
+            RunnableLambda(self.answer), self.cache, Answer, MODEL, {}, **kwargs
+        )
+        return runnable.invoke(StringPromptValue(text=prompt))
+
+    def test_repeated_prompts_are_answered_from_the_cache(self) -> None:
+        first = self.invoke("fix the bug")
+
+        self.assertEqual(self.invoke("fix the bug"), first)
+        self.assertEqual(self.invoke("add a test").text, "answer 2")
+        self.assertEqual(self.prompts, ["fix the bug", "add a test"])
+        self.assertEqual((self.cache.stats.hits, self.cache.stats.misses), (1, 2))
+
+    def test_bypass_calls_the_model_and_refreshes_the_entry(self) -> None:
+        self.invoke("fix the bug")
+
+        fresh = self.invoke("fix the bug", bypass=True)
+
+        self.assertEqual(fresh.text, "answer 2")
+        self.assertEqual(self.invoke("fix the bug"), fresh)
+
+    @patch("codr.llm.response_cache.REPLAY", True)
+    def test_replays_fail_on_a_miss(self) -> None:
+        with self.assertRaises(LlmCacheMissError):
+            self.invoke("fix the bug")
+
+        self.assertEqual(self.prompts, [])
+
+    def test_keys_depend_on_the_model_settings(self) -> None:
+        self.assertNotEqual(
+            prompt_key(MODEL, "fix the bug", {}),
+            prompt_key({**MODEL, "temperature": 1}, "fix the bug", {}),
+        )
+
+
+@patch("codr.llm.response_cache.time.time", return_value=0)
+class TestLlmResponseCache(TestCase):
+    def setUp(self) -> None:
+        self.cache = LlmResponseCache(
+            os.path.join(tempfile.mkdtemp(), "llm.sqlite"), max_bytes=30, ttl=100
+        )
+
+    def test_entries_expire_after_the_ttl(self, time) -> None:
+        self.cache.put("a", "response")
+        time.return_value = 101
+
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.size, 0)
+        self.assertEqual(self.cache.stats.evictions, 1)
+
+    def test_evicts_the_least_recently_used_entries(self, time) -> None:
+        for now, key in enumerate("abc"):
+            time.return_value = now
+            self.cache.put(key, "0123456789")
+        time.return_value = 3
+        self.cache.get("a")
+        time.return_value = 4
+
+        self.cache.put("d", "0123456789")
+
+        self.assertEqual(
+            [self.cache.get(key) is not None for key in "abcd"],
+            [True, False, False, True],
+        )
+        self.assertLessEqual(self.cache.size, 30)
+
+    def test_expired_entries_are_evicted_first(self, time) -> None:
+        self.cache.put("a", "0123456789")
+        time.return_value = 50
+        self.cache.put("b", "0123456789")
+        self.cache.get("a")
+        time.return_value = 120
+
+        self.cache.put("c", "012345678901234")
+
+        self.assertIsNone(self.cache.get("a"))
+        self.assertIsNotNone(self.cache.get("b"))
@@ -0,0 +1,89 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from codr.storage.ann import IvfFlatIndex, IvfParams, normalize, top_k
+
+
+def clustered(rows: int, dimensions: int = 32, clusters: int = 20, seed: int = 0):
+    """Unit vectors spread around random centers, as embeddings of similar code are."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions))
+    points = centers[rng.integers(clusters, size=rows)]
+    points += 0.3 * rng.standard_normal((rows, dimensions))
+    return normalize(points).astype(np.float32)
+
+
+def near(vectors: np.ndarray, rows: int, seed: int = 1) -> np.ndarray:
+    """Queries close to some of `vectors`, like a search for code that exists."""
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.choice(len(vectors), rows, replace=False)]
+    return normalize(picked + 0.1 * rng.standard_normal(picked.shape)).astype(
+        np.float32
+    )
+
+
+def recall(found: np.ndarray, expected: np.ndarray) -> float:
+    return np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found, expected)])
+
+
+class TestTopK(TestCase):
+    def test_returns_the_best_columns_first(self) -> None:
+        scores = np.array([[0.1, 0.9, 0.5, 0.7], [1.0, 0.0, 0.2, 0.3]])
+
+        self.assertEqual(top_k(scores, 2).tolist(), [[1, 3], [0, 3]])
+        self.assertEqual(top_k(scores, 10).shape, (2, 4))
+        self.assertEqual(top_k(scores, 0).shape, (2, 0))
+
+
+class TestIvfFlatIndex(TestCase):
+    def setUp(self) -> None:
+        self.vectors = clustered(2000)
+        self.queries = near(self.vectors, 50)
+        self.exact = top_k(self.queries @ self.vectors.T, 10)
+        self.index = IvfFlatIndex(IvfParams(n_lists=16, n_probe=4))
+        self.index.train(self.vectors)
+        self.index.add(self.vectors)
+
+    def test_probing_a_few_lists_finds_most_neighbours(self) -> None:
+        _, ids = self.index.search(self.queries, 10)
+
+        self.assertGreaterEqual(recall(ids, self.exact), 0.9)
+
+    def test_probing_every_list_is_exact(self) -> None:
+        scores, ids = self.index.search(self.queries, 10, n_probe=16)
+
+        np.testing.assert_array_equal(ids, self.exact)
+        np.testing.assert_allclose(
+            scores,
+            np.take_along_axis(self.queries @ self.vectors.T, ids, axis=1),
+            rtol=1e-6,
+        )
+
+    def test_rows_are_padded_when_the_probed_lists_are_short(self) -> None:
+        index = IvfFlatIndex(IvfParams(n_lists=4, n_probe=1))
+        index.train(self.vectors)
+        index.add(self.vectors[:3], ids=np.array([7, 8, 9]))
+
+        scores, ids = index.search(self.queries[:1], 5, n_probe=4)
+
+        self.assertEqual(sorted(ids[0, :3]), [7, 8, 9])
+        self.assertEqual(ids[0, 3:].tolist(), [-1, -1])
+        self.assertTrue(np.isneginf(scores[0, 3:]).all())
+
+    def test_a_loaded_index_searches_the_same(self) -> None:
+        path = os.path.join(tempfile.mkdtemp(), "ivf.npz")
+        self.index.save(path)
+
+        loaded = IvfFlatIndex.load(path, self.index.params)
+
+        self.assertEqual(len(loaded), 2000)
+        np.testing.assert_array_equal(
+            loaded.search(self.queries, 10)[1], self.index.search(self.queries, 10)[1]
+        )
+
+    def test_must_be_trained_first(self) -> None:
+        with self.assertRaises(ValueError):
+            IvfFlatIndex().add(self.vectors)
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+from codr.storage.blob_store import BlobStore, git_blob_sha
+
+HOUR = 60 * 60
+
+
+class TestBlobStore(TestCase):
+    def setUp(self) -> None:
+        self.store = BlobStore(root=tempfile.mkdtemp(), manifest_cache_size=1)
+        self.app = self.store.put(b"def main():\n    pass\n")
+        self.readme = self.store.put(b"# Project\n")
+        self.store.put_manifest("c1", {"app.py": self.app, "README.md": self.readme})
+
+    def age(self, blob_sha: str, seconds: float) -> None:
+        then = time.time() - seconds
+        os.utime(self.store._blob_path(blob_sha), (then, then))
+
+    def test_blobs_are_keyed_by_their_git_sha(self) -> None:
+        self.assertEqual(self.app, git_blob_sha(b"def main():\n    pass\n"))
+        self.assertEqual(self.store.put(b"# Project\n"), self.readme)
+        self.assertEqual(self.store.read_file("c1", "README.md"), "# Project\n")
+        self.assertIsNone(self.store.read_file("c1", "missing.py"))
+        self.assertIsNone(self.store.read_file("c2", "README.md"))
+
+    def test_empty_blobs_can_be_read(self) -> None:
+        self.store.put_manifest("c2", {"__init__.py": self.store.put(b"")})
+
+        self.assertEqual(self.store.read_file("c2", "__init__.py"), "")
+
+    def test_only_recent_manifests_are_kept_in_memory(self) -> None:
+        self.store.put_manifest("c2", {"app.py": self.app})
+        os.remove(self.store._manifest_path("c1"))
+        os.remove(self.store._manifest_path("c2"))
+
+        self.assertIsNone(self.store.get_manifest("c1"))
+        self.assertEqual(self.store.get_manifest("c2"), {"app.py": self.app})
+
+    def test_collects_old_blobs_no_manifest_references(self) -> None:
+        self.store.put_manifest("c2", {"app.py": self.app})
+        self.store.drop_manifest("c1")
+        for blob_sha in (self.app, self.readme):
+            self.age(blob_sha, 2 * HOUR)
+
+        reclaimed = self.store.collect_garbage(grace_period=HOUR)
+
+        self.assertEqual(reclaimed, len(b"# Project\n"))
+        self.assertTrue(self.store.has(self.app))
+        self.assertFalse(self.store.has(self.readme))
+        self.assertIsNone(self.store.get_manifest("c1"))
+
+    def test_spares_blobs_younger_than_the_grace_period(self) -> None:
+        self.store.drop_manifest("c1")
+        self.age(self.app, 2 * HOUR)
+
+        self.store.collect_garbage(grace_period=HOUR)
+
+        self.assertFalse(self.store.has(self.app))
+        self.assertTrue(self.store.has(self.readme))
+
+    def test_storing_a_blob_again_restarts_its_grace_period(self) -> None:
+        self.store.drop_manifest("c1")
+        self.age(self.app, 2 * HOUR)
+
+        self.store.put(b"def main():\n    pass\n")
+        self.store.collect_garbage(grace_period=HOUR)
+
+        self.assertTrue(self.store.has(self.app))
@@ -0,0 +1,58 @@
+import glob
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from codr.storage.chunk_pool import ChunkPool
+
+
+def vectors(rows: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).random((rows, 4), dtype=np.float32)
+
+
+class TestChunkPool(TestCase):
+    def setUp(self) -> None:
+        self.pool = ChunkPool(tempfile.mkdtemp())
+        self.keys = [f"k{i}" for i in range(8)]
+        self.vectors = vectors(8)
+        self.pool.add(self.keys, self.vectors)
+        self.pool.reference(self.keys)
+
+    def bases(self) -> list[str]:
+        return glob.glob(os.path.join(self.pool.directory, "base-*.npy"))
+
+    def test_dropping_references_frees_nothing_still_referenced(self) -> None:
+        self.pool.reference(self.keys[:2])
+        self.pool.reference(self.keys[:2], -1)
+
+        self.assertEqual(self.pool.refcount("k0"), 1)
+        self.assertEqual(self.pool.collect_garbage(), 0)
+        np.testing.assert_array_equal(self.pool.gather(self.keys), self.vectors)
+
+    def test_collect_garbage_rewrites_bases_without_unreferenced_rows(self) -> None:
+        self.pool.gather(self.keys)
+        (base,) = self.bases()
+        self.pool.reference(self.keys[:6], -1)
+
+        reclaimed = self.pool.collect_garbage()
+
+        self.assertGreater(reclaimed, 0)
+        self.assertEqual(self.pool.refcount("k0"), 0)
+        self.assertNotIn(base, self.bases())
+        self.assertEqual(self.pool.missing(self.keys), self.keys[:6])
+        np.testing.assert_array_equal(
+            self.pool.gather(["k7", "k6"]), self.vectors[[7, 6]]
+        )
+
+    def test_rows_are_read_across_bases_in_order(self) -> None:
+        self.pool.gather(self.keys)
+        self.pool.add(["k8", "k9"], vectors(2, seed=1))
+
+        rows = self.pool.rows(["k9", "k0", "k8", "k3"])
+
+        self.assertEqual(rows.shape, (4, 4))
+        self.assertEqual(len(rows.bases), 2)
+        np.testing.assert_array_equal(rows[[1, 3]], self.vectors[[0, 3]])
+        np.testing.assert_array_equal(rows[:1], vectors(2, seed=1)[[1]])
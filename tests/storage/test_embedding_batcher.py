@@ -0,0 +1,126 @@
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+import httpx
+from openai import APIConnectionError, APIStatusError
+
+from codr.storage.embedding_batcher import EmbeddingBatcher
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+
+
+def status_error(status_code: int, headers: dict | None = None) -> APIStatusError:
+    response = httpx.Response(status_code, headers=headers, request=REQUEST)
+    return APIStatusError(f"status {status_code}", response=response, body=None)
+
+
+class FlakyEmbedding:
+    """Fails with `errors` in turn, then embeds every text as its length."""
+
+    def __init__(self, *errors: Exception) -> None:
+        self.errors = list(errors)
+        self.calls: list[list[str]] = []
+
+    def __call__(self, texts: list[str]) -> list[list[float]]:
+        self.calls.append(texts)
+        if self.errors:
+            raise self.errors.pop(0)
+        return [[float(len(text))] for text in texts]
+
+
+def batcher(embed: FlakyEmbedding, **kwargs) -> EmbeddingBatcher:
+    return EmbeddingBatcher(embed, estimate_tokens=len, backoff=0.5, **kwargs)
+
+
+@patch("codr.storage.embedding_batcher.time.sleep")
+class TestRetries(TestCase):
+    def test_retries_rate_limits_server_and_connection_errors(self, sleep) -> None:
+        embed = FlakyEmbedding(
+            status_error(429), status_error(503), APIConnectionError(request=REQUEST)
+        )
+        embedder = batcher(embed)
+
+        self.assertEqual(embedder(["ab", "c"]), [[2.0], [1.0]])
+        self.assertEqual(len(embed.calls), 4)
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.5, 1, 2])
+        self.assertEqual(embedder.throughput.retries, 3)
+
+    def test_honours_retry_after(self, sleep) -> None:
+        embed = FlakyEmbedding(status_error(429, {"retry-after": "7"}))
+
+        batcher(embed)(["a"])
+
+        sleep.assert_called_once_with(7.0)
+
+    def test_client_errors_are_not_retried(self, sleep) -> None:
+        embed = FlakyEmbedding(status_error(400))
+
+        with self.assertRaises(APIStatusError):
+            batcher(embed)(["a"])
+
+        self.assertEqual(len(embed.calls), 1)
+        sleep.assert_not_called()
+
+    def test_gives_up_after_max_retries(self, sleep) -> None:
+        embed = FlakyEmbedding(*(status_error(500) for _ in range(3)))
+
+        with self.assertRaises(APIStatusError):
+            batcher(embed, max_retries=2)(["a"])
+
+        self.assertEqual(len(embed.calls), 3)
+
+
+class TestPacking(TestCase):
+    def test_batches_are_bounded_by_size_and_tokens(self) -> None:
+        embedder = batcher(FlakyEmbedding(), max_batch_size=3, max_batch_tokens=10)
+
+        self.assertEqual(
+            embedder.batches([4, 4, 4, 1, 1, 1, 1, 12]),
+            [([0, 1], 8), ([2, 3, 4], 6), ([5, 6], 2), ([7], 12)],
+        )
+
+    def test_embeddings_keep_the_order_of_the_texts(self) -> None:
+        texts = ["a" * n for n in range(1, 20)]
+
+        embeddings = batcher(FlakyEmbedding(), max_batch_tokens=10)(texts)
+
+        self.assertEqual(embeddings, [[float(n)] for n in range(1, 20)])
+
+    def test_oversized_inputs_are_truncated(self) -> None:
+        embed = FlakyEmbedding()
+
+        embeddings = batcher(embed, max_input_tokens=8)(["a" * 20, "b"])
+
+        self.assertEqual(embeddings, [[8.0], [1.0]])
+        self.assertEqual(embed.calls, [["a" * 8, "b"]])
+
+    def test_concurrent_calls_share_one_pool(self) -> None:
+        running = 0
+        peak = 0
+        lock = threading.Lock()
+        release = threading.Event()
+
+        def embed(texts: list[str]) -> list[list[float]]:
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            release.wait(0.05)
+            with lock:
+                running -= 1
+            return [[0.0] for _ in texts]
+
+        embedder = EmbeddingBatcher(
+            embed, estimate_tokens=len, max_batch_size=1, max_workers=2
+        )
+        callers = [
+            threading.Thread(target=embedder, args=(["a", "b", "c"],)) for _ in range(4)
+        ]
+        for caller in callers:
+            caller.start()
+        for caller in callers:
+            caller.join()
+
+        self.assertEqual(peak, 2)
+        self.assertEqual(embedder.throughput.requests, 12)
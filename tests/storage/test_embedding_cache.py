@@ -0,0 +1,126 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+
+from codr.storage.embedding_cache import (
+    CachedEmbeddingFunction,
+    CacheStats,
+    EmbeddingCache,
+    TtlLruCache,
+)
+from tests.fakes import HashEmbeddingFunction
+
+# Bytes of one float32 vector of HashEmbeddingFunction's default size
+VECTOR_SIZE = 16 * 4
+
+
+class TestCachedEmbeddingFunction(TestCase):
+    def setUp(self) -> None:
+        self.path = os.path.join(tempfile.mkdtemp(), "cache.sqlite")
+        self.embed = HashEmbeddingFunction()
+        self.cached = CachedEmbeddingFunction(self.embed, EmbeddingCache(self.path))
+
+    def test_only_misses_are_embedded(self) -> None:
+        self.cached(["a", "b"])
+
+        embeddings = self.cached(["b", "c", "c"])
+
+        self.assertEqual(self.embed.calls, 2)
+        self.assertEqual(self.cached.cache.stats.hits, 1)
+        self.assertEqual(self.cached.cache.stats.misses, 4)
+        np.testing.assert_allclose(
+            embeddings, HashEmbeddingFunction()(["b", "c", "c"]), rtol=1e-6
+        )
+
+    def test_entries_outlive_the_process(self) -> None:
+        self.cached(["a", "b"])
+
+        cache = EmbeddingCache(self.path)
+
+        self.assertEqual(cache.size, 2 * VECTOR_SIZE)
+        self.assertIsNotNone(cache.get_many("hash-embedding", ["a"], 16)[0])
+
+    def test_entries_are_keyed_by_model_and_dimensions(self) -> None:
+        self.cached(["a"])
+        cache = self.cached.cache
+
+        self.assertEqual(cache.get_many("hash-embedding", ["a"], 8), [None])
+        self.assertEqual(cache.get_many("other-model", ["a"], 16), [None])
+
+
+@patch("codr.storage.embedding_cache.time.time")
+class TestEviction(TestCase):
+    def setUp(self) -> None:
+        path = os.path.join(tempfile.mkdtemp(), "cache.sqlite")
+        self.cache = EmbeddingCache(path, max_bytes=3 * VECTOR_SIZE)
+        self.embed = HashEmbeddingFunction()
+
+    def put(self, text: str) -> None:
+        self.cache.put_many("hash-embedding", [text], self.embed([text]), 16)
+
+    def cached(self, text: str) -> bool:
+        return self.cache.get_many("hash-embedding", [text], 16)[0] is not None
+
+    def test_evicts_the_least_recently_used_entries(self, time) -> None:
+        for now, text in enumerate("abc"):
+            time.return_value = now
+            self.put(text)
+        time.return_value = 3
+        self.cache.get_many("hash-embedding", ["a"], 16)
+        time.return_value = 4
+
+        self.put("d")
+
+        self.assertEqual(self.cache.stats.evictions, 2)
+        self.assertEqual(
+            [self.cached(text) for text in "abcd"], [True, False, False, True]
+        )
+
+    def test_stays_under_its_size_limit(self, time) -> None:
+        time.return_value = 0
+        for text in "abcdefgh":
+            self.put(text)
+
+            self.assertLessEqual(self.cache.size, self.cache.max_bytes)
+
+    def test_replacing_an_entry_does_not_grow_the_cache(self, time) -> None:
+        time.return_value = 0
+        self.put("a")
+        self.put("a")
+
+        self.assertEqual(self.cache.size, VECTOR_SIZE)
+
+
+class TestCacheStats(TestCase):
+    def test_hit_rate(self) -> None:
+        stats = CacheStats(hits=3, misses=1, evictions=2)
+
+        self.assertEqual(stats.hit_rate, 0.75)
+        self.assertEqual(str(stats), "3 hits, 1 misses (75.0% hit rate), 2 evictions")
+        self.assertEqual(CacheStats().hit_rate, 0.0)
+
+
+@patch("codr.storage.embedding_cache.time.monotonic", return_value=0)
+class TestTtlLruCache(TestCase):
+    def test_evicts_the_least_recently_used_entry(self, monotonic) -> None:
+        cache: TtlLruCache[int] = TtlLruCache(max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+
+        cache.put("c", 3)
+
+        self.assertEqual([cache.get(key) for key in "abc"], [1, None, 3])
+
+    def test_entries_expire(self, monotonic) -> None:
+        cache: TtlLruCache[int] = TtlLruCache(ttl=10)
+        cache.put("a", 1)
+
+        monotonic.return_value = 11
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats.evictions, 1)
@@ -0,0 +1,173 @@
+import tempfile
+from unittest import TestCase
+
+from codr.application.entities import Document
+from codr.indexing.graph import CodeGraph
+from codr.indexing.lexical import BM25Index
+from codr.indexing.overlay import Overlay
+from codr.indexing.symbols import SymbolIndex
+from codr.storage.graph_store import CodeGraphStore
+from codr.storage.lexical_store import LexicalIndexStore
+from codr.storage.overlay_store import OverlayStore
+from codr.storage.symbol_store import SymbolIndexStore
+
+
+def lexical_index(sha: str, source: str) -> BM25Index:
+    index = BM25Index()
+    index.add_documents(
+        [Document(id=source, content=f"def {sha}(): pass", source=source, sha=sha)]
+    )
+    return index
+
+
+class TestLexicalIndexStore(TestCase):
+    def setUp(self) -> None:
+        self.root = tempfile.mkdtemp()
+        self.overlays = OverlayStore(root=f"{self.root}/overlays")
+        self.store = LexicalIndexStore(
+            root=f"{self.root}/lexical", overlays=self.overlays, cache_size=2
+        )
+        for sha in ("c1", "c2", "c3"):
+            self.store.put(sha, lexical_index(sha, f"{sha}.py"))
+
+    def test_keeps_the_most_recently_used_indexes_loaded(self) -> None:
+        c3 = self.store.get("c3")
+        self.assertIs(self.store.get("c3"), c3)
+
+        c1 = self.store.get("c1")
+        self.store.get("c2")
+
+        self.assertEqual(c1.metadatas[0]["source"], "c1.py")
+        self.assertIsNot(self.store.get("c3"), c3)
+
+    def test_stores_do_not_share_their_cache(self) -> None:
+        other = LexicalIndexStore(root=f"{self.root}/lexical", cache_size=2)
+
+        self.assertIsNot(other.get("c3"), self.store.get("c3"))
+
+    def test_dropping_the_base_invalidates_merged_overlays(self) -> None:
+        self.store.put("branch", lexical_index("branch", "branch.py"))
+        self.overlays.put(Overlay(sha="branch", base_sha="c1", ref="feature"))
+        merged = self.store.get("branch")
+        self.assertEqual(len(merged.metadatas), 2)
+
+        self.store.drop("c1")
+
+        self.assertIsNone(self.store.get("branch"))
+
+    def test_forks_keep_their_own_index_of_a_sha(self) -> None:
+        self.store.put("c1", lexical_index("c1", "fork.py"), repo="fork/repo")
+
+        self.store.drop("c1")
+
+        self.assertIsNone(self.store.get("c1"))
+        (metadata,) = self.store.get("c1", repo="fork/repo").metadatas
+        self.assertEqual(metadata["source"], "fork.py")
+
+    def test_writer_streams_the_chunks_into_the_index(self) -> None:
+        expected = lexical_index("c1", "c1.py")
+        expected.add_documents(
+            [Document(id="a", content="def a(): pass", source="a.py", sha="c4")]
+        )
+
+        with self.store.writer("c4", repo="owner/repo") as writer:
+            writer.carry_forward(self.store.get("c1"), sources={"c1.py"})
+            writer.add_documents(
+                [Document(id="a", content="def a(): pass", source="a.py", sha="c4")]
+            )
+            self.assertIsNone(self.store.get("c4", repo="owner/repo"))
+            writer.commit()
+
+        index = self.store.get("c4", repo="owner/repo")
+        self.assertEqual(
+            [(m["source"], m["sha"]) for m in index.metadatas],
+            [("c1.py", "c4"), ("a.py", "c4")],
+        )
+        self.assertEqual(index.terms, expected.terms)
+
+    def test_writer_stores_nothing_unless_committed(self) -> None:
+        with self.store.writer("c4") as writer:
+            writer.add_documents(
+                [Document(id="a", content="def a(): pass", source="a.py", sha="c4")]
+            )
+
+        self.assertIsNone(self.store.get("c4"))
+
+
+class TestSymbolIndexStore(TestCase):
+    def test_keeps_at_most_cache_size_indexes_loaded(self) -> None:
+        store = SymbolIndexStore(root=tempfile.mkdtemp(), cache_size=1)
+        for sha in ("c1", "c2"):
+            index = SymbolIndex()
+            index.add_file(f"{sha}.py", f"def {sha}():\n    pass\n")
+            store.put(sha, index)
+        c2 = store.get("c2")
+
+        c1 = store.get("c1")
+
+        self.assertEqual(list(c1.files), ["c1.py"])
+        self.assertIsNot(store.get("c2"), c2)
+
+    def test_writer_commits_the_index_it_wrote(self) -> None:
+        store = SymbolIndexStore(root=tempfile.mkdtemp())
+        previous = SymbolIndex()
+        previous.add_file("a.py", "def a():\n    pass\n")
+
+        with store.writer("c2") as writer:
+            writer.carry_forward(previous, sources={"a.py", "gone.py"})
+            writer.add_file("b.py", "def b():\n    return a()\n")
+            written = writer.commit()
+
+        self.assertEqual(sorted(written.files), ["a.py", "b.py"])
+        self.assertIs(store.get("c2"), written)
+        self.assertEqual([r.path for r in written.callers("a")], ["b.py"])
+
+
+class TestCodeGraphStore(TestCase):
+    def test_keeps_at_most_cache_size_graphs_loaded(self) -> None:
+        store = CodeGraphStore(root=tempfile.mkdtemp(), cache_size=1)
+        graphs = {}
+        for sha in ("c1", "c2"):
+            index = SymbolIndex()
+            index.add_file("a.py", "import b\n")
+            index.add_file("b.py", "x = 1\n")
+            graphs[sha] = CodeGraph.build(index)
+            store.put(sha, graphs[sha])
+
+        self.assertIsNot(store.get("c1"), graphs["c1"])
+        self.assertEqual(store.get("c1").expand(["a.py"]), ["b.py"])
+        self.assertIsNot(store.get("c2"), graphs["c2"])
+
+    def test_drop_keeps_the_graph_of_other_repositories(self) -> None:
+        store = CodeGraphStore(root=tempfile.mkdtemp())
+        index = SymbolIndex()
+        index.add_file("a.py", "import b\n")
+        for repo in ("owner/repo", "fork/repo"):
+            store.put("c1", CodeGraph.build(index), repo=repo)
+
+        store.drop("c1", repo="owner/repo")
+
+        self.assertIsNone(store.get("c1", repo="owner/repo"))
+        self.assertEqual(store.get("c1", repo="fork/repo").paths, ["a.py"])
+
+
+class TestOverlayStore(TestCase):
+    def test_keeps_at_most_cache_size_overlays_loaded(self) -> None:
+        store = OverlayStore(root=tempfile.mkdtemp(), cache_size=1)
+        first = Overlay(sha="b1", base_sha="c1", ref="one", tombstones={"a.py"})
+        store.put(first)
+        store.put(Overlay(sha="b2", base_sha="c1", ref="two"))
+
+        loaded = store.get("b1")
+
+        self.assertIsNot(loaded, first)
+        self.assertEqual(loaded, first)
+        self.assertIs(store.get("b1"), loaded)
+
+    def test_drop_forgets_the_overlay(self) -> None:
+        store = OverlayStore(root=tempfile.mkdtemp())
+        store.put(Overlay(sha="b1", base_sha="c1", ref="one"))
+
+        store.drop("b1")
+
+        self.assertIsNone(store.get("b1"))
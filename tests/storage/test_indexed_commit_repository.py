@@ -0,0 +1,53 @@
+import tempfile
+from unittest import TestCase
+
+from sqlalchemy import event
+
+from codr.application.entities import IndexedCommit
+from tests.fakes import make_stores, memory_session
+
+
+class TestIndexedCommitRepository(TestCase):
+    def setUp(self) -> None:
+        self.session = memory_session()
+        self.commits = make_stores(tempfile.mkdtemp(), self.session).commits
+        self.manifest = {f"pkg/module_{i}.py": f"{i:040x}" for i in range(100)}
+        for sha in ("c1", "c2"):
+            self.commits.add(
+                IndexedCommit(
+                    id=sha,
+                    owner="octo",
+                    name="project",
+                    sha=sha,
+                    manifest=self.manifest,
+                )
+            )
+        self.session.expunge_all()
+
+    def test_listings_do_not_select_the_manifest(self) -> None:
+        statements = []
+        event.listen(
+            self.session.get_bind(),
+            "before_cursor_execute",
+            lambda *args: statements.append(args[2]),
+        )
+
+        latest = self.commits.get_latest(owner="octo", name="project")
+        listed = self.commits.list_all()
+
+        self.assertEqual(latest.sha, "c2")
+        self.assertTrue(all(commit.manifest is None for commit in [latest, *listed]))
+        self.assertFalse(any("manifest" in statement for statement in statements))
+
+    def test_get_manifest(self) -> None:
+        latest = self.commits.get_latest(owner="octo", name="project")
+
+        self.assertEqual(self.commits.get_manifest(latest.id), self.manifest)
+
+    def test_update_of_listed_commit_keeps_the_manifest(self) -> None:
+        latest = self.commits.get_latest(owner="octo", name="project")
+
+        self.commits.update(latest)
+        self.session.expunge_all()
+
+        self.assertEqual(self.commits.get_manifest(latest.id), self.manifest)
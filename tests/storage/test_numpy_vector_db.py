@@ -0,0 +1,127 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from codr.application.entities import Document
+from codr.storage.numpy_vector_db import NumpyVectorDb
+from tests.fakes import HashEmbeddingFunction
+
+
+def document(content: str, source: str, sha: str, repo: str | None) -> Document:
+    return Document(id=content, content=content, source=source, sha=sha, repo=repo)
+
+
+def sources(vector_db: NumpyVectorDb, sha: str) -> set[str]:
+    return {
+        metadata["source"]
+        for _, metadata in vector_db.query_scores(["code"], sha=sha)[0]
+    }
+
+
+class TestRepositoryScope(TestCase):
+    def setUp(self) -> None:
+        self.vector_db = NumpyVectorDb(tempfile.mkdtemp(), HashEmbeddingFunction())
+        self.vector_db.create(
+            [
+                document("def a(): pass", "a.py", "c1", "owner/repo"),
+                document("def b(): pass", "b.py", "c1", "fork/repo"),
+                document("def c(): pass", "c.py", "c1", None),
+            ]
+        )
+
+    def test_drop_keeps_the_chunks_of_other_repositories(self) -> None:
+        (dropped,) = self.vector_db.get_by_metadata("source", "a.py", sha="c1")["ids"]
+        (kept,) = self.vector_db.get_by_metadata("source", "b.py", sha="c1")["ids"]
+
+        self.vector_db.drop("c1", repo="owner/repo")
+
+        self.assertEqual(sources(self.vector_db, "c1"), {"b.py"})
+        pool = self.vector_db._pool("hash-embedding", 16)
+        self.assertEqual(pool.refcount(dropped), 0)
+        self.assertEqual(pool.refcount(kept), 1)
+
+    def test_drop_without_a_repository_drops_the_sha(self) -> None:
+        self.vector_db.drop("c1")
+
+        self.assertEqual(sources(self.vector_db, "c1"), set())
+        self.assertFalse(os.path.exists(os.path.join(self.vector_db.root, "c1")))
+
+    def test_carry_forward_copies_the_chunks_of_the_repository(self) -> None:
+        carried = self.vector_db.carry_forward(
+            "c1", "c2", sources={"a.py", "b.py", "c.py"}, repo="fork/repo"
+        )
+
+        self.assertEqual(carried, 2)
+        self.assertEqual(sources(self.vector_db, "c2"), {"b.py", "c.py"})
+
+
+class TestSearch(TestCase):
+    def setUp(self) -> None:
+        self.vector_db = NumpyVectorDb(
+            tempfile.mkdtemp(), HashEmbeddingFunction(), cache_size=2
+        )
+        for sha in ("c1", "c2", "c3"):
+            self.vector_db.create(
+                [
+                    document(f"def f{i}(): {sha}", f"{i}.py", sha, None)
+                    for i in range(10)
+                ]
+            )
+
+    def test_exact_search_reads_the_rows_a_block_at_a_time(self) -> None:
+        expected = self.vector_db.query_scores(["def f3"], sha="c1", n_results=4)
+
+        with patch("codr.storage.numpy_vector_db.ADD_BATCH_SIZE", 3):
+            results = self.vector_db.query_scores(["def f3"], sha="c1", n_results=4)
+
+        self.assertEqual(
+            [metadata["source"] for _, metadata in results[0]],
+            [metadata["source"] for _, metadata in expected[0]],
+        )
+
+    def test_loaded_shas_are_bounded(self) -> None:
+        loaded = [self.vector_db._load(sha) for sha in ("c1", "c2", "c3")]
+
+        self.assertIsNot(self.vector_db._load("c1"), loaded[0])
+        self.assertIs(self.vector_db._load("c3"), loaded[2])
+        self.assertEqual(len(loaded[0].embeddings.locations), 10)
+
+    def test_dropping_a_sha_frees_the_rows_only_it_referenced(self) -> None:
+        pool = self.vector_db._pool("hash-embedding", 16)
+        (key,) = self.vector_db.get_by_metadata("source", "0.py", sha="c3")["ids"]
+
+        self.vector_db.drop("c3")
+
+        self.assertEqual(pool.refcount(key), 0)
+        self.assertEqual(pool.missing([key]), [key])
+        self.assertEqual(len(self.vector_db.get("c1")), 10)
+
+
+class TestForks(TestCase):
+    def setUp(self) -> None:
+        self.vector_db = NumpyVectorDb(tempfile.mkdtemp(), HashEmbeddingFunction())
+        for repo in ("owner/repo", "fork/repo"):
+            self.vector_db.create(
+                [document(f"def f{i}(): pass", f"{i}.py", "c1", repo) for i in range(4)]
+            )
+
+    def test_a_query_of_one_fork_has_no_duplicates(self) -> None:
+        (results,) = self.vector_db.query_scores(["def f1"], sha="c1", repo="fork/repo")
+
+        self.assertEqual(len(results), 4)
+        self.assertEqual({metadata["repo"] for _, metadata in results}, {"fork/repo"})
+        self.assertEqual(
+            sorted(metadata["source"] for _, metadata in results),
+            ["0.py", "1.py", "2.py", "3.py"],
+        )
+
+    def test_reads_are_scoped_to_the_repository(self) -> None:
+        self.assertEqual(len(self.vector_db.get("c1", repo="owner/repo")), 4)
+        self.assertEqual(len(self.vector_db.get("c1")), 8)
+        (id_,) = self.vector_db.get_by_metadata(
+            "source", "1.py", sha="c1", repo="owner/repo"
+        )["ids"]
+        self.assertEqual(
+            self.vector_db.query("def f1", sha="c1", repo="x/y")["ids"], [[]]
+        )
@@ -0,0 +1,135 @@
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+
+from codr.application.entities import Document
+from codr.storage.ann import normalize, top_k
+from codr.storage.numpy_vector_db import NumpyVectorDb
+from codr.storage.quantization import (
+    BinaryQuantizer,
+    Int8Quantizer,
+    Quantization,
+    TruncatingQuantizer,
+    get_quantizer,
+)
+from tests.storage.test_ann import clustered, near, recall
+
+
+def leading(vectors: np.ndarray) -> np.ndarray:
+    """Weights the leading dimensions most, as Matryoshka trained models do."""
+    weights = np.linspace(2.0, 0.25, vectors.shape[1], dtype=np.float32)
+    return normalize(vectors * weights).astype(np.float32)
+
+
+class TableEmbeddingFunction:
+    """Embeds the texts of a table, to search known vectors through the vector db."""
+
+    model = "table-embedding"
+
+    def __init__(self, table: dict[str, np.ndarray]) -> None:
+        self.table = table
+        self.dimensions = len(next(iter(table.values())))
+
+    def __call__(self, input: list[str]) -> list[list[float]]:
+        return [self.table[text].tolist() for text in input]
+
+
+class TestQuantizers(TestCase):
+    def setUp(self) -> None:
+        self.vectors = leading(clustered(1500))
+        self.queries = near(self.vectors, 40)
+        self.exact_scores = self.queries @ self.vectors.T
+        self.exact = top_k(self.exact_scores, 10)
+
+    def test_int8_scores_are_close_to_the_exact_ones(self) -> None:
+        quantizer = Int8Quantizer()
+        codes = quantizer.encode(self.vectors)
+
+        scores = quantizer.score(codes, self.queries)
+
+        self.assertEqual(quantizer.nbytes(codes), 1500 * (32 + 4))
+        np.testing.assert_allclose(scores, self.exact_scores, atol=0.02)
+
+    def test_compact_codes_shortlist_the_nearest_neighbours(self) -> None:
+        # Signs alone are coarse, they need a longer shortlist
+        for quantizer, shortlist in (
+            (Int8Quantizer(), 40),
+            (BinaryQuantizer(), 100),
+            (TruncatingQuantizer(16), 40),
+            (TruncatingQuantizer(16, inner=Int8Quantizer()), 40),
+        ):
+            with self.subTest(quantizer.name):
+                scores = quantizer.score(quantizer.encode(self.vectors), self.queries)
+
+                self.assertGreaterEqual(
+                    recall(top_k(scores, shortlist), self.exact), 0.95
+                )
+
+    def test_scores_are_computed_a_block_at_a_time(self) -> None:
+        quantizer = BinaryQuantizer()
+        codes = quantizer.encode(self.vectors)
+
+        with patch("codr.storage.quantization.SCORE_BLOCK_SIZE", 7):
+            blocked = quantizer.score(codes, self.queries)
+
+        np.testing.assert_allclose(
+            blocked, quantizer.score(codes, self.queries), atol=1e-5
+        )
+
+    def test_no_quantization_has_no_quantizer(self) -> None:
+        self.assertIsNone(get_quantizer(Quantization.NONE))
+        self.assertEqual(get_quantizer(Quantization.INT8).name, "int8")
+
+    def test_coarse_dimensions_wrap_the_quantizer(self) -> None:
+        self.assertEqual(get_quantizer(Quantization.BINARY, 64).name, "binary-64")
+        self.assertEqual(get_quantizer(Quantization.NONE, 64).name, "float32-64")
+
+
+class TestRescoring(TestCase):
+    def setUp(self) -> None:
+        vectors = leading(clustered(300))
+        queries = near(vectors, 20)
+        self.documents = [f"def f{i}(): pass" for i in range(300)]
+        self.queries = [f"query {i}" for i in range(20)]
+        self.embedding_function = TableEmbeddingFunction(
+            dict(zip(self.documents + self.queries, np.concatenate([vectors, queries])))
+        )
+
+    def search(self, **kwargs) -> list[list[tuple[float, dict]]]:
+        vector_db = NumpyVectorDb(tempfile.mkdtemp(), self.embedding_function, **kwargs)
+        vector_db.create(
+            [
+                Document(id=str(i), content=content, source=f"{i}.py", sha="c1")
+                for i, content in enumerate(self.documents)
+            ]
+        )
+        return vector_db.query_scores(self.queries, sha="c1", n_results=5)
+
+    def test_rescored_results_match_the_exact_search(self) -> None:
+        exact = self.search()
+
+        for quantization, coarse_dimensions in (
+            (Quantization.INT8, None),
+            (Quantization.BINARY, None),
+            (Quantization.NONE, 16),
+        ):
+            with self.subTest(f"{quantization.name} {coarse_dimensions}"):
+                results = self.search(
+                    quantization=quantization,
+                    coarse_dimensions=coarse_dimensions,
+                    rescore_factor=8,
+                )
+
+                for found, expected in zip(results, exact):
+                    self.assertEqual(
+                        [metadata["source"] for _, metadata in found],
+                        [metadata["source"] for _, metadata in expected],
+                    )
+                    # Shortlisted rows are scored with their float vectors
+                    np.testing.assert_allclose(
+                        [score for score, _ in found],
+                        [score for score, _ in expected],
+                        rtol=1e-5,
+                    )
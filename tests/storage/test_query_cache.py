@@ -0,0 +1,68 @@
+import tempfile
+from unittest import TestCase
+
+from codr.application.entities import Document
+from codr.indexing.overlay import Overlay
+from tests.fakes import make_stores, memory_session
+
+
+def document(content: str, source: str, sha: str) -> Document:
+    return Document(id=content, content=content, source=source, sha=sha)
+
+
+def sources(hits: list[tuple[float, dict]]) -> set[str]:
+    return {metadata["source"] for _, metadata in hits}
+
+
+class TestCachedVectorDb(TestCase):
+    def setUp(self) -> None:
+        self.stores = make_stores(tempfile.mkdtemp(), memory_session())
+        self.vector_db = self.stores.vector_db
+        self.vector_db.create([document("def a(): pass", "a.py", "c1")])
+
+    def search(self, sha: str) -> set[str]:
+        return sources(self.vector_db.query_scores(["function"], sha=sha)[0])
+
+    def test_create_invalidates_results_cached_while_indexing(self) -> None:
+        self.assertEqual(self.search("c1"), {"a.py"})
+
+        self.vector_db.create([document("def b(): pass", "b.py", "c1")])
+
+        self.assertEqual(self.search("c1"), {"a.py", "b.py"})
+
+    def test_carry_forward_invalidates_the_target_sha(self) -> None:
+        self.assertEqual(self.search("c2"), set())
+
+        self.vector_db.carry_forward("c1", "c2", sources={"a.py"})
+
+        self.assertEqual(self.search("c2"), {"a.py"})
+
+    def test_results_searched_during_a_write_are_not_kept(self) -> None:
+        inner = self.vector_db.vector_db
+        search = inner.query_scores
+
+        def search_while_writing(*args, **kwargs):
+            results = search(*args, **kwargs)
+            self.vector_db.create([document("def c(): pass", "c.py", "c1")])
+            return results
+
+        inner.query_scores = search_while_writing
+        self.assertEqual(self.search("c1"), {"a.py"})
+        inner.query_scores = search
+
+        self.assertEqual(self.search("c1"), {"a.py", "c.py"})
+
+    def test_overlay_results_are_cached_apart_from_its_delta(self) -> None:
+        self.vector_db.create([document("def b(): pass", "b.py", "branch")])
+        self.assertEqual(self.search("branch"), {"b.py"})
+
+        self.stores.overlays.put(Overlay(sha="branch", base_sha="c1", ref="feature"))
+
+        self.assertEqual(self.search("branch"), {"a.py", "b.py"})
+
+    def test_drop_invalidates_the_sha(self) -> None:
+        self.assertEqual(self.search("c1"), {"a.py"})
+
+        self.vector_db.drop("c1")
+
+        self.assertEqual(self.search("c1"), set())
@@ -0,0 +1,104 @@
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from codr.application.entities import Repo
+from tests.fakes import (
+    FakeGitHubRepository,
+    make_codebase_service,
+    make_stores,
+    memory_session,
+)
+
+FILES = {
+    "app/models.py": "class User:\n    def __init__(self, name):\n        self.name = name\n",
+    "app/views.py": "from app.models import User\n\n\ndef show(name):\n    return User(name)\n",
+}
+
+
+class TestCreateIndex(TestCase):
+    def setUp(self) -> None:
+        self.root = tempfile.mkdtemp()
+        self.stores = make_stores(self.root, memory_session())
+        self.service = make_codebase_service(self.stores)
+        self.repo = FakeGitHubRepository()
+        self.repo.commit("c1", FILES)
+        self.stores.repos.add(Repo(id="repo", owner="octo", name="project", sha="c1"))
+
+    def chunks(self, sha: str) -> dict[str, int]:
+        return {
+            path: len(
+                self.stores.vector_db.get_by_metadata(
+                    "source", path, sha, repo=self.repo.full_name
+                )["ids"]
+            )
+            for path in FILES
+        }
+
+    def test_retry_after_failure_stores_every_chunk_once(self) -> None:
+        with patch.object(self.stores.graphs, "put", side_effect=OSError("disk")):
+            with self.assertRaises(OSError):
+                self.service.create_index(self.repo)
+        partial = self.chunks("c1")
+        self.assertTrue(all(partial.values()))
+
+        self.service.create_index(self.repo)
+
+        self.assertEqual(self.chunks("c1"), partial)
+        repo = self.repo.full_name
+        self.assertEqual(
+            len(self.stores.lexical.get("c1", repo).metadatas), sum(partial.values())
+        )
+        self.assertEqual(len(self.service.find_symbol("User", "c1", repo)), 1)
+        self.assertIsNotNone(self.stores.graphs.get("c1", repo))
+
+    def test_retry_of_incremental_index_stores_every_chunk_once(self) -> None:
+        self.service.create_index(self.repo)
+        self.repo.commit(
+            "c2", {**FILES, "app/views.py": FILES["app/views.py"] + "\n# v2\n"}
+        )
+        self.stores.repos.add(
+            Repo(id="repo-c2", owner="octo", name="project", sha="c2")
+        )
+        with patch.object(self.stores.graphs, "put", side_effect=OSError("disk")):
+            with self.assertRaises(OSError):
+                self.service.create_index(self.repo)
+
+        self.service.create_index(self.repo)
+
+        self.assertEqual(self.chunks("c2"), self.chunks("c1"))
+        commits = self.stores.commits.list_all()
+        self.assertEqual(sorted(commit.sha for commit in commits), ["c1", "c2"])
+
+    def test_truncated_tree_indexes_every_file(self) -> None:
+        self.service.create_index(self.repo)
+        self.repo.commit(
+            "c2", {**FILES, "app/views.py": FILES["app/views.py"] + "\n# v2\n"}
+        )
+        self.repo.truncated.add("c2")
+        self.stores.repos.add(
+            Repo(id="repo-c2", owner="octo", name="project", sha="c2")
+        )
+
+        self.service.create_index(self.repo)
+
+        self.assertEqual(self.chunks("c2"), self.chunks("c1"))
+        (commit,) = [c for c in self.stores.commits.list_all() if c.sha == "c2"]
+        self.assertEqual(
+            sorted(self.stores.commits.get_manifest(commit.id)), sorted(FILES)
+        )
+
+    def test_overlay_of_a_truncated_tree_hides_the_whole_base(self) -> None:
+        self.service.create_index(self.repo)
+        self.repo.commit(
+            "b1",
+            {**FILES, "app/views.py": FILES["app/views.py"] + "\n# b1\n"},
+            branch="feature",
+        )
+        self.repo.truncated.add("b1")
+
+        self.service.create_index(self.repo, ref="feature")
+
+        overlay = self.stores.overlays.get("b1", "octo/project")
+        self.assertEqual(overlay.tombstones, set(FILES))
+        self.assertEqual(self.chunks("b1"), self.chunks("c1"))